@@ -12,6 +12,7 @@ from SingleBuToKstarMuMuFitter.FitDBPlayer import FitDBPlayer
 
 import re
 import itertools
+from array import array
 
 import ROOT
 setStyle()
@@ -34,6 +35,8 @@ class EfficiencyFitter(FitterCore):
             'pdfX': "effi_cosl",
             'pdfY': "effi_cosK",
             'iterativeCycle': 0,
+            'basisIntegrals': True, # Precompute bin integrals of the xTerm bases, effi_sigA must be linear in x\d+.
+            'positivityGrid': 50, # Penalise negative efficiency on NxN points in the FCN, 0 to disable.
             'argAliasInDB': {}, # When writes result to DB.
             'argAliasFromDB': {}, # Overwrite argAliasInDB only when initFromDB, or set to None to skip this variable.
             'saveToDB': True,
@@ -43,6 +46,29 @@ class EfficiencyFitter(FitterCore):
         del cfg['createNLLOpt']
         return cfg
 
+    def inputs(self):
+        keys = FitterCore.inputs(self)
+        if keys is None:
+            return None
+        return keys + [self.cfg[k] for k in ['hdata', 'dataX', 'dataY', 'pdfX', 'pdfY']]
+
+    def externalDigest(self):
+        """Parameters are initialized from the db, which starts from the input db."""
+        return self.process.dbplayer.inputDigest()
+
+    def _exportState(self):
+        """Parameters after fitting, and the entries written to the db."""
+        return {'args': FitterCore._exportState(self), 'db': getattr(self, 'dbEntries', {})}
+
+    def _importState(self, state):
+        """Restore parameters and replay the db entries, which are skipped with _postFitSteps."""
+        if not state:
+            return
+        FitterCore._importState(self, state['args'])
+        self.dbEntries = state['db']
+        if self.dbEntries:
+            FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, self.dbEntries)
+
     def _bookMinimizer(self):
         """Pass complicate fitting control."""
         pass
@@ -94,9 +120,10 @@ class EfficiencyFitter(FitterCore):
         """Post-processing"""
         args = self.pdf.getParameters(self.data)
         self.ToggleConstVar(args, True)
+        self.dbEntries = {}
         if self.cfg['saveToDB']:
             print("UpdateToDB")
-            FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, args, self.cfg.get('argAliasInDB', {}))
+            self.dbEntries = FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, args, self.cfg.get('argAliasInDB', {}))
             print("UpdatedToDB")
 
     def _runFitSteps(self):
@@ -143,54 +170,64 @@ class EfficiencyFitter(FitterCore):
         h2_accXrec = self.process.sourcemanager.get(self.cfg.get('hdata'))
         h2_accXrec.SetXTitle(CosThetaL.GetTitle())
         h2_accXrec.SetYTitle(CosThetaK.GetTitle())
-        minuit = fitter.Init(nPar, h2_accXrec, f2_effi_sigA)
+        minimizer = fitter.Init(nPar, h2_accXrec, f2_effi_sigA)
+        if self.cfg.get('basisIntegrals', False):
+            fitter.SetLinearPars(nxPar)
+        fitter.SetPositivityGrid(self.cfg.get('positivityGrid', 0) or 0)
         h_effi_pull = ROOT.TH1F("h_effi_pull", "", 30, -3, 3)
         fitter.SetPull(h_effi_pull)
+        constIdxs = set()
+        def defineParameter(pIdx, arg, argErr):
+            if argErr == 0:
+                # Constant as in TMinuit, never released.
+                minimizer.SetFixedVariable(pIdx, arg.GetName(), arg.getVal())
+                constIdxs.add(pIdx)
+            else:
+                minimizer.SetLimitedVariable(pIdx, arg.GetName(), arg.getVal(), argErr, arg.getMin(), arg.getMax())
         for xIdx in range(nxPar):
             arg = xPar[xIdx]
-            # Must assign an non-zero error or it will be taken as a const in Minuit.
+            # Must assign an non-zero error or it will be taken as a const.
             argErr = 0.01 if arg.getError() == 0 else arg.getError()
-            minuit.DefineParameter(xIdx, arg.GetName(), arg.getVal(), argErr, arg.getMin(), arg.getMax())
+            defineParameter(xIdx, arg, argErr)
         for lIdx in range(nlPar):
             arg = lPar[lIdx]
             argErr = 0.01 if arg.getError() == 0 else arg.getError()
-            minuit.DefineParameter(lIdx+nxPar, arg.GetName(), arg.getVal(), argErr, arg.getMin(), arg.getMax())
+            defineParameter(lIdx+nxPar, arg, argErr)
         for kIdx in range(nkPar):
             arg = kPar[kIdx]
             argErr = 0.01 if arg.getError() == 0 else arg.getError()
-            minuit.DefineParameter(kIdx+nlPar+nxPar, arg.GetName(), arg.getVal(), argErr, arg.getMin(), arg.getMax())
-        minuit.DefineParameter(nPar-2, "effi_norm", effi_norm.getVal(), effi_norm.getError(), effi_norm.getMin(), effi_norm.getMax())
-        minuit.DefineParameter(nPar-1, "hasXTerm", hasXTerm.getVal(), hasXTerm.getError(), hasXTerm.getMin(), hasXTerm.getMax())
+            defineParameter(kIdx+nlPar+nxPar, arg, argErr)
+        defineParameter(nPar-2, effi_norm, effi_norm.getError())
+        defineParameter(nPar-1, hasXTerm, hasXTerm.getError())
+
+        def minimize(freeIdxs):
+            """Release freeIdxs and fix the others, then MIGRAD twice and MINOS."""
+            for pIdx in range(nPar):
+                if pIdx in constIdxs:
+                    continue
+                if pIdx in freeIdxs:
+                    minimizer.ReleaseVariable(pIdx)
+                else:
+                    minimizer.FixVariable(pIdx)
+            minimizer.Minimize()
+            minimizer.Minimize()
+            errLo, errHi = ROOT.Double(0), ROOT.Double(0)
+            for pIdx in freeIdxs:
+                if pIdx not in constIdxs:
+                    minimizer.GetMinosError(pIdx, errLo, errHi)
 
-        # Remark that the index inside MINUIT starts from 1.
-        # However, in TMinuit, it starts from 0.
-        for pIdx in range(nxPar+1):
-            minuit.Command("REL {0}".format(pIdx))
-        for pIdx in range(nxPar+1, nPar+1):
-            minuit.Command("FIX {0}".format(pIdx))
-        minuit.Command("MINI")
-        minuit.Command("MINI")
-        minuit.Command("MINOS")
+        minimize(range(nxPar))
         for cycle in range(self.cfg['iterativeCycle']):
-            for pIdx in range(nxPar+1):
-                minuit.Command("FIX {0}".format(pIdx))
-            for pIdx in range(nxPar+1, nPar+1):
-                minuit.Command("REL {0}".format(pIdx))
-            minuit.Command("MINI")
-            minuit.Command("MINI")
-            minuit.Command("MINOS")
-            for pIdx in range(nxPar+1):
-                minuit.Command("REL {0}".format(pIdx))
-            for pIdx in range(nxPar+1, nPar+1):
-                minuit.Command("FIX {0}".format(pIdx))
-            minuit.Command("MINI")
-            minuit.Command("MINI")
-            minuit.Command("MINOS")
+            minimize(range(nxPar, nPar))
+            minimize(range(nxPar))
+        parVals = array('d', [minimizer.X()[pIdx] for pIdx in range(nPar)])
+        parErrs = array('d', [minimizer.Errors()[pIdx] for pIdx in range(nPar)])
+        fitter.Chi2(parVals)  # Ratio and pulls at the minimum
+        # Exact check at the optimum, the penalty only sees the grid points.
+        if not self.isPosiDef(f2_effi_sigA):
+            self.logger.logWARNING("Efficiency map of {0} is not positive definite at the optimum.".format(self.name))
 
-        parVal = ROOT.Double(0)
-        parErr = ROOT.Double(0)
         for pIdx in range(nPar-1):
-            minuit.GetParameter(pIdx, parVal, parErr)
             if pIdx<nxPar:
                 arg = xPar[pIdx]
             elif pIdx < nlPar+nxPar:
@@ -199,8 +236,8 @@ class EfficiencyFitter(FitterCore):
                 arg = kPar[pIdx-nlPar-nxPar]
             else:
                 arg = effi_norm
-            arg.setVal(parVal)
-            arg.setError(parErr)
+            arg.setVal(parVals[pIdx])
+            arg.setError(parErrs[pIdx])
 
         # Plot comparison between fitting result to data
         if not self.cfg.get('noDraw', False):
@@ -297,9 +334,8 @@ class EfficiencyFitter(FitterCore):
 
             f2_effi_xTerm = ROOT.TF2("f2_effi_xTerm", effi_xTerm_formula, -1, 1, -1, 1)
             for xIdx in range(nxPar):
-                minuit.GetParameter(xIdx, parVal, parErr)
-                f2_effi_xTerm.SetParameter(xIdx, parVal)
-                f2_effi_xTerm.SetParError(xIdx, parErr)
+                f2_effi_xTerm.SetParameter(xIdx, parVals[xIdx])
+                f2_effi_xTerm.SetParError(xIdx, parErrs[xIdx])
             f2_effi_xTerm.GetMaximumXY(f2_max_x, f2_max_y)
             f2_effi_xTerm.GetMinimumXY(f2_min_x, f2_min_y)
             self.logger.logDEBUG("Efficiency xTerm formula: {0}".format(effi_xTerm_formula))
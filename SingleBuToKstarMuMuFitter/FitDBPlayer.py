@@ -12,6 +12,8 @@ import math
 
 import ROOT
 from v2Fitter.FlowControl.Service import Service
+from v2Fitter.FlowControl.SourceManager import FileManager
+from v2Fitter.FlowControl.PathCache import digestObj
 from v2Fitter.Fitter.FitterCore import FitterCore
 from SingleBuToKstarMuMuFitter.anaSetup import q2bins
 
@@ -34,6 +36,31 @@ class FitDBPlayer(Service):
         self.logger = None
         self.absInputDir = absInputDir
         self.odbfile = None
+        self.idbfile = None
+        self._inputDigest = None
+
+    @staticmethod
+    def lockDB(dbfile):
+        """Exclusive access to db file, in case of fitters running in parallel processes."""
+        return FileManager.lock(dbfile)
+
+    @staticmethod
+    def digestDB(dbfile):
+        """Digest of the db content, None if the file doesn't exist."""
+        if not os.path.exists(dbfile):
+            return None
+        with FitDBPlayer.lockDB(dbfile):
+            db = shelve.open(dbfile, 'r')
+            try:
+                return digestObj(dict(db))
+            finally:
+                db.close()
+
+    def inputDigest(self):
+        """Digest of the input db, which initializes the output db."""
+        if self._inputDigest is None and self.idbfile is not None:
+            self._inputDigest = FitDBPlayer.digestDB(self.idbfile)
+        return self._inputDigest
 
     @staticmethod
     def PrintDB(dbfile):
@@ -83,9 +110,15 @@ class FitDBPlayer(Service):
 
     @staticmethod
     def UpdateToDB(dbfile, args, aliasDict=None):
-        """Update fit result to a db file"""
+        """Update fit result to a db file, return the updated entries."""
         if aliasDict is None:
             aliasDict = {}
+        with FitDBPlayer.lockDB(dbfile):
+            return FitDBPlayer._UpdateToDBImp(dbfile, args, aliasDict)
+
+    @staticmethod
+    def _UpdateToDBImp(dbfile, args, aliasDict):
+        updated = {}
         try:
             db = shelve.open(dbfile, writeback=True)
             if isinstance(args, dict):
@@ -96,6 +129,7 @@ class FitDBPlayer(Service):
                     print("INFO\t: Update {0} as {1} to db.".format(key, aliasName))
                     print(val)
                 db.update(modified_args)
+                updated.update(modified_args)
             elif args.InheritsFrom("RooArgSet"):
                 def updateToDBImp(iArg):
                     argName = iArg.GetName()
@@ -114,12 +148,14 @@ class FitDBPlayer(Service):
                                 # In case of no getError for RooNLLVar and so on.
                                 pass
                         print(db[aliasName])
+                        updated[aliasName] = dict(db[aliasName])
                 FitterCore.ArgLooper(args, updateToDBImp)
             else:
                 raise ValueError("Input arguement of type {0} is not supported".format(type(args)))
         finally:
             db.close()
             print("Updated to Database `{0}`.".format(os.path.abspath(dbfile)))
+        return updated
 
     @staticmethod
     def initFromDB(dbfile, args, aliasDict=None):
@@ -128,7 +164,11 @@ class FitDBPlayer(Service):
             return
         if aliasDict is None:
             aliasDict = {}
+        with FitDBPlayer.lockDB(dbfile):
+            FitDBPlayer._initFromDBImp(dbfile, args, aliasDict)
 
+    @staticmethod
+    def _initFromDBImp(dbfile, args, aliasDict):
         try:
             db = shelve.open(dbfile)
             def initFromDBImp(iArg):
@@ -219,6 +259,8 @@ class FitDBPlayer(Service):
     def resetDB(self, forceReset=False):
         baseDBFile = "{0}/{1}_{2}.db".format(self.absInputDir, os.path.splitext(self.outputfilename)[0], q2bins[self.process.cfg['binKey']]['label'])
         self.odbfile = "{0}".format(os.path.basename(baseDBFile))
+        self.idbfile = baseDBFile
+        self._inputDigest = None
         if os.path.exists(baseDBFile):
             if not os.path.exists(self.odbfile) or forceReset:
                 shutil.copy(baseDBFile, self.odbfile)
@@ -34,6 +34,29 @@ class StdFitter(FitterCore):
         })
         return cfg
 
+    def externalDigest(self):
+        """Parameters are initialized from the db, which starts from the input db."""
+        return self.process.dbplayer.inputDigest()
+
+    def _exportState(self):
+        """Parameters after fitting, and the entries written to the db."""
+        return {'args': FitterCore._exportState(self), 'db': getattr(self, 'dbEntries', {})}
+
+    def _importState(self, state):
+        """Restore parameters and replay the db entries, which are skipped with _postFitSteps."""
+        if not state:
+            return
+        FitterCore._importState(self, state['args'])
+        self.dbEntries = state['db']
+        if self.dbEntries:
+            FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, self.dbEntries)
+
+    def _dropData(self):
+        """The NLL owned by ROOT.StdFitter is deleted as well."""
+        FitterCore._dropData(self)
+        if hasattr(self, 'fitter'):
+            self.fitter.Reset()
+
     def _bookMinimizer(self):
         """"""
         if not hasattr(self, 'fitter'):
@@ -45,7 +68,10 @@ class StdFitter(FitterCore):
         for opt in self.cfg.get("createNLLOpt", []):
             self.fitter.addNLLOpt(opt)
         if hasattr(self.data, "InheritsFrom") and hasattr(self.pdf, "InheritsFrom"):
-            self.fitter.Init(self.pdf, self.data)
+            if self.unbinnedData is not None:
+                self.fitter.InitBinnedNLL(self.pdf, self.data)
+            else:
+                self.fitter.Init(self.pdf, self.data)
             self._nll = self.fitter.GetNLL()
         else:
             self.logger.logERROR("Either {data} or {pdf} is not valid.".format(data=self.cfg['data'], pdf=self.cfg['pdf']))
@@ -97,6 +123,7 @@ class StdFitter(FitterCore):
         """Post-processing"""
         #  FitterCore.ArgLooper(self.args, lambda arg: arg.Print())
         self.ToggleConstVar(self.args, True)
+        self.dbEntries = {}
         if self.cfg['saveToDB']:
             def rejectRedundantArgs(iArg):
                 if any([re.match(pat, iArg.GetName()) for pat in self.cfg['argPattern']]):
@@ -104,8 +131,8 @@ class StdFitter(FitterCore):
                 else:
                     self.cfg['argAliasInDB'][iArg.GetName()] = None
             FitterCore.ArgLooper(self.args, rejectRedundantArgs)
-            FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, self.args, self.cfg['argAliasInDB'])
-            FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, self.fitResult)
+            self.dbEntries.update(FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, self.args, self.cfg['argAliasInDB']))
+            self.dbEntries.update(FitDBPlayer.UpdateToDB(self.process.dbplayer.odbfile, self.fitResult))
 
     def _runFitSteps(self):
         self.FitMigrad()
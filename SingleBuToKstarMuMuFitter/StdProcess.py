@@ -9,6 +9,7 @@ import os
 import ROOT
 ROOT.gROOT.SetBatch(True)
 # ROOT.ROOT.EnableImplicitMT(2)  # MT blocks RooDataSet creation when input tree is fat.
+# Use the scope in v2Fitter.FlowControl.ImplicitMT, e.g. Path.implicitMT() with cfg['nThreads'], around RDataFrame computations instead.
 
 import SingleBuToKstarMuMuFitter.anaSetup as anaSetup
 from v2Fitter.FlowControl.Process import Process
@@ -217,6 +218,7 @@ msgService.addStream(4,
 processCfg = {
     'isBatchJob': False,
     'binKey': 'summary',
+    'rooMsg': {},  # Forward RooFit messages to runtime.log, see v2Fitter.FlowControl.RooMsgBridge
 }
 
 dbplayer = FitDBPlayer(absInputDir=os.path.join(anaSetup.modulePath, "input", "selected"))
@@ -1,44 +1,195 @@
+#include <vector>
 #include "TH1.h"
 #include "TH2.h"
 #include "TF2.h"
-#include "TMinuit.h"
+#include "Math/Functor.h"
+#include "Math/Factory.h"
+#include "Math/Minimizer.h"
 
 #ifndef EFFICIENCYFITTER_H
 #define EFFICIENCYFITTER_H
 
-TH2 *h2_fcn = 0;
-TF2 *f2_fcn = 0;
-TH2 *h2_ratio = 0;
-TH2 *h2_pull = 0;
-TH1 *h_pull = 0;
-double chi2Val = 0;
+// Binned chi2 fit of a TF2 to a TH2, all states are owned by the instance and the FCN is bound through a functor.
+// Different instances could be run concurrently.
+class EfficiencyFitter{
+public:
+    EfficiencyFitter();
+    virtual ~EfficiencyFitter();
+    TH2* GetH2(){return h2_fcn;}
+    TF2* GetF2(){return f2_fcn;}
+    double GetChi2(){return chi2Val;}
+    int GetDoF(){return h2_fcn->GetNbinsX()*h2_fcn->GetNbinsY() - minimizer->NFree();}
+    TH1* GetPull(){return h_pull;}
+    TH1* GetPull2D(){return h2_pull;}
+    TH2* GetRatio(){return h2_ratio;}
+    ROOT::Math::Minimizer* Init(int, TH2*, TF2*);
+    void SetPull(TH1* h){h_pull = h;}
+    // Set the number of leading parameters in which f2 is linear, 0 to integrate f2 in every call.
+    void SetLinearPars(int n){nLinearPar = n; isBasisValid = false; basisCandidate.clear();}
+    // Penalise negative f2 on nGrid x nGrid points quadratically, nGrid <= 0 to disable.
+    // The penalty is weight*sum((f2/mean efficiency)^2) over negative points, 100 times number of bins if weight < 0.
+    void SetPositivityGrid(int nGrid, double weight=-1);
+    // The FCN, ratio and pull histograms are updated to the parameters of the last call.
+    double Chi2(const double *par);
+private:
+    double BinAverage(int i, int j);
+    void BuildBasisIntegrals(const double *par);
+
+    TH2 *h2_fcn = 0;
+    TF2 *f2_fcn = 0;
+    TH2 *h2_ratio = 0;
+    TH2 *h2_pull = 0;
+    TH1 *h_pull = 0;
+    double chi2Val = 0;
+    ROOT::Math::Minimizer *minimizer = 0;
+    ROOT::Math::Functor *functor = 0;
 
-void fcn_binnedChi2_2D(int &npar, double *gin, double &f, double *par, int iflag)
+    // f2_fcn is linear in its first nLinearPar parameters, i.e. f = phi_0 + sum_k par[k]*phi_k.
+    // Bin averages of phi_k are computed once and reused until any other parameter changes.
+    int nLinearPar = 0;
+    bool isBasisValid = false;
+    std::vector<double> basisIntegrals; // (nLinearPar+1) per bin, ordered as the loop in Chi2
+    std::vector<double> basisPars;      // Other parameters of basisIntegrals
+    std::vector<double> basisCandidate; // Other parameters of the last call
+    std::vector<double> gridBasis;      // (nLinearPar+1) per grid point
+
+    int nGrid = 0;
+    double positivityWeight = 0;
+    double effiScale = 1;
+    std::vector<double> gridX, gridY;
+};
+
+EfficiencyFitter::EfficiencyFitter(){}
+EfficiencyFitter::~EfficiencyFitter(){
+    delete minimizer;
+    delete functor;
+    delete h2_ratio;
+    delete h2_pull;
+    minimizer = 0;
+    functor = 0;
+    h2_ratio = 0;
+    h2_pull = 0;
+}
+
+ROOT::Math::Minimizer* EfficiencyFitter::Init(int nPar, TH2 *h2, TF2 *f2){
+    delete minimizer;
+    delete functor;
+    delete h2_ratio;
+    delete h2_pull;
+    h2_fcn = h2;
+    h2_ratio = (TH2*)h2_fcn->Clone();
+    h2_ratio->SetDirectory(0);
+    h2_pull = (TH2*)h2_fcn->Clone();
+    h2_pull->SetDirectory(0);
+    f2_fcn = f2;
+    nLinearPar = 0;
+    isBasisValid = false;
+    basisCandidate.clear();
+    effiScale = h2_fcn->GetSumOfWeights()/(h2_fcn->GetNbinsX()*h2_fcn->GetNbinsY());
+    if (effiScale <= 0) effiScale = 1;
+    SetPositivityGrid(50);
+    functor = new ROOT::Math::Functor(this, &EfficiencyFitter::Chi2, nPar);
+    minimizer = ROOT::Math::Factory::CreateMinimizer("Minuit2", "Migrad");
+    minimizer->SetErrorDef(1);
+    minimizer->SetFunction(*functor);
+    return minimizer;
+}
+
+void EfficiencyFitter::SetPositivityGrid(int n, double weight)
+{//{{{
+    nGrid = n;
+    positivityWeight = weight < 0 ? 100*h2_fcn->GetNbinsX()*h2_fcn->GetNbinsY() : weight;
+    gridX.clear();
+    gridY.clear();
+    for (int i = 0; i < nGrid; i++) {
+        for (int j = 0; j < nGrid; j++) {
+            double u = nGrid > 1 ? double(i)/(nGrid-1) : 0.5;
+            double v = nGrid > 1 ? double(j)/(nGrid-1) : 0.5;
+            gridX.push_back(f2_fcn->GetXmin() + u*(f2_fcn->GetXmax()-f2_fcn->GetXmin()));
+            gridY.push_back(f2_fcn->GetYmin() + v*(f2_fcn->GetYmax()-f2_fcn->GetYmin()));
+        }
+    }
+    isBasisValid = false;
+}//}}}
+
+double EfficiencyFitter::BinAverage(int i, int j)
 {//{{{
-    f=0;
+    double xi = h2_fcn->GetXaxis()->GetBinLowEdge(i);
+    double xf = h2_fcn->GetXaxis()->GetBinUpEdge(i);
+    double yi = h2_fcn->GetYaxis()->GetBinLowEdge(j);
+    double yf = h2_fcn->GetYaxis()->GetBinUpEdge(j);
+    return f2_fcn->Integral(xi,xf,yi,yf)/(xf-xi)/(yf-yi);
+}//}}}
+
+void EfficiencyFitter::BuildBasisIntegrals(const double *par)
+{//{{{
+    int nBins = h2_fcn->GetNbinsX()*h2_fcn->GetNbinsY();
+    std::vector<double> p(par, par + f2_fcn->GetNpar());
+    basisIntegrals.assign(nBins*(nLinearPar+1), 0.);
+    gridBasis.assign(gridX.size()*(nLinearPar+1), 0.);
+    for (int k = -1; k < nLinearPar; k++) {
+        for (int l = 0; l < nLinearPar; l++) p[l] = (l == k);
+        f2_fcn->SetParameters(&p[0]);
+        int b = 0;
+        for (int i = 1; i <= h2_fcn->GetNbinsX(); i++) {
+            for (int j = 1; j <= h2_fcn->GetNbinsY(); j++, b++) {
+                double *row = &basisIntegrals[b*(nLinearPar+1)];
+                row[k+1] = BinAverage(i, j) - (k < 0 ? 0. : row[0]);
+            }
+        }
+        for (size_t g = 0; g < gridX.size(); g++) {
+            double *row = &gridBasis[g*(nLinearPar+1)];
+            row[k+1] = f2_fcn->Eval(gridX[g], gridY[g]) - (k < 0 ? 0. : row[0]);
+        }
+    }
+    basisPars.assign(par + nLinearPar, par + f2_fcn->GetNpar());
+    isBasisValid = true;
+}//}}}
+
+double EfficiencyFitter::Chi2(const double *par)
+{//{{{
+    double f=0;
     h2_ratio->Reset("ICESM");
     h2_pull->Reset("ICESM");
     if (h_pull != 0){
         h_pull->Reset("ICESM");
     }
+
+    // Direct integration while the other parameters keep changing, e.g. fit to l/k terms.
+    bool useBasis = false;
+    if (nLinearPar > 0) {
+        std::vector<double> others(par + nLinearPar, par + f2_fcn->GetNpar());
+        if (isBasisValid && others == basisPars) {
+            useBasis = true;
+        } else if (others == basisCandidate) {
+            BuildBasisIntegrals(par);
+            useBasis = true;
+        } else {
+            basisCandidate = others;
+        }
+    }
+    f2_fcn->SetParameters(par);
+
+    int b = 0;
     for (int i = 1; i <= h2_fcn->GetNbinsX(); i++) {
-        for (int j = 1; j <= h2_fcn->GetNbinsY(); j++) {
+        for (int j = 1; j <= h2_fcn->GetNbinsY(); j++, b++) {
             int gBin = h2_fcn->GetBin(i,j);
             double measure  = h2_fcn->GetBinContent(gBin);
             double error    = h2_fcn->GetBinError(gBin);
-            for (int k = 0; k < f2_fcn->GetNpar(); k++){
-                f2_fcn->SetParameter(k,par[k]);
-            }
-            double xi = h2_fcn->GetXaxis()->GetBinLowEdge(i);
-            double xf = h2_fcn->GetXaxis()->GetBinUpEdge(i);
-            double yi = h2_fcn->GetYaxis()->GetBinLowEdge(j);
-            double yf = h2_fcn->GetYaxis()->GetBinUpEdge(j);
 
-            double bias = f2_fcn->Integral(xi,xf,yi,yf)/(xf-xi)/(yf-yi)-measure;
+            double average = 0;
+            if (useBasis) {
+                const double *row = &basisIntegrals[b*(nLinearPar+1)];
+                average = row[0];
+                for (int k = 0; k < nLinearPar; k++) average += par[k]*row[k+1];
+            } else {
+                average = BinAverage(i, j);
+            }
+            double bias = average-measure;
             double pull = bias / error;
 
             f += pow(pull, 2);
-            
+
             // h2_ratio->Fill((xi+xf)/2, (yi+yf)/2, 1 + bias/measure);
             h2_ratio->SetBinContent(i, j, 1 + bias/measure);
             h2_pull->SetBinContent(i, j, pull);
@@ -50,44 +201,20 @@ void fcn_binnedChi2_2D(int &npar, double *gin, double &f, double *par, int iflag
 
     chi2Val = f;
 
-    // Prevent from negative function
-    double f2_minX, f2_minY;
-    f2_fcn->GetMinimumXY(f2_minX, f2_minY);
-    if (f2_fcn->Eval(f2_minX, f2_minY) < 0){
-        f += 100*h2_fcn->GetNbinsX()*h2_fcn->GetNbinsY();
+    // Prevent from negative function, quadratic in the negative part to keep the FCN differentiable.
+    double penalty = 0;
+    for (size_t g = 0; g < gridX.size(); g++) {
+        double val = 0;
+        if (useBasis) {
+            const double *row = &gridBasis[g*(nLinearPar+1)];
+            val = row[0];
+            for (int k = 0; k < nLinearPar; k++) val += par[k]*row[k+1];
+        } else {
+            val = f2_fcn->Eval(gridX[g], gridY[g]);
+        }
+        if (val < 0) penalty += pow(val/effiScale, 2);
     }
-
+    f += positivityWeight*penalty;
+    return f;
 }//}}}
-
-class EfficiencyFitter{
-public:
-    EfficiencyFitter();
-    virtual ~EfficiencyFitter();
-    TH2* GetH2(){return h2_fcn;}
-    TF2* GetF2(){return f2_fcn;}
-    double GetChi2(){return chi2Val;}
-    int GetDoF(){return h2_fcn->GetNbinsX()*h2_fcn->GetNbinsY() - minuit->GetNumFreePars();}
-    TH1* GetPull(){return h_pull;}
-    TH1* GetPull2D(){return h2_pull;}
-    TH2* GetRatio(){return h2_ratio;}
-    TMinuit* Init(int, TH2*, TF2*);
-    void SetPull(TH1* h){h_pull = h;}
-private:
-    TMinuit *minuit = 0;
-};
-
-EfficiencyFitter::EfficiencyFitter(){}
-EfficiencyFitter::~EfficiencyFitter(){
-    delete minuit;
-    minuit = 0;
-}
-TMinuit* EfficiencyFitter::Init(int nPar, TH2 *h2, TF2 *f2){
-    h2_fcn = h2;
-    h2_ratio = (TH2*)h2_fcn->Clone();
-    h2_pull = (TH2*)h2_fcn->Clone();
-    f2_fcn = f2;
-    minuit = new TMinuit(nPar);
-    minuit->SetFCN(fcn_binnedChi2_2D);
-    return minuit;
-}
 #endif
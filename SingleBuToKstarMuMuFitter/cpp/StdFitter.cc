@@ -24,6 +24,7 @@ public:
     void addNLLOpt(RooCmdArg*);
     RooMinuit* Init(RooAbsPdf*, RooDataSet*);
     RooMinuit* Init(RooAbsReal*, RooDataHist*);
+    RooMinuit* InitBinnedNLL(RooAbsPdf*, RooDataHist*);
     RooFitResult* FitMigrad();
     void FitHesse();
     RooFitResult* FitMinos(RooArgSet&);
@@ -73,6 +74,12 @@ RooMinuit* StdFitter::Init(RooAbsReal* pdf, RooDataHist* data){
     return minuit;
 }
 
+RooMinuit* StdFitter::InitBinnedNLL(RooAbsPdf* pdf, RooDataHist* data){
+    nll = pdf->createNLL(*data, this->createNLLOpt);
+    minuit = new RooMinuit(*nll);
+    return minuit;
+}
+
 RooFitResult* StdFitter::FitMigrad(){
     int isMigradConverge{-1};
     RooFitResult *res = 0;
@@ -1,11 +1,61 @@
 #!/usr/bin/env python
 
 import os
+import glob
+import hashlib
 import ROOT
 
+from v2Fitter.FlowControl.SourceManager import FileManager
+from v2Fitter.Fitter import CutCompiler
+
 modulePath = os.path.abspath(os.path.dirname(__file__))
+buildPath = os.environ.get('V2FITTER_CPP_BUILDDIR', os.path.join(modulePath, "build"))
+
+def buildHash(cls):
+    """Digest of the source, local headers and ROOT version, stale libraries are never picked."""
+    h = hashlib.sha1(ROOT.gROOT.GetVersion().encode('utf-8'))
+    for fname in [os.path.join(modulePath, cls)] + sorted(glob.glob(os.path.join(modulePath, "*.h"))):
+        with open(fname, 'rb') as f:
+            h.update(os.path.basename(fname).encode('utf-8'))
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+def loadLibrary(cls):
+    """Load the cached ACLiC library of cls, compile it once if not available."""
+    libName = os.path.join(buildPath, "{0}_{1}".format(cls.replace('.', '_'), buildHash(cls)))
+    if not os.path.exists(libName + ".so"):
+        if not os.path.exists(buildPath):
+            try:
+                os.makedirs(buildPath)
+            except OSError:
+                pass  # Created by a concurrent job
+        with FileManager.lock(libName):
+            # Compiled by another job while waiting for the lock?
+            if not os.path.exists(libName + ".so"):
+                if not ROOT.gSystem.CompileMacro(os.path.join(modulePath, cls), "kO", libName, buildPath):
+                    raise RuntimeError("Failed to compile {0}".format(cls))
+                return
+    if ROOT.gSystem.Load(libName + ".so") < 0:
+        raise RuntimeError("Failed to load {0}.so".format(libName))
+
 for cls in ["EfficiencyFitter.cc", "StdFitter.cc", "RooBtosllModel.cxx"]:
-    if os.path.exists(modulePath + '/' + cls.replace('.', '_') + '.so'):
-        ROOT.gROOT.ProcessLineSync(".L {0}/{1}.so".format(modulePath, cls.replace('.', '_')))
-    else:
-        ROOT.gROOT.ProcessLineSync(".L {0}/{1}+".format(modulePath, cls))
+    loadLibrary(cls)
+
+_anaCuts = None
+def anaCuts():
+    """Compiled predicates of all cut strings in anaSetup in {expr: CompiledCut}, built into one library."""
+    global _anaCuts
+    if _anaCuts is None:
+        from SingleBuToKstarMuMuFitter import anaSetup
+        exprs = anaSetup.cuts + [anaSetup.cuts_noResVeto, anaSetup.cuts_antiSignal, anaSetup.cuts_antiResVeto]
+        exprs += [q2bin['cutString'] for q2bin in anaSetup.q2bins.values()]
+        exprs += [region['cutString'] for region in anaSetup.bMassRegions.values()]
+        _anaCuts = CutCompiler.compileCuts(exprs, buildPath)
+    return _anaCuts
+
+def compiledCut(expr):
+    """Compiled predicate of a cut string, which is expected to be defined in anaSetup."""
+    cuts = anaCuts()
+    if expr not in cuts:
+        cuts.update(CutCompiler.compileCuts([expr], buildPath))
+    return cuts[expr]
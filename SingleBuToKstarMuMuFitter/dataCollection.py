@@ -14,8 +14,10 @@ import SingleBuToKstarMuMuFitter.cpp
 
 from v2Fitter.Fitter.DataReader import DataReader
 from v2Fitter.Fitter.ObjProvider import ObjProvider
+from v2Fitter.Fitter import GenLevelReader
+from v2Fitter.FlowControl.SourceManager import FileManager
 from SingleBuToKstarMuMuFitter.varCollection import dataArgs, Bmass, CosThetaL, CosThetaK, Kshortmass, dataArgsGEN
-from SingleBuToKstarMuMuFitter.anaSetup import q2bins, bMassRegions, cuts, cuts_noResVeto, cuts_antiSignal, cuts_antiResVeto, cut_kshortWindow, modulePath
+from SingleBuToKstarMuMuFitter.anaSetup import q2bins, bMassRegions, cuts, cuts_noResVeto, cuts_antiSignal, cuts_antiResVeto, cut_kshortWindow, cut_resonanceRej, cut_antiRadiation, modulePath
 
 import ROOT
 from ROOT import TChain
@@ -30,6 +32,11 @@ CFG.update({
     'argset': dataArgs,
     'lumi': -1,  # Keep a record, useful for mixing simulations samples
     'ifriendIndex': ["Bmass", "Mumumass"],
+    'friendJoin': "auto",
+    'singlePass': True,  # Regions share most of the cuts
+    'preloadFormat': "npy",
+    'nIngestWorkers': 1,  # Overridden by process.cfg['nIngestWorkers'], e.g. seqCollection -i
+    'cutBuildPath': SingleBuToKstarMuMuFitter.cpp.buildPath,
 })
 
 # dataReader
@@ -46,8 +53,15 @@ def customizeOne(self, targetBMassRegion=None, extraCuts="1"):
 
     # With shallow copied CFG, have to bind cfg['dataset'] to a new object.
     self.cfg['dataset'] = []
+    targetKeys = [key for key in bMassRegions.keys() if any([re.match(pat, key) for pat in targetBMassRegion])]
+    isDerivedFromFull = 'Full' in targetKeys and len(targetKeys) > 1
     for key, val in bMassRegions.items():
-        if any([re.match(pat, key) for pat in targetBMassRegion]):
+        if key not in targetKeys:
+            continue
+        if isDerivedFromFull and key != 'Full':
+            # Every B mass region is a subset of Full
+            self.cfg['dataset'].append(("{0}.{1}".format(self.cfg['name'], key), val['cutString'], "{0}.Full".format(self.cfg['name'])))
+        else:
             self.cfg['dataset'].append(
                 (
                     "{0}.{1}".format(self.cfg['name'], key),
@@ -74,7 +88,16 @@ def customizeOne(self, targetBMassRegion=None, extraCuts="1"):
             )
         )
 
-    if "antiSignal" in targetBMassRegion:
+    # Fit_antiSignal and Fit_antiResVeto are subsets of Fit_noResVeto
+    if "antiSignal" in targetBMassRegion and "noResVeto" in targetBMassRegion:
+        self.cfg['dataset'].append(
+            (
+                "{0}.Fit_antiSignal".format(self.cfg['name']),
+                "!(({0}) && ({1}))".format(cut_resonanceRej, cut_antiRadiation),
+                "{0}.Fit_noResVeto".format(self.cfg['name']),
+            )
+        )
+    elif "antiSignal" in targetBMassRegion:
         self.cfg['dataset'].append(
             (
                 "{0}.Fit_antiSignal".format(self.cfg['name'], key),
@@ -87,7 +110,15 @@ def customizeOne(self, targetBMassRegion=None, extraCuts="1"):
             )
         )
 
-    if "antiResVeto" in targetBMassRegion:
+    if "antiResVeto" in targetBMassRegion and "noResVeto" in targetBMassRegion:
+        self.cfg['dataset'].append(
+            (
+                "{0}.Fit_antiResVeto".format(self.cfg['name']),
+                "!({0}) && !({1})".format(cut_resonanceRej, cut_antiRadiation),
+                "{0}.Fit_noResVeto".format(self.cfg['name']),
+            )
+        )
+    elif "antiResVeto" in targetBMassRegion:
         self.cfg['dataset'].append(
             (
                 "{0}.Fit_antiResVeto".format(self.cfg['name'], key),
@@ -185,113 +216,134 @@ accXEffThetaLBins = array('d', [-1, -0.7, -0.3, 0., 0.3, 0.7, 1.])
 accXEffThetaKBins = array('d', [-1, -0.7, 0., 0.4, 0.8, 1.])
 rAccXEffThetaLBins= ROOT.RooBinning(6, accXEffThetaLBins, "rAccXEffThetaLBins")
 rAccXEffThetaKBins= ROOT.RooBinning(5, accXEffThetaKBins, "rAccXEffThetaKBins")
+accXEffTargetBins = ['belowJpsi', 'betweenPeaks', 'abovePsi2s', 'summary', 'jpsi']
+
+# q2 bins are looked up by the interval of sqrt(genQ2), summary is the union of non-resonant bins as in its cutString.
+accXEffQ2Ranges = dict([(key, [q2bins[key]['q2range']]) for key in accXEffTargetBins])
+accXEffQ2Ranges['summary'] = [q2bins[key]['q2range'] for key in ['belowJpsi', 'betweenPeaks', 'abovePsi2s']]
+accXEffQ2Edges = sorted(set([math.sqrt(bd) for ranges in accXEffQ2Ranges.values() for q2range in ranges for bd in q2range]))
+
+cimp_AccXRecEffiProduct = """
+#include <cmath>
+#include "TH1.h"
+
+// Product of acceptance and reconstruction efficiency, relative errors are added in quadrature.
+// Bins with any empty input are set to 0 +- 1.
+void AccXRecEffiProduct(TH1 *out, const TH1 *accPassed, const TH1 *accTotal, const TH1 *recPassed, const TH1 *recTotal) {
+    for (int b = 0; b < out->GetNcells(); ++b) {
+        if (out->IsBinUnderflow(b) || out->IsBinOverflow(b)) continue;
+        double aP = accPassed->GetBinContent(b), aT = accTotal->GetBinContent(b);
+        double rP = recPassed->GetBinContent(b), rT = recTotal->GetBinContent(b);
+        if (aP <= 0 || aT <= 0 || rP <= 0 || rT <= 0) {
+            out->SetBinContent(b, 0);
+            out->SetBinError(b, 1);
+            continue;
+        }
+        double effi = aP / aT * rP / rT;
+        out->SetBinContent(b, effi);
+        out->SetBinError(b, effi * std::sqrt(1 / aT + 1 / aP + 1 / rT + 1 / rP));
+    }
+}
+"""
+
+def accXEffQ2Category(binKey):
+    """Category of GenLevelReader selecting the q2 bin."""
+    indices = [idx for idx in range(len(accXEffQ2Edges) - 1) if any([math.sqrt(lo) <= accXEffQ2Edges[idx] and accXEffQ2Edges[idx + 1] <= math.sqrt(hi) for lo, hi in accXEffQ2Ranges[binKey]])]
+    return ("sqrt(genQ2)", accXEffQ2Edges, indices)
+
+def accXEffSetup(label, binKey):
+    """Input files and selection of the acceptance ('acc') or the reconstruction efficiency ('rec')."""
+    if label == 'acc':
+        return {
+            'ifiles': ["/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/v3p5/unfilteredJPSI_genonly/*.root", ] if binKey in ['jpsi', 'psi2s'] else ["/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/v3p5/unfilteredSIG_genonly/*.root", ],
+            'cutString': "fabs(genMupEta)<2.3 && fabs(genMumEta)<2.3 && genMupPt>2.8 && genMumPt>2.8",
+        }
+    return {
+        'ifiles': {'jpsi': bkgJpsiMCReader.cfg['ifile'], 'psi2s': bkgPsi2sMCReader.cfg['ifile']}.get(binKey, sigMCReader.cfg['ifile']),
+        'cutString': "Bmass > 0.5 && ({0})".format(cuts_antiResVeto if binKey in ['jpsi', 'psi2s'] else cuts[-1]),
+    }
+
+def getAccXEffHists(label, binKeys, logger=None):
+    """Total and passed histograms of label for all binKeys in coarse and fine binning, in {name: hist}.
+    The binKeys are expected to share input files, which are read in a single pass with the result cached."""
+    setups = dict([(key, accXEffSetup(label, key)) for key in binKeys])
+    specs = []
+    for key in binKeys:
+        for name, cuts in ("total", []), ("passed", [setups[key]['cutString']]):
+            specs.append({
+                'hist': TH2D("h2_{0}_{1}_{2}".format(label, key, name), "", len(accXEffThetaLBins) - 1, accXEffThetaLBins, len(accXEffThetaKBins) - 1, accXEffThetaKBins),
+                'cuts': cuts, 'x': "genCosThetaL", 'y': "genCosThetaK", 'category': accXEffQ2Category(key),
+            })
+            specs.append({
+                'hist': TH2D("h2_{0}_fine_{1}_{2}".format(label, key, name), "", 20, -1, 1, 20, -1, 1),
+                'cuts': cuts, 'x': "genCosThetaL", 'y': "genCosThetaK", 'category': accXEffQ2Category(key),
+            })
+    return GenLevelReader.getHists(setups[binKeys[0]]['ifiles'], specs, modulePath + "/data", logger=logger)
+
 def buildAccXRecEffiHist(self):
     """Build efficiency histogram for later fitting/plotting"""
-    targetBins = ['belowJpsi', 'betweenPeaks', 'abovePsi2s', 'summary', 'jpsi']
-    if self.process.cfg['binKey'] not in targetBins:
+    if self.process.cfg['binKey'] not in accXEffTargetBins:
         return
 
-    fin = self.process.filemanager.open("buildAccXRecEffiHist", modulePath + "/data/accXrecEffHists_Run2012.root", "UPDATE")
+    # The file is shared by all q2 bins, which might be processed concurrently.
+    fname = modulePath + "/data/accXrecEffHists_Run2012.root"
+    with FileManager.lock(fname):
+        fin = ROOT.TFile(fname, "UPDATE")
+        try:
+            _buildAccXRecEffiHist(self, fin)
+        finally:
+            fin.Close()
 
+def _buildAccXRecEffiHist(self, fin):
     # Build acceptance, reco efficiency, and accXrec
     forceRebuild = False
 
     binKey = self.process.cfg['binKey']
     h2_accXrec = fin.Get("h2_accXrec_{0}".format(binKey))
     if h2_accXrec == None or forceRebuild:
-        h2_acc = fin.Get("h2_acc_{0}".format(binKey))
-        h2_rec = fin.Get("h2_rec_{0}".format(binKey))
+        # Every q2 bin sharing the inputs is built in the same pass.
+        targetKeys = [key for key in accXEffTargetBins if all([accXEffSetup(label, key)['ifiles'] == accXEffSetup(label, binKey)['ifiles'] for label in ['acc', 'rec']])]
+        if not hasattr(ROOT, 'AccXRecEffiProduct'):
+            ROOT.gInterpreter.Declare(cimp_AccXRecEffiProduct)
 
-        # Fill histograms
-        setupEfficiencyBuildProcedure = {}
-        setupEfficiencyBuildProcedure['acc'] = {
-            'ifiles': ["/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/v3p5/unfilteredJPSI_genonly/*.root", ] if binKey in ['jpsi', 'psi2s'] else ["/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/v3p5/unfilteredSIG_genonly/*.root", ],
-            'baseString': re.sub("Mumumass", "sqrt(genQ2)", q2bins[binKey]['cutString']),
-            'cutString': "fabs(genMupEta)<2.3 && fabs(genMumEta)<2.3 && genMupPt>2.8 && genMumPt>2.8",
-            'fillXY': "genCosThetaK:genCosThetaL",  # Y:X
-            'weight': None
-        }
-        setupEfficiencyBuildProcedure['rec'] = {
-            'ifiles': {'jpsi': bkgJpsiMCReader.cfg['ifile'], 'psi2s': bkgPsi2sMCReader.cfg['ifile']}.get(binKey, sigMCReader.cfg['ifile']),
-            'baseString': "{0}".format(setupEfficiencyBuildProcedure['acc']['baseString']),
-            'cutString': "Bmass > 0.5 && ({0})".format(cuts_antiResVeto if binKey in ['jpsi', 'psi2s'] else cuts[-1]),
-            'fillXY': "genCosThetaK:genCosThetaL",  # Y:X
-            'weight': None
-        }
-        for h2, label in (h2_acc, 'acc'), (h2_rec, 'rec'):
-            if h2 == None or forceRebuild:
-                treein = TChain("tree")
-                for f in setupEfficiencyBuildProcedure[label]['ifiles']:
-                    treein.Add(f)
-
-                if setupEfficiencyBuildProcedure[label]['weight'] is None:
-                    df_tot = ROOT.RDataFrame(treein).Define('weight', "1").Filter(setupEfficiencyBuildProcedure[label]['baseString'])
-                else:
-                    df_tot = ROOT.RDataFrame(treein).Define('weight', *setupEfficiencyBuildProcedure[label]['weight']).Filter(setupEfficiencyBuildProcedure[label]['baseString'])
-                df_acc = df_tot.Filter(setupEfficiencyBuildProcedure[label]['cutString'])
-
-                fillXY = setupEfficiencyBuildProcedure[label]['fillXY'].split(':')
-                h2_total_config = ("h2_{0}_{1}_total".format(label, binKey), "", len(accXEffThetaLBins) - 1, accXEffThetaLBins, len(accXEffThetaKBins) - 1, accXEffThetaKBins)
-                h2_passed_config  = ("h2_{0}_{1}_passed".format(label, binKey), "", len(accXEffThetaLBins) - 1, accXEffThetaLBins, len(accXEffThetaKBins) - 1, accXEffThetaKBins)
-                h2_fine_total_config = ("h2_{0}_fine_{1}_total".format(label, binKey), "", 20, -1, 1, 20, -1, 1)
-                h2_fine_passed_config = ("h2_{0}_fine_{1}_passed".format(label, binKey), "", 20, -1, 1, 20, -1, 1)
-
-                h2ptr_total = df_tot.Histo2D(h2_total_config, fillXY[1], fillXY[0], "weight")
-                h2ptr_passed = df_acc.Histo2D(h2_passed_config, fillXY[1], fillXY[0], "weight")
-                h2ptr_fine_total = df_tot.Histo2D(h2_fine_total_config, fillXY[1], fillXY[0], "weight")
-                h2ptr_fine_passed = df_acc.Histo2D(h2_fine_passed_config, fillXY[1], fillXY[0], "weight")
-
-                h2_total = h2ptr_total.GetValue()
-                h2_passed = h2ptr_passed.GetValue()
-                h2_fine_total = h2ptr_fine_total.GetValue()
-                h2_fine_passed = h2ptr_fine_passed.GetValue()
-
-                print("{0}/{1}".format(df_acc.Count().GetValue(), df_tot.Count().GetValue()))
-                h2_eff = TEfficiency(h2_passed, h2_total)
-                h2_eff_fine = TEfficiency(h2_fine_passed, h2_fine_total)
-
-                fin.cd()
-                for proj, var in [("ProjectionX", CosThetaL), ("ProjectionY", CosThetaK)]:
-                    proj_fine_total = getattr(h2_fine_total, proj)("{0}_{1}".format(h2_fine_total.GetName(), proj), 0, -1, "e")
-                    proj_fine_passed = getattr(h2_fine_passed, proj)("{0}_{1}".format(h2_fine_passed.GetName(), proj), 0, -1, "e")
-                    h_eff = TEfficiency(proj_fine_passed, proj_fine_total)
-                    h_eff.Write("h_{0}_fine_{1}_{2}".format(label, binKey, proj), ROOT.TObject.kOverwrite)
-
-                h2_eff.Write("h2_{0}_{1}".format(label, binKey), ROOT.TObject.kOverwrite)
-                h2_eff_fine.Write("h2_{0}_fine_{1}".format(label, binKey), ROOT.TObject.kOverwrite)
-
-                del df_acc, df_tot
+        hists = {}
+        for label in ['acc', 'rec']:
+            hists.update(getAccXEffHists(label, targetKeys, self.logger))
 
-        # Merge acc and rec to accXrec
         fin.cd()
-        for proj in ["ProjectionX", "ProjectionY"]:
-            h_acc_fine = fin.Get("h_acc_fine_{0}_{1}".format(binKey, proj))
-            h_rec_fine = fin.Get("h_rec_fine_{0}_{1}".format(binKey, proj))
-            h_accXrec_fine = h_acc_fine.GetPassedHistogram().Clone("h_accXrec_fine_{0}_{1}".format(binKey, proj))
-            h_accXrec_fine.Reset("ICESM")
-            for b in range(1, h_accXrec_fine.GetNbinsX() + 1):
-                h_accXrec_fine.SetBinContent(b, h_acc_fine.GetEfficiency(b) * h_rec_fine.GetEfficiency(b))
-                h_accXrec_fine.SetBinError(b, h_accXrec_fine.GetBinContent(b) * math.sqrt(1 / h_acc_fine.GetTotalHistogram().GetBinContent(b) + 1 / h_acc_fine.GetPassedHistogram().GetBinContent(b) + 1 / h_rec_fine.GetTotalHistogram().GetBinContent(b) + 1 / h_rec_fine.GetPassedHistogram().GetBinContent(b)))
-            h_accXrec_fine.Write("h_accXrec_{0}_{1}".format(binKey, proj), ROOT.TObject.kOverwrite)
-
-        h2_acc = fin.Get("h2_acc_{0}".format(binKey))
-        h2_rec = fin.Get("h2_rec_{0}".format(binKey))
-        h2_accXrec = h2_acc.GetPassedHistogram().Clone("h2_accXrec_{0}".format(binKey))
-        h2_accXrec.Reset("ICESM")
-        for iL, iK in itertools.product(range(1, len(accXEffThetaLBins)), range(1, len(accXEffThetaKBins))):
-            if h2_rec.GetTotalHistogram().GetBinContent(iL, iK) == 0 or h2_rec.GetPassedHistogram().GetBinContent(iL, iK) == 0:
-                h2_accXrec.SetBinContent(iL, iK, 0)
-                h2_accXrec.SetBinError(iL, iK, 1)
-            else:
-                iLK = h2_acc.GetGlobalBin(iL, iK)
-                h2_accXrec.SetBinContent(iL, iK, h2_acc.GetEfficiency(iLK) * h2_rec.GetEfficiency(iLK))
-                h2_accXrec.SetBinError(iL, iK, h2_accXrec.GetBinContent(iL, iK) * math.sqrt(1 / h2_acc.GetTotalHistogram().GetBinContent(iLK) + 1 / h2_acc.GetPassedHistogram().GetBinContent(iLK) + 1 / h2_rec.GetTotalHistogram().GetBinContent(iLK) + 1 / h2_rec.GetPassedHistogram().GetBinContent(iLK)))
-        h2_accXrec.SetXTitle("cos#theta_{l}")
-        h2_accXrec.SetYTitle("cos#theta_{K}")
-        h2_accXrec.SetZTitle("Overall efficiency")
-
-        h2_accXrec.Write("h2_accXrec_{0}".format(binKey), ROOT.TObject.kOverwrite)
-        self.logger.logINFO("Overall efficiency is built.")
+        for key, label in itertools.product(targetKeys, ['acc', 'rec']):
+            h2_total = hists["h2_{0}_{1}_total".format(label, key)]
+            h2_passed = hists["h2_{0}_{1}_passed".format(label, key)]
+            h2_fine_total = hists["h2_{0}_fine_{1}_total".format(label, key)]
+            h2_fine_passed = hists["h2_{0}_fine_{1}_passed".format(label, key)]
+            self.logger.logINFO("{0} of {1}: {2}/{3}".format(label, key, int(h2_passed.GetEntries()), int(h2_total.GetEntries())))
+
+            for proj in ["ProjectionX", "ProjectionY"]:
+                for h2 in h2_fine_total, h2_fine_passed:
+                    hists["{0}_{1}".format(h2.GetName(), proj)] = getattr(h2, proj)("{0}_{1}".format(h2.GetName(), proj), 0, -1, "e")
+                h_eff = TEfficiency(hists["{0}_{1}".format(h2_fine_passed.GetName(), proj)], hists["{0}_{1}".format(h2_fine_total.GetName(), proj)])
+                h_eff.Write("h_{0}_fine_{1}_{2}".format(label, key, proj), ROOT.TObject.kOverwrite)
+            TEfficiency(h2_passed, h2_total).Write("h2_{0}_{1}".format(label, key), ROOT.TObject.kOverwrite)
+            TEfficiency(h2_fine_passed, h2_fine_total).Write("h2_{0}_fine_{1}".format(label, key), ROOT.TObject.kOverwrite)
+
+        # Merge acc and rec to accXrec
+        for key in targetKeys:
+            for proj in ["ProjectionX", "ProjectionY"]:
+                inputs = [hists["h2_{0}_fine_{1}_{2}_{3}".format(label, key, name, proj)] for label, name in itertools.product(['acc', 'rec'], ['passed', 'total'])]
+                h_accXrec_fine = inputs[0].Clone("h_accXrec_fine_{0}_{1}".format(key, proj))
+                ROOT.AccXRecEffiProduct(h_accXrec_fine, *inputs)
+                h_accXrec_fine.Write("h_accXrec_{0}_{1}".format(key, proj), ROOT.TObject.kOverwrite)
+
+            inputs = [hists["h2_{0}_{1}_{2}".format(label, key, name)] for label, name in itertools.product(['acc', 'rec'], ['passed', 'total'])]
+            h2_accXrec_key = inputs[0].Clone("h2_accXrec_{0}".format(key))
+            ROOT.AccXRecEffiProduct(h2_accXrec_key, *inputs)
+            h2_accXrec_key.SetXTitle("cos#theta_{l}")
+            h2_accXrec_key.SetYTitle("cos#theta_{K}")
+            h2_accXrec_key.SetZTitle("Overall efficiency")
+            h2_accXrec_key.Write("h2_accXrec_{0}".format(key), ROOT.TObject.kOverwrite)
+            if key == binKey:
+                h2_accXrec = h2_accXrec_key
+        self.logger.logINFO("Overall efficiency is built for {0}.".format(", ".join(targetKeys)))
 
     # Register the chosen one to sourcemanager
     #  h2_accXrec = fin.Get("h2_accXrec_{0}".format(self.process.cfg['binKey']))
@@ -299,12 +351,17 @@ def buildAccXRecEffiHist(self):
     self.cfg['source'][self.name + '.accXrec'] = RooDataHist("accXrec", "", RooArgList(CosThetaL, CosThetaK), ROOT.RooFit.Import(h2_accXrec))
     self.cfg['source'][self.name + '.h_accXrec_fine_ProjectionX'] = fin.Get("h_accXrec_{0}_ProjectionX".format(self.process.cfg['binKey']))
     self.cfg['source'][self.name + '.h_accXrec_fine_ProjectionY'] = fin.Get("h_accXrec_{0}_ProjectionY".format(self.process.cfg['binKey']))
+    for key in ['h2_accXrec', 'h_accXrec_fine_ProjectionX', 'h_accXrec_fine_ProjectionY']:
+        self.cfg['source']["{0}.{1}".format(self.name, key)].SetDirectory(0)  # Keep it after the file is closed.
 
 effiHistReader = ObjProvider({
     'name': "effiHistReader",
     'obj': {
         'effiHistReader.h2_accXrec': [buildAccXRecEffiHist, ],
-    }
+    },
+    'inputs': [],
+    'outputs': ["effiHistReader.*"],
+    'runInWorker': True,
 })
 
 if __name__ == '__main__':
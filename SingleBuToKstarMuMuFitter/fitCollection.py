@@ -31,6 +31,9 @@ setupEffiFitter.update({
     'pdfX': "effi_cosl",
     'pdfY': "effi_cosK",
     'argPattern': [r"^l\d+$", r"^k\d+$", r"x(\d{1,2})", "effi_norm", "hasXTerm"], # Not used in EfficiencyFitter, but useful if init is not needed in StdFitter.
+    'inputs': [],
+    'outputs': ["effi_*"],
+    'runInWorker': True,
 })
 effiFitter = EfficiencyFitter(setupEffiFitter)
 
@@ -55,7 +58,12 @@ setupSigMFitter.update({
     'data': "sigMCReader.Fit",
     'pdf': "f_sigM",
     'argPattern': ['sigMGauss[12]_sigma', 'sigMGauss_mean', 'sigM_frac'],
+    'observables': ['Bmass'],
+    'binning': {'Bmass': 600},
+    'binnedCheck': 20000,
     'argAliasInDB': {'sigMGauss1_sigma': 'sigMGauss1_sigma_RECO', 'sigMGauss2_sigma': 'sigMGauss2_sigma_RECO', 'sigMGauss_mean': 'sigMGauss_mean_RECO', 'sigM_frac': 'sigM_frac_RECO'},
+    'inputs': [],
+    'runInWorker': True,
 })
 sigMFitter = StdFitter(setupSigMFitter)
 
@@ -66,6 +74,9 @@ setupSigAFitter.update({
     'pdf': "f_sigA",
     'argPattern': ['unboundAfb', 'unboundFl'],
     'argAliasInDB': {'unboundAfb': 'unboundAfb_GEN', 'unboundFl': 'unboundFl_GEN'},
+    'binning': {'CosThetaK': 100, 'CosThetaL': 100},
+    'binnedCheck': 20000,
+    'inputs': [],
 })
 sigAFitter = StdFitter(setupSigAFitter)
 def sigAFitter_bookPdfData(self):
@@ -82,6 +93,8 @@ setupSig2DFitter.update({
     'pdf': "f_sig2D",
     'argPattern': ['unboundAfb', 'unboundFl'],
     'argAliasInDB': {'unboundAfb': 'unboundAfb_RECO', 'unboundFl': 'unboundFl_RECO'},
+    'inputs': ["effi_*"],
+    'outputs': ["f_sigA"],
 })
 sig2DFitter = StdFitter(setupSig2DFitter)
 
@@ -91,8 +104,11 @@ setupBkgCombAFitter.update({
     'data': "dataReader.SB",
     'pdf': "f_bkgCombA",
     'argPattern': [r'bkgComb[KL]_c[\d]+', ],
+    'observables': ['CosThetaK', 'CosThetaL'],
     'FitHesse': False,
     'FitMinos': [True, ()],
+    'inputs': [],
+    'runInWorker': True,
 })
 bkgCombAFitter = StdFitter(setupBkgCombAFitter)
 
@@ -102,8 +118,10 @@ setupBkgCombMFitter.update({
     'data': "dataReader.SB",
     'pdf': "f_bkgCombM",
     'argPattern': [r'bkgCombM_c[\d]+', ],
+    'observables': ['Bmass'],
     'FitHesse': False,
     'FitMinos': [False, ()],
+    'inputs': [],
 })
 bkgCombMFitter = StdFitter(setupBkgCombMFitter)
 
@@ -117,6 +135,8 @@ setupFinalFitter.update({
     'FitMinos': [True, ('nSig', 'unboundAfb', 'unboundFl', 'nBkgComb')],
     'argAliasFromDB': dict(setupSigMFitter['argAliasInDB'].items() + setupSigAFitter['argAliasInDB'].items()),
     'argAliasInDB': {'nSig': 'nSig', 'unboundAfb': 'unboundAfb', 'unboundFl': 'unboundFl', 'fs': 'fs', 'transAs': 'transAs', 'nBkgComb': 'nBkgComb', 'bkgCombM_c1': 'bkgCombM_c1'},
+    'inputs': ["effi_*", "f_sigM", "f_sigA", "f_bkgCombA"],
+    'rooMsg': {'maxPerTopic': 10},  # MINOS is noisy
 })
 finalFitter = StdFitter(setupFinalFitter)
 
@@ -410,6 +410,7 @@ def customizeWspaceReader(self):
 stdWspaceReader.customize = types.MethodType(customizeWspaceReader, stdWspaceReader)
 
 CFG_PDFBuilder = ObjProvider.templateConfig()
+CFG_PDFBuilder['bulkInputs'] = ["dataReader.*"]  # Sideband datasets for RooKeysPdf
 stdPDFBuilder = ObjProvider(copy(CFG_PDFBuilder))
 def customizePDFBuilder(self):
     """Customize pdf for q2 bins"""
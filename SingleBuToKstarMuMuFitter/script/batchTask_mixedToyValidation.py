@@ -20,7 +20,8 @@ import SingleBuToKstarMuMuFitter.dataCollection as dataCollection
 import SingleBuToKstarMuMuFitter.toyCollection as toyCollection
 import SingleBuToKstarMuMuFitter.pdfCollection as pdfCollection
 import SingleBuToKstarMuMuFitter.fitCollection as fitCollection
-import SingleBuToKstarMuMuFitter.plotCollection as plotCollection
+from v2Fitter.FlowControl.LazyModule import LazyModule
+plotCollection = LazyModule("SingleBuToKstarMuMuFitter.plotCollection")
 import v2Fitter.Fitter.AbsToyStudier as AbsToyStudier
 
 # Define
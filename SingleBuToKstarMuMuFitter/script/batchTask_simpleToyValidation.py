@@ -14,7 +14,8 @@ import SingleBuToKstarMuMuFitter.dataCollection as dataCollection
 import SingleBuToKstarMuMuFitter.toyCollection as toyCollection
 import SingleBuToKstarMuMuFitter.pdfCollection as pdfCollection
 import SingleBuToKstarMuMuFitter.fitCollection as fitCollection
-import SingleBuToKstarMuMuFitter.plotCollection as plotCollection
+from v2Fitter.FlowControl.LazyModule import LazyModule
+plotCollection = LazyModule("SingleBuToKstarMuMuFitter.plotCollection")
 
 # Define Process
 
@@ -4,6 +4,7 @@ import re
 import ROOT
 
 import SingleBuToKstarMuMuFitter.anaSetup as anaSetup
+from SingleBuToKstarMuMuFitter.cpp import compiledCut
 import SingleBuToKstarMuMuFitter.dataCollection as dataCollection
 import SingleBuToKstarMuMuFitter.varCollection as varCollection
 from SingleBuToKstarMuMuFitter.plotCollection import Plotter as Plotter
@@ -72,13 +73,13 @@ if __name__ == '__main__':
     for f in dataCollection.dataReaderCfg['ifile']:
         tree.Add(f)
     df = ROOT.RDataFrame(tree)\
-        .Filter(anaSetup.q2bins['summary']['cutString'])\
-        .Filter(anaSetup.bMassRegions['Fit']['cutString'])\
-        .Filter(anaSetup.cut_passTrigger)\
-        .Filter(anaSetup.cut_kshortWindow)\
-        .Filter(anaSetup.cut_kstarMassWindow)\
-        .Filter(anaSetup.cut_resonanceRej)\
-        .Filter(anaSetup.cut_antiRadiation)\
+        .Filter(compiledCut(anaSetup.q2bins['summary']['cutString']).rdfExpr())\
+        .Filter(compiledCut(anaSetup.bMassRegions['Fit']['cutString']).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_passTrigger).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_kshortWindow).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_kstarMassWindow).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_resonanceRej).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_antiRadiation).rdfExpr())\
         .Define("BdMass", "Define_BdMass(Pippt, Pipeta, Pipphi, Pimpt, Pimeta, Pimphi, Dimupt, Dimueta, Dimuphi, Mumumass)")\
         .Define("MuTrkMass", "Define_MuTrkMass(Bchg, Muppt, Mupeta, Mupphi, Mumpt, Mumeta, Mumphi, Trkpt, Trketa, Trkphi)")
     df_BdSR = df.Filter("BdMass > 5.20 && BdMass<5.36")
@@ -88,48 +89,48 @@ if __name__ == '__main__':
         'hist': df.Histo1D(("h_BdMass_bin0", "", 26, 4.76, 5.80), "BdMass"),
         'xTitle': varCollection.Bdmass.GetTitle()}
     hists['h_BdMass_bin1'] = {
-        'hist': df.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Histo1D(("h_BdMass_bin1", "", 26, 4.76, 5.80), "BdMass"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Histo1D(("h_BdMass_bin1", "", 26, 4.76, 5.80), "BdMass"),
         'xTitle': varCollection.Bdmass.GetTitle()}
     hists['h_BdMass_bin3'] = {
-        'hist': df.Filter(anaSetup.q2bins['betweenPeaks']['cutString']).Histo1D(("h_BdMass_bin3", "", 26, 4.76, 5.80), "BdMass"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['betweenPeaks']['cutString']).rdfExpr()).Histo1D(("h_BdMass_bin3", "", 26, 4.76, 5.80), "BdMass"),
         'xTitle': varCollection.Bdmass.GetTitle()}
     hists['h_BdMass_bin5'] = {
-        'hist': df.Filter(anaSetup.q2bins['abovePsi2s']['cutString']).Histo1D(("h_BdMass_bin5", "", 26, 4.76, 5.80), "BdMass"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['abovePsi2s']['cutString']).rdfExpr()).Histo1D(("h_BdMass_bin5", "", 26, 4.76, 5.80), "BdMass"),
         'xTitle': varCollection.Bdmass.GetTitle()}
     hists['h_Bmass_BdSR_bin0'] = {
         'hist': df_BdSR.Histo1D(("h_Bmass_BdSR_bin0", "", 4, 5.20, 5.36), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_Bmass_BdSR_bin1'] = {
-        'hist': df_BdSR.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Histo1D(("h_Bmass_BdSR_bin1", "", 4, 5.20, 5.36), "Bmass"),
+        'hist': df_BdSR.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Histo1D(("h_Bmass_BdSR_bin1", "", 4, 5.20, 5.36), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_Bmass_BdSR_bin3'] = {
-        'hist': df_BdSR.Filter(anaSetup.q2bins['betweenPeaks']['cutString']).Histo1D(("h_Bmass_BdSR_bin3", "", 4, 5.20, 5.36), "Bmass"),
+        'hist': df_BdSR.Filter(compiledCut(anaSetup.q2bins['betweenPeaks']['cutString']).rdfExpr()).Histo1D(("h_Bmass_BdSR_bin3", "", 4, 5.20, 5.36), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_Bmass_BdSR_bin5'] = {
-        'hist': df_BdSR.Filter(anaSetup.q2bins['abovePsi2s']['cutString']).Histo1D(("h_Bmass_BdSR_bin5", "", 4, 5.20, 5.36), "Bmass"),
+        'hist': df_BdSR.Filter(compiledCut(anaSetup.q2bins['abovePsi2s']['cutString']).rdfExpr()).Histo1D(("h_Bmass_BdSR_bin5", "", 4, 5.20, 5.36), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_CosThetaK_BdSR_bin1'] = {
-        'hist': df_BdSR.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Histo1D(("h_CosThetaK_BdSR_bin1", "", 16, -1, 1.), "CosThetaK"),
+        'hist': df_BdSR.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Histo1D(("h_CosThetaK_BdSR_bin1", "", 16, -1, 1.), "CosThetaK"),
         'yTitle': "Events",
         'xTitle': varCollection.CosThetaK.GetTitle()}
     hists['h_CosThetaK_BdMass510-520_bin1'] = {
-        'hist': df.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Filter("BdMass>5.10 && BdMass<5.20").Histo1D(("h_CosThetaK_BdMass512-522_bin1", "", 16, -1, 1.), "CosThetaK"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Filter("BdMass>5.10 && BdMass<5.20").Histo1D(("h_CosThetaK_BdMass512-522_bin1", "", 16, -1, 1.), "CosThetaK"),
         'yTitle': "Events",
         'xTitle': varCollection.CosThetaK.GetTitle()}
     hists['h_CosThetaK_BdMass520-536_bin1'] = {
-        'hist': df.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Filter("BdMass>5.20 && BdMass<5.36").Histo1D(("h_CosThetaK_BdMass522-534_bin1", "", 16, -1, 1.), "CosThetaK"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Filter("BdMass>5.20 && BdMass<5.36").Histo1D(("h_CosThetaK_BdMass522-534_bin1", "", 16, -1, 1.), "CosThetaK"),
         'yTitle': "Events",
         'xTitle': varCollection.CosThetaK.GetTitle()}
     hists['h_CosThetaK_BdMass536-560_bin1'] = {
-        'hist': df.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Filter("BdMass>5.36 && BdMass<5.60").Histo1D(("h_CosThetaK_BdMass534-560_bin1", "", 16, -1, 1.), "CosThetaK"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Filter("BdMass>5.36 && BdMass<5.60").Histo1D(("h_CosThetaK_BdMass534-560_bin1", "", 16, -1, 1.), "CosThetaK"),
         'yTitle': "Events",
         'xTitle': varCollection.CosThetaK.GetTitle()}
     hists['h_CosThetaK_USB_bin1'] = {
-        'hist': df.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Filter(anaSetup.bMassRegions['USB']['cutString']).Histo1D(("h_CosThetaK_USB_bin1", "", 16, -1, 1.), "CosThetaK"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Filter(compiledCut(anaSetup.bMassRegions['USB']['cutString']).rdfExpr()).Histo1D(("h_CosThetaK_USB_bin1", "", 16, -1, 1.), "CosThetaK"),
         'yTitle': "Events",
         'xTitle': varCollection.CosThetaK.GetTitle()}
     hists['h_CosThetaK_LSB_bin1'] = {
-        'hist': df.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Filter(anaSetup.bMassRegions['LSB']['cutString']).Histo1D(("h_CosThetaK_LSB_bin1", "", 16, -1, 1.), "CosThetaK"),
+        'hist': df.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Filter(compiledCut(anaSetup.bMassRegions['LSB']['cutString']).rdfExpr()).Histo1D(("h_CosThetaK_LSB_bin1", "", 16, -1, 1.), "CosThetaK"),
         'yTitle': "Events",
         'xTitle': varCollection.CosThetaK.GetTitle()}
 
@@ -6,6 +6,7 @@ import itertools
 
 import ROOT
 import SingleBuToKstarMuMuFitter.anaSetup as anaSetup
+from SingleBuToKstarMuMuFitter.cpp import compiledCut
 import SingleBuToKstarMuMuFitter.varCollection as varCollection
 import SingleBuToKstarMuMuFitter.plotCollection as plotCollection
 import SingleBuToKstarMuMuFitter.FitDBPlayer as FitDBPlayer
@@ -15,22 +16,22 @@ import SingleBuToKstarMuMuFitter.FitDBPlayer as FitDBPlayer
 wgtString = "1*(fabs(Bmass-5.28)<0.06) - 0.5*(fabs(Bmass-5.11)<0.06) - 0.5*(fabs(Bmass-5.46)<0.06)"  # +1/-1 for SR/sideband
 def create_histo_data(kwargs):
     iTreeFiles = kwargs.get('iTreeFiles', ["/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/ANv22/DATA/*.root"])
-    cutString = "({0}) && ({1})".format(anaSetup.cuts_antiResVeto, anaSetup.q2bins['jpsi']['cutString'])
 
     tree = ROOT.TChain("tree")
     for tr in iTreeFiles:
         tree.Add(tr)
+    df = ROOT.RDataFrame(tree)\
+        .Filter(compiledCut(anaSetup.cuts_antiResVeto).rdfExpr())\
+        .Filter(compiledCut(anaSetup.q2bins['jpsi']['cutString']).rdfExpr())\
+        .Filter("({0}) != 0".format(wgtString))  # Same as "(cut)&&(wgt)" in TTree::Draw
 
-    fout = ROOT.TFile("plotEffiClosure_data.root", "RECREATE")
     hists = []
-    hists.append(ROOT.TH1F("h_CosThetaL", "CosThetaL", 20, -1, 1))
-    hists.append(ROOT.TH1F("h_CosThetaK", "CosThetaK", 20, -1, 1))
+    hists.append(df.Histo1D(("h_CosThetaL", "CosThetaL", 20, -1, 1), "CosThetaL"))
+    hists.append(df.Histo1D(("h_CosThetaK", "CosThetaK", 20, -1, 1), "CosThetaK"))
 
+    fout = ROOT.TFile("plotEffiClosure_data.root", "RECREATE")
     for hist in hists:
-        varName = hist.GetTitle()
-        histName = hist.GetName()
-        tree.Draw("{var}>>{hist}".format(var=varName, hist=histName), "({cut})&&({wgt})".format(cut=cutString, wgt=wgtString), "goff")
-    fout.Write()
+        hist.GetValue().Write()
     fout.Close()
 
 def create_histo_expc(kwargs):
@@ -5,6 +5,7 @@ from __future__ import print_function
 import ROOT
 
 import SingleBuToKstarMuMuFitter.anaSetup as anaSetup
+from SingleBuToKstarMuMuFitter.cpp import compiledCut
 import SingleBuToKstarMuMuFitter.dataCollection as dataCollection
 import SingleBuToKstarMuMuFitter.varCollection as varCollection
 from SingleBuToKstarMuMuFitter.plotCollection import Plotter as Plotter
@@ -73,13 +74,13 @@ if __name__ == '__main__':
     for f in dataCollection.dataReaderCfg['ifile']:
         tree.Add(f)
     df = ROOT.RDataFrame(tree)\
-        .Filter(anaSetup.q2bins['summary']['cutString'])\
-        .Filter(anaSetup.bMassRegions['Fit']['cutString'])\
-        .Filter(anaSetup.cut_passTrigger)\
-        .Filter(anaSetup.cut_kshortWindow)\
-        .Filter(anaSetup.cut_kstarMassWindow)\
-        .Filter(anaSetup.cut_resonanceRej)\
-        .Filter(anaSetup.cut_antiRadiation)\
+        .Filter(compiledCut(anaSetup.q2bins['summary']['cutString']).rdfExpr())\
+        .Filter(compiledCut(anaSetup.bMassRegions['Fit']['cutString']).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_passTrigger).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_kshortWindow).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_kstarMassWindow).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_resonanceRej).rdfExpr())\
+        .Filter(compiledCut(anaSetup.cut_antiRadiation).rdfExpr())\
         .Alias("LambdaMass", "Lambdamass")\
         .Define("KshortMass", "Define_KshortMass(Pippt, Pipeta, Pipphi, Pimpt, Pimeta, Pimphi)")\
         .Define("KstarMass", "Define_KstarMass(Pippt, Pipeta, Pipphi, Pimpt, Pimeta, Pimphi, Trkpt, Trketa, Trkphi)")\
@@ -95,10 +96,10 @@ if __name__ == '__main__':
         'hist': df.Histo1D(("h_LambdaMass_bin0", "", 30, 1.0, 1.3), "LambdaMass"),
         'xTitle': varCollection.Lambdamass.GetTitle()}
     hists['h_LambdaMass_SR_bin0'] = {
-        'hist': df.Filter(anaSetup.bMassRegions['SR']['cutString']).Histo1D(("h_LambdaMass_SR_bin0", "", 30, 1.0, 1.3), "LambdaMass"),
+        'hist': df.Filter(compiledCut(anaSetup.bMassRegions['SR']['cutString']).rdfExpr()).Histo1D(("h_LambdaMass_SR_bin0", "", 30, 1.0, 1.3), "LambdaMass"),
         'xTitle': varCollection.Lambdamass.GetTitle()}
     hists['h_LambdaMass_SB_bin0'] = {
-        'hist': df.Filter(anaSetup.bMassRegions['SB']['cutString']).Histo1D(("h_LambdaMass_SB_bin0", "", 30, 1.0, 1.3), "LambdaMass"),
+        'hist': df.Filter(compiledCut(anaSetup.bMassRegions['SB']['cutString']).rdfExpr()).Histo1D(("h_LambdaMass_SB_bin0", "", 30, 1.0, 1.3), "LambdaMass"),
         'xTitle': varCollection.Lambdamass.GetTitle()}
     hists['h_LambdaBMass_LambdaSR_bin0'] = {
         'hist': df_LambdaSR.Histo1D(("h_LambdaBMass_LambdaSR_bin0", "", 26, 4.76, 5.80), "LambdaBMass"),
@@ -113,31 +114,31 @@ if __name__ == '__main__':
         'hist': df_vetoLambda1330.Histo1D(("h_KshortMass_VetoLambda1p3x_bin0", "", 30, 0.468, 0.528), "KshortMass"),
         'xTitle': varCollection.Kshortmass.GetTitle()}
     hists['h_KshortMass_SR_bin0'] = {
-        'hist': df.Filter(anaSetup.bMassRegions['SR']['cutString']).Histo1D(("h_KshortMass_SR_bin0", "", 30, 0.468, 0.528), "KshortMass"),
+        'hist': df.Filter(compiledCut(anaSetup.bMassRegions['SR']['cutString']).rdfExpr()).Histo1D(("h_KshortMass_SR_bin0", "", 30, 0.468, 0.528), "KshortMass"),
         'xTitle': varCollection.Kshortmass.GetTitle()}
     hists['h_KshortMass_SB_bin0'] = {
-        'hist': df.Filter(anaSetup.bMassRegions['SB']['cutString']).Histo1D(("h_KshortMass_SB_bin0", "", 30, 0.468, 0.528), "KshortMass"),
+        'hist': df.Filter(compiledCut(anaSetup.bMassRegions['SB']['cutString']).rdfExpr()).Histo1D(("h_KshortMass_SB_bin0", "", 30, 0.468, 0.528), "KshortMass"),
         'xTitle': varCollection.Kshortmass.GetTitle()}
     hists['h_KstarMass_bin0'] = {
         'hist': df.Histo1D(("h_KstarMass_bin0", "", 30, 0.742, 1.042), "KstarMass"),
         'xTitle': varCollection.Kstarmass.GetTitle()}
     hists['h_KstarMass_SR_bin0'] = {
-        'hist': df.Filter(anaSetup.bMassRegions['SR']['cutString']).Histo1D(("h_KstarMass_SR_bin0", "", 30, 0.742, 1.042), "KstarMass"),
+        'hist': df.Filter(compiledCut(anaSetup.bMassRegions['SR']['cutString']).rdfExpr()).Histo1D(("h_KstarMass_SR_bin0", "", 30, 0.742, 1.042), "KstarMass"),
         'xTitle': varCollection.Kstarmass.GetTitle()}
     hists['h_KstarMass_SB_bin0'] = {
-        'hist': df.Filter(anaSetup.bMassRegions['SB']['cutString']).Histo1D(("h_KstarMass_SB_bin0", "", 30, 0.742, 1.042), "KstarMass"),
+        'hist': df.Filter(compiledCut(anaSetup.bMassRegions['SB']['cutString']).rdfExpr()).Histo1D(("h_KstarMass_SB_bin0", "", 30, 0.742, 1.042), "KstarMass"),
         'xTitle': varCollection.Kstarmass.GetTitle()}
     hists['h_Bmass_LambdaSR_bin0'] = {
         'hist': df_LambdaSR.Histo1D(("h_Bmass_LambdaSR_bin0", "", 26, 4.76, 5.80), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_Bmass_LambdaSR_bin1'] = {
-        'hist': df_LambdaSR.Filter(anaSetup.q2bins['belowJpsi']['cutString']).Histo1D(("h_Bmass_LambdaSR_bin1", "", 26, 4.76, 5.80), "Bmass"),
+        'hist': df_LambdaSR.Filter(compiledCut(anaSetup.q2bins['belowJpsi']['cutString']).rdfExpr()).Histo1D(("h_Bmass_LambdaSR_bin1", "", 26, 4.76, 5.80), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_Bmass_LambdaSR_bin3'] = {
-        'hist': df_LambdaSR.Filter(anaSetup.q2bins['betweenPeaks']['cutString']).Histo1D(("h_Bmass_LambdaSR_bin3", "", 26, 4.76, 5.80), "Bmass"),
+        'hist': df_LambdaSR.Filter(compiledCut(anaSetup.q2bins['betweenPeaks']['cutString']).rdfExpr()).Histo1D(("h_Bmass_LambdaSR_bin3", "", 26, 4.76, 5.80), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_Bmass_LambdaSR_bin5'] = {
-        'hist': df_LambdaSR.Filter(anaSetup.q2bins['abovePsi2s']['cutString']).Histo1D(("h_Bmass_LambdaSR_bin5", "", 26, 4.76, 5.80), "Bmass"),
+        'hist': df_LambdaSR.Filter(compiledCut(anaSetup.q2bins['abovePsi2s']['cutString']).rdfExpr()).Histo1D(("h_Bmass_LambdaSR_bin5", "", 26, 4.76, 5.80), "Bmass"),
         'xTitle': varCollection.Bmass.GetTitle()}
     hists['h_MuTrkMass_bin0'] = {
         'hist': df.Histo1D(("h_MuTrkMass_bin0", "", 30, 3., 4.), "MuTrkMass"),
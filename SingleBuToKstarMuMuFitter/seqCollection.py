@@ -4,13 +4,27 @@
 
 import SingleBuToKstarMuMuFitter.cpp
 import SingleBuToKstarMuMuFitter.dataCollection as dataCollection
-import SingleBuToKstarMuMuFitter.toyCollection as toyCollection
 import SingleBuToKstarMuMuFitter.pdfCollection as pdfCollection
 import SingleBuToKstarMuMuFitter.fitCollection as fitCollection
 
+import os
+import sys
+import time
+import json
+import shelve
+import traceback
+import multiprocessing
+from copy import deepcopy
+from collections import OrderedDict
+from argparse import ArgumentParser
+
 import SingleBuToKstarMuMuFitter.anaSetup as anaSetup
+from v2Fitter.FlowControl.Process import Process
+from v2Fitter.FlowControl.LazyModule import LazyModule
+from SingleBuToKstarMuMuFitter.FitDBPlayer import FitDBPlayer
 from SingleBuToKstarMuMuFitter.StdProcess import p
-from argparse import ArgumentParser
+
+toyCollection = LazyModule("SingleBuToKstarMuMuFitter.toyCollection")
 
 # Standard fitting procedures
 predefined_sequence = {}
@@ -23,7 +37,7 @@ predefined_sequence['fitSigM'] = [dataCollection.sigMCReader, pdfCollection.stdW
 predefined_sequence['fitBkgCombA'] = [dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.bkgCombAFitter]
 predefined_sequence['fitFinal3D'] = [dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.finalFitter]
 
-predefined_sequence['stdFit'] = [dataCollection.effiHistReader, dataCollection.sigMCReader, dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.effiFitter, fitCollection.sigMFitter, fitCollection.bkgCombAFitter, fitCollection.sig2DFitter, fitCollection.finalFitter]
+predefined_sequence['stdFit'] = [pdfCollection.stdWspaceReader, dataCollection.effiHistReader, dataCollection.sigMCReader, dataCollection.dataReader, fitCollection.effiFitter, fitCollection.sigMFitter, fitCollection.bkgCombAFitter, fitCollection.sig2DFitter, fitCollection.finalFitter]
 
 # For fitter validation and syst
 predefined_sequence['fitSig2D'] = [dataCollection.sigMCReader, pdfCollection.stdWspaceReader, fitCollection.sig2DFitter]
@@ -35,27 +49,108 @@ predefined_sequence['fitFinal3D_altFit1'] = [dataCollection.dataReader, pdfColle
 predefined_sequence['fitFinal3D_altFit2'] = [dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.finalFitter_altFit2]
 predefined_sequence['fitFinal3D_altFit3'] = [dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.finalFitter_altFit3]
 
+def getSequence(seqKey, binKey):
+    """Predefined sequence, or the standard one for the bin if seqKey is None."""
+    if seqKey is not None:
+        if seqKey in predefined_sequence.keys():
+            return predefined_sequence[seqKey]
+        else:
+            raise KeyError("Unknown setSequence. Pick from {0}".format(predefined_sequence.keys()))
+    if binKey not in ['jpsi', 'psi2s']:
+        return predefined_sequence['stdFit']
+    return [dataCollection.effiHistReader, dataCollection.bkgJpsiMCReader, dataCollection.bkgPsi2sMCReader, dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.effiFitter]
+
+def runSequenceInBin(args):
+    """Run a sequence for one q2 bin with a dedicated Process, work_dir and FitDBPlayer.
+    Return a summary with the content of the output db."""
+    seqKey, binKey, work_dir, cfg = args
+    processCfg = deepcopy(p.cfg)
+    processCfg.update(cfg)
+    processCfg['binKey'] = binKey
+    processCfg['scheduler'] = "sequential"  # Daemonic pool workers cannot fork DAG workers.
+    pp = Process("myProcess_{0}".format(binKey), work_dir, processCfg)
+    pp.logger.verbosityLevel = p.logger.verbosityLevel
+    pp.addService("dbplayer", FitDBPlayer(absInputDir=p.dbplayer.absInputDir))
+    pp.setSequence(getSequence(seqKey, binKey))
+
+    summary = {'binKey': binKey, 'work_dir': os.path.abspath(work_dir), 'status': "done", 'db': {}}
+    startTime = time.time()
+    try:
+        pp.beginSeq()
+        pp.runSeq()
+        odbfile = os.path.abspath(pp.dbplayer.odbfile)
+        summary['dbfile'] = odbfile
+    except Exception:
+        summary['status'] = "failed"
+        summary['error'] = traceback.format_exc()
+        odbfile = None
+    finally:
+        pp.endSeq()
+    if odbfile is not None and os.path.exists(odbfile):
+        db = shelve.open(odbfile, 'r')
+        try:
+            summary['db'] = dict(db)
+        finally:
+            db.close()
+    summary['elapsed'] = time.time() - startTime
+    return summary
+
+def runMultiBin(seqKey, binKeys, nProcs=None, cfg=None):
+    """Run a sequence for several q2 bins concurrently, each in a forked process under p.work_dir/binKey.
+    The summaries are aggregated to p.work_dir/multiBin_{seqKey}.json"""
+    if cfg is None:
+        cfg = {}
+    for binKey in binKeys:
+        if binKey not in anaSetup.q2bins.keys():
+            raise KeyError("Unknown binKey {0}. Pick from {1}".format(binKey, anaSetup.q2bins.keys()))
+    tasks = [(seqKey, binKey, os.path.join(p.work_dir, binKey), cfg) for binKey in binKeys]
+
+    # Fresh fork for each bin since paths are modified while running.
+    pool = multiprocessing.Pool(nProcs if nProcs else len(binKeys), maxtasksperchild=1)
+    try:
+        summaries = pool.map(runSequenceInBin, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    if not os.path.exists(p.work_dir):
+        os.makedirs(p.work_dir)
+    ofile = os.path.join(p.work_dir, "multiBin_{0}.json".format(seqKey if seqKey else "default"))
+    with open(ofile, 'w') as f:
+        json.dump(OrderedDict([(s['binKey'], s) for s in summaries]), f, indent=2, default=str)
+    for s in summaries:
+        print("{0:<16s} {1:<8s} {2:8.1f}s {3}".format(s['binKey'], s['status'], s['elapsed'], s['work_dir']))
+        if s['status'] != "done":
+            print(s['error'])
+    print("Summary is written to {0}".format(ofile))
+    return summaries
+
 if __name__ == '__main__':
     parser = ArgumentParser(prog='seqCollection')
-    parser.add_argument('-b', '--binKey', dest='binKey', type=str, default=p.cfg['binKey'])
+    parser.add_argument('-b', '--binKey', dest='binKey', type=str, nargs='+', default=[p.cfg['binKey']], help="Bins to be processed, run concurrently if more than one is given.")
     parser.add_argument('-s', '--seq', dest='seqKey', type=str, default=None)
+    parser.add_argument('-j', '--nWorkers', dest='nWorkers', type=int, default=0, help="Run independent paths concurrently with N worker processes.")
+    parser.add_argument('-n', '--nProcs', dest='nProcs', type=int, default=0, help="Number of bins to be processed concurrently, all by default.")
+    parser.add_argument('-i', '--nIngestWorkers', dest='nIngestWorkers', type=int, default=1, help="Read input files of dataReader with N worker processes.")
+    parser.add_argument('-c', '--checkpoint', dest='checkpoint', action='store_true', help="Save finished paths and resume from them if the sequence failed last time.")
     args = parser.parse_args()
 
-    if args.binKey in anaSetup.q2bins.keys():
-        p.cfg['binKey'] = args.binKey
-    else:
-        raise KeyError("Unknown binKey {0}. Pick from {1}".format(args.binKey, anaSetup.q2bins.keys()))
+    if args.nWorkers > 0:
+        p.cfg['scheduler'] = "dag"
+        p.cfg['nWorkers'] = args.nWorkers
+    p.cfg['checkpoint'] = args.checkpoint
+    p.cfg['nIngestWorkers'] = args.nIngestWorkers
 
-    if args.seqKey is not None:
-        if args.seqKey in predefined_sequence.keys():
-            p.setSequence(predefined_sequence[args.seqKey])
-        else:
-            raise KeyError("Unknown setSequence. Pick from {0}".format(predefined_sequence.keys()))
+    if len(args.binKey) > 1:
+        runMultiBin(args.seqKey, args.binKey, args.nProcs)
+        sys.exit()
+
+    if args.binKey[0] in anaSetup.q2bins.keys():
+        p.cfg['binKey'] = args.binKey[0]
     else:
-        if args.binKey not in ['jpsi', 'psi2s']:
-            p.setSequence(predefined_sequence['stdFit'])
-        else:
-            p.setSequence([dataCollection.effiHistReader, dataCollection.bkgJpsiMCReader, dataCollection.bkgPsi2sMCReader, dataCollection.dataReader, pdfCollection.stdWspaceReader, fitCollection.effiFitter])
+        raise KeyError("Unknown binKey {0}. Pick from {1}".format(args.binKey[0], anaSetup.q2bins.keys()))
+
+    p.setSequence(getSequence(args.seqKey, p.cfg['binKey']))
 
     try:
         p.beginSeq()
@@ -16,11 +16,11 @@ from collections import OrderedDict
 
 import ROOT
 import SingleBuToKstarMuMuFitter.cpp
+from SingleBuToKstarMuMuFitter.cpp import compiledCut
 import SingleBuToKstarMuMuFitter.varCollection as varCollection
 import SingleBuToKstarMuMuFitter.dataCollection as dataCollection
 import SingleBuToKstarMuMuFitter.pdfCollection as pdfCollection
 import SingleBuToKstarMuMuFitter.fitCollection as fitCollection
-import SingleBuToKstarMuMuFitter.plotCollection as plotCollection
 from SingleBuToKstarMuMuFitter.StdProcess import createNewProcess
 
 from v2Fitter.Fitter.ObjProvider import ObjProvider
@@ -31,7 +31,12 @@ from SingleBuToKstarMuMuFitter.anaSetup import modulePath, q2bins, bMassRegions,
 from SingleBuToKstarMuMuFitter.StdFitter import StdFitter, unboundFlToFl, unboundAfbToAfb
 from SingleBuToKstarMuMuFitter.EfficiencyFitter import EfficiencyFitter
 from SingleBuToKstarMuMuFitter.FitDBPlayer import FitDBPlayer
-from SingleBuToKstarMuMuFitter.Plotter import Plotter
+from v2Fitter.FlowControl.LazyModule import LazyModule
+from v2Fitter.FlowControl.ImplicitMT import implicitMT
+
+# Plotting stack is initialized only when needed.
+plotCollection = LazyModule("SingleBuToKstarMuMuFitter.plotCollection")
+Plotter = LazyModule("SingleBuToKstarMuMuFitter.Plotter", "Plotter")
 
 from argparse import ArgumentParser
 p = createNewProcess()
@@ -78,38 +83,43 @@ def create_histo_data2expt(kwargs=None):
     kwargs = {} if kwargs is None else kwargs
     wgtConfig = ["1*(fabs(Bmass-5.28)<0.06) - 0.5*(fabs(Bmass-5.11)<0.06) - 0.5*(fabs(Bmass-5.46)<0.06)",]
 
-    # Data
-    tree_data = ROOT.TChain("tree")
-    for f in dataCollection.dataReaderCfg['ifile']:
-        tree_data.Add(f)
-    df_data = ROOT.RDataFrame(tree_data).Define('weight', *wgtConfig).Filter(cuts_antiResVeto).Filter(q2bins['jpsi']['cutString'])
-
-    ptr_h_CosThetaL_data = df_data.Histo1D(("h_CosThetaL", "", 20, -1, 1), "CosThetaL", "weight")
-    ptr_h_CosThetaK_data = df_data.Histo1D(("h_CosThetaK", "", 20, -1, 1), "CosThetaK", "weight")
-    ptr_h2_sigA_data = df_data.Histo2D(
-        ("h2_sigA_data", "",
-            len(dataCollection.accXEffThetaLBins) - 1, dataCollection.accXEffThetaLBins, 
-            len(dataCollection.accXEffThetaKBins) - 1, dataCollection.accXEffThetaKBins),
-        "CosThetaL",
-        "CosThetaK",
-        "weight"
-    )
-
-    # (Unfiltered) MC(GEN)
-    tree_expt = ROOT.TChain("tree")
-    tree_expt.Add("/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/v3p5/unfilteredJPSI_genonly/*.root")
-    df_expt = ROOT.RDataFrame(tree_expt).Define('genWeight', "1").Filter("genQ2 > 8.68 && genQ2 < 10.09")
-
-    ptr_h_CosThetaL_mc = df_expt.Histo1D(("h_genCosThetaL", "", 20, -1, 1), "genCosThetaL", "genWeight")
-    ptr_h_CosThetaK_mc = df_expt.Histo1D(("h_genCosThetaK", "", 20, -1, 1), "genCosThetaK", "genWeight")
-    ptr_h2_sigA_mc = df_expt.Histo2D(
-        ("h2_sigA_mc", "",
-            len(dataCollection.accXEffThetaLBins) - 1, dataCollection.accXEffThetaLBins, 
-            len(dataCollection.accXEffThetaKBins) - 1, dataCollection.accXEffThetaKBins),
-        "genCosThetaL",
-        "genCosThetaK",
-        "genWeight"
-    )
+    # Event loops run in the implicit MT scope, which is closed before touching RooFit.
+    with implicitMT(kwargs.get('nThreads', 0)):
+        # Data
+        tree_data = ROOT.TChain("tree")
+        for f in dataCollection.dataReaderCfg['ifile']:
+            tree_data.Add(f)
+        df_data = ROOT.RDataFrame(tree_data).Define('weight', *wgtConfig).Filter(compiledCut(cuts_antiResVeto).rdfExpr()).Filter(compiledCut(q2bins['jpsi']['cutString']).rdfExpr())
+
+        ptr_h_CosThetaL_data = df_data.Histo1D(("h_CosThetaL", "", 20, -1, 1), "CosThetaL", "weight")
+        ptr_h_CosThetaK_data = df_data.Histo1D(("h_CosThetaK", "", 20, -1, 1), "CosThetaK", "weight")
+        ptr_h2_sigA_data = df_data.Histo2D(
+            ("h2_sigA_data", "",
+                len(dataCollection.accXEffThetaLBins) - 1, dataCollection.accXEffThetaLBins, 
+                len(dataCollection.accXEffThetaKBins) - 1, dataCollection.accXEffThetaKBins),
+            "CosThetaL",
+            "CosThetaK",
+            "weight"
+        )
+
+        # (Unfiltered) MC(GEN)
+        tree_expt = ROOT.TChain("tree")
+        tree_expt.Add("/eos/cms/store/user/pchen/BToKstarMuMu/dat/sel/v3p5/unfilteredJPSI_genonly/*.root")
+        df_expt = ROOT.RDataFrame(tree_expt).Define('genWeight', "1").Filter("genQ2 > 8.68 && genQ2 < 10.09")
+
+        ptr_h_CosThetaL_mc = df_expt.Histo1D(("h_genCosThetaL", "", 20, -1, 1), "genCosThetaL", "genWeight")
+        ptr_h_CosThetaK_mc = df_expt.Histo1D(("h_genCosThetaK", "", 20, -1, 1), "genCosThetaK", "genWeight")
+        ptr_h2_sigA_mc = df_expt.Histo2D(
+            ("h2_sigA_mc", "",
+                len(dataCollection.accXEffThetaLBins) - 1, dataCollection.accXEffThetaLBins, 
+                len(dataCollection.accXEffThetaKBins) - 1, dataCollection.accXEffThetaKBins),
+            "genCosThetaL",
+            "genCosThetaK",
+            "genWeight"
+        )
+
+        for ptr in ptr_h2_sigA_data, ptr_h2_sigA_mc:
+            ptr.GetValue()  # Fill all histograms booked on the same RDataFrame
 
     # Efficiency from MC(GEN+SIM)
     effiFile = ROOT.TFile(modulePath + "/input/wspace_bin2.root")
@@ -1287,16 +1297,8 @@ def func_mergeBkgCombShape(args):
 # # Vary Fit range
 def func_altFitRange(args):
     """ Take wider Fit region """
-    dataReaderCfg = deepcopy(dataCollection.dataReaderCfg)
-    dataReaderCfg.update({
-        'preloadFile': None
-    })
-    dataReader = DataReader(dataReaderCfg)
-    dataReader.customize = types.MethodType(
-        functools.partial(dataCollection.customizeOne,
-                          targetBMassRegion=['^altFit$']),
-        dataReader
-    )
+    # Derived from dataReader.Full in memory, see dataCollection.customizeOne
+    dataReader = dataCollection.dataReader
     fitterCfg = deepcopy(fitCollection.setupFinalFitter)
     fitterCfg.update({
         'data': "dataReader.altFit",
@@ -1322,16 +1324,8 @@ def func_altFitRange(args):
 # # Remove LSB from Fit region
 def func_vetoJpsiX(args):
     """ DEPRECATED. Remvoe LSB from Fit region """
-    dataReaderCfg = deepcopy(dataCollection.dataReaderCfg)
-    dataReaderCfg.update({
-        'preloadFile': None
-    })
-    dataReader = DataReader(dataReaderCfg)
-    dataReader.customize = types.MethodType(
-        functools.partial(dataCollection.customizeOne,
-                          targetBMassRegion=['^altFit_vetoJpsiX$']),
-        dataReader
-    )
+    # Derived from dataReader.Full in memory, see dataCollection.customizeOne
+    dataReader = dataCollection.dataReader
     fitterCfg = deepcopy(fitCollection.setupFinalFitter)
     fitterCfg.update({
         'data': "dataReader.altFit_vetoJpsiX",
@@ -28,8 +28,13 @@ CFG.update({
     'generateOpt': [],
     'mixWith': "ToyGenerator.mixedToy",
     'scale': 1,
+    'inputs': [],  # Parameters are initialized from the db
 })
 
+def externalDigest_db(self):
+    """Parameters are initialized from cfg['db']."""
+    return FitDBPlayer.digestDB(self.cfg['db'].format(binLabel=q2bins[self.process.cfg['binKey']]['label']))
+
 def decorator_initParameters(func):
     @functools.wraps(func)
     def wrapped_f(self):
@@ -78,6 +83,7 @@ sigToyGenerator = ToyGenerator(setupSigToyGenerator)
 def sigToyGenerator_customize(self):
     pass
 sigToyGenerator.customize = types.MethodType(sigToyGenerator_customize, sigToyGenerator)
+sigToyGenerator.externalDigest = types.MethodType(externalDigest_db, sigToyGenerator)
 
 # bkgCombToyGenerator - validation
 setupBkgCombToyGenerator = deepcopy(CFG)
@@ -92,6 +98,7 @@ bkgCombToyGenerator = ToyGenerator(setupBkgCombToyGenerator)
 def bkgCombToyGenerator_customize(self):
     pass
 bkgCombToyGenerator.customize = types.MethodType(bkgCombToyGenerator_customize, bkgCombToyGenerator)
+bkgCombToyGenerator.externalDigest = types.MethodType(externalDigest_db, bkgCombToyGenerator)
 
 # Systematics
 
@@ -109,6 +116,7 @@ sigAToyGenerator = ToyGenerator(setupSigAToyGenerator)
 def sigAToyGenerator_customize(self):
     pass
 sigAToyGenerator.customize = types.MethodType(sigAToyGenerator_customize, sigAToyGenerator)
+sigAToyGenerator.externalDigest = types.MethodType(externalDigest_db, sigAToyGenerator)
 
 if __name__ == '__main__':
     try:
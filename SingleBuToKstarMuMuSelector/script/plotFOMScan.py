@@ -6,76 +6,78 @@ import os
 import ROOT
 from SingleBuToKstarMuMuFitter.Plotter import Plotter
 import SingleBuToKstarMuMuSelector.StdOptimizerBase as StdOptimizerBase
+from v2Fitter.FlowControl.ImplicitMT import implicitMT
 
 def create_histo(kwargs):
     ofname = kwargs.get('ofname', "plotFOMScan.root")
     iTreeFiles = kwargs.get('iTreeFiles', ["/eos/cms/store/user/pchen/BToKstarMuMu/dat/ntp/v3p2/BuToKstarMuMu-data-2012*.root"])
     wgtString = kwargs.get('wgtString', "1")
 
-    tree = ROOT.TChain("tree")
-    for tr in iTreeFiles:
-        tree.Add(tr)
-
-    df = ROOT.RDataFrame(tree).Filter("nb>0", "At least one B candidate")
-    aug_df = StdOptimizerBase.Define_AllCheckBits(df)\
-        .Define("weight", wgtString)\
-        .Define("PassAll"                     , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
-        .Define("PassAllExcept_trkpt"         , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * 1         * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
-        .Define("PassAllExcept_trkdcabssig"   , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * 1               * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
-        .Define("PassAllExcept_kspt"          , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * 1        * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
-        .Define("PassAllExcept_blsbssig"      , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * 1            * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
-        .Define("PassAllExcept_bcosalphabs2d" , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * 1                 * bit_bvtxcl * bit_kstarmass")\
-        .Define("PassAllExcept_bvtxcl"        , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * 1          * bit_kstarmass")\
-        .Define("PassAllExcept_kstarmass"     , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * 1")
-
-    h_Trkpt = aug_df\
-        .Filter("Filter_IsNonEmptyBit(PassAllExcept_trkpt)")\
-        .Define("BestCand_trkpt", "Define_GetValAtArgMax(trkpt, bvtxcl, PassAllExcept_trkpt)")\
-        .Define("BestCand_trkptM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_trkpt)")\
-        .Define("BestCand_trkptW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_trkpt)")\
-        .Histo2D(("h_Trkpt", "", 50, 0, 5, 104, 4.76, 5.80), "BestCand_trkpt", "BestCand_trkptM", "BestCand_trkptW")
-
-    h_Bvtxcl = aug_df\
-        .Filter("Filter_IsNonEmptyBit(PassAllExcept_bvtxcl)")\
-        .Define("BestCand_bvtxcl", "Define_GetValAtArgMax(bvtxcl, bvtxcl, PassAllExcept_bvtxcl)")\
-        .Define("BestCand_bvtxclM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_bvtxcl)")\
-        .Define("BestCand_bvtxclW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_bvtxcl)")\
-        .Histo2D(("h_Bvtxcl", "", 100, 0, 1, 104, 4.76, 5.80), "BestCand_bvtxcl", "BestCand_bvtxclM", "BestCand_bvtxclW")
-
-    h_Blxysig = aug_df\
-        .Filter("Filter_IsNonEmptyBit(PassAllExcept_blsbssig)")\
-        .Define("BestCand_blsbssig", "Define_GetValAtArgMax(blsbssig, bvtxcl, PassAllExcept_blsbssig)")\
-        .Define("BestCand_blsbssigM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_blsbssig)")\
-        .Define("BestCand_blsbssigW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_blsbssig)")\
-        .Histo2D(("h_Blxysig", "", 100, 0, 100, 104, 4.76, 5.80), "BestCand_blsbssig", "BestCand_blsbssigM", "BestCand_blsbssigW")
-
-    h_Bcosalphabs2d = aug_df\
-        .Filter("Filter_IsNonEmptyBit(PassAllExcept_bcosalphabs2d)")\
-        .Define("BestCand_bcosalphabs2d", "Define_GetValAtArgMax(bcosalphabs2d, bvtxcl, PassAllExcept_bcosalphabs2d)")\
-        .Define("BestCand_bcosalphabs2dM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_bcosalphabs2d)")\
-        .Define("BestCand_bcosalphabs2dW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_bcosalphabs2d)")\
-        .Histo2D(("h_Bcosalphabs2d", "", 70, 0.9993, 1, 104, 4.76, 5.80), "BestCand_bcosalphabs2d", "BestCand_bcosalphabs2dM", "BestCand_bcosalphabs2dW")
-
-    h_Trkdcabssig = aug_df\
-        .Filter("Filter_IsNonEmptyBit(PassAllExcept_trkdcabssig)")\
-        .Define("BestCand_trkdcabssig", "Define_GetValAtArgMax(trkdcabssig, bvtxcl, PassAllExcept_trkdcabssig)")\
-        .Define("BestCand_trkdcabssigM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_trkdcabssig)")\
-        .Define("BestCand_trkdcabssigW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_trkdcabssig)")\
-        .Histo2D(("h_Trkdcabssig", "", 100, 0, 50, 104, 4.76, 5.80), "BestCand_trkdcabssig", "BestCand_trkdcabssigM", "BestCand_trkdcabssigW")
-
-    h_Kshortpt = aug_df\
-        .Filter("Filter_IsNonEmptyBit(PassAllExcept_kspt)")\
-        .Define("BestCand_kspt", "Define_GetValAtArgMax(kspt, bvtxcl, PassAllExcept_kspt)")\
-        .Define("BestCand_ksptM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_kspt)")\
-        .Define("BestCand_ksptW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_kspt)")\
-        .Histo2D(("h_Kshortpt", "", 100, 0, 10, 104, 4.76, 5.80), "BestCand_kspt", "BestCand_ksptM", "BestCand_ksptW")
+    with implicitMT(kwargs.get('nThreads', 0)):
+        tree = ROOT.TChain("tree")
+        for tr in iTreeFiles:
+            tree.Add(tr)
+
+        df = ROOT.RDataFrame(tree).Filter("nb>0", "At least one B candidate")
+        aug_df = StdOptimizerBase.Define_AllCheckBits(df)\
+            .Define("weight", wgtString)\
+            .Define("PassAll"                     , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
+            .Define("PassAllExcept_trkpt"         , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * 1         * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
+            .Define("PassAllExcept_trkdcabssig"   , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * 1               * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
+            .Define("PassAllExcept_kspt"          , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * 1        * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
+            .Define("PassAllExcept_blsbssig"      , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * 1            * bit_bcosalphabs2d * bit_bvtxcl * bit_kstarmass")\
+            .Define("PassAllExcept_bcosalphabs2d" , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * 1                 * bit_bvtxcl * bit_kstarmass")\
+            .Define("PassAllExcept_bvtxcl"        , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * 1          * bit_kstarmass")\
+            .Define("PassAllExcept_kstarmass"     , "bit_resRej * bit_antiRad * bit_HasGoodDimuon * bit_trkpt * bit_trkdcabssig * bit_kspt * bit_blsbssig * bit_bcosalphabs2d * bit_bvtxcl * 1")
+
+        h_Trkpt = aug_df\
+            .Filter("Filter_IsNonEmptyBit(PassAllExcept_trkpt)")\
+            .Define("BestCand_trkpt", "Define_GetValAtArgMax(trkpt, bvtxcl, PassAllExcept_trkpt)")\
+            .Define("BestCand_trkptM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_trkpt)")\
+            .Define("BestCand_trkptW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_trkpt)")\
+            .Histo2D(("h_Trkpt", "", 50, 0, 5, 104, 4.76, 5.80), "BestCand_trkpt", "BestCand_trkptM", "BestCand_trkptW")
+
+        h_Bvtxcl = aug_df\
+            .Filter("Filter_IsNonEmptyBit(PassAllExcept_bvtxcl)")\
+            .Define("BestCand_bvtxcl", "Define_GetValAtArgMax(bvtxcl, bvtxcl, PassAllExcept_bvtxcl)")\
+            .Define("BestCand_bvtxclM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_bvtxcl)")\
+            .Define("BestCand_bvtxclW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_bvtxcl)")\
+            .Histo2D(("h_Bvtxcl", "", 100, 0, 1, 104, 4.76, 5.80), "BestCand_bvtxcl", "BestCand_bvtxclM", "BestCand_bvtxclW")
+
+        h_Blxysig = aug_df\
+            .Filter("Filter_IsNonEmptyBit(PassAllExcept_blsbssig)")\
+            .Define("BestCand_blsbssig", "Define_GetValAtArgMax(blsbssig, bvtxcl, PassAllExcept_blsbssig)")\
+            .Define("BestCand_blsbssigM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_blsbssig)")\
+            .Define("BestCand_blsbssigW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_blsbssig)")\
+            .Histo2D(("h_Blxysig", "", 100, 0, 100, 104, 4.76, 5.80), "BestCand_blsbssig", "BestCand_blsbssigM", "BestCand_blsbssigW")
+
+        h_Bcosalphabs2d = aug_df\
+            .Filter("Filter_IsNonEmptyBit(PassAllExcept_bcosalphabs2d)")\
+            .Define("BestCand_bcosalphabs2d", "Define_GetValAtArgMax(bcosalphabs2d, bvtxcl, PassAllExcept_bcosalphabs2d)")\
+            .Define("BestCand_bcosalphabs2dM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_bcosalphabs2d)")\
+            .Define("BestCand_bcosalphabs2dW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_bcosalphabs2d)")\
+            .Histo2D(("h_Bcosalphabs2d", "", 70, 0.9993, 1, 104, 4.76, 5.80), "BestCand_bcosalphabs2d", "BestCand_bcosalphabs2dM", "BestCand_bcosalphabs2dW")
+
+        h_Trkdcabssig = aug_df\
+            .Filter("Filter_IsNonEmptyBit(PassAllExcept_trkdcabssig)")\
+            .Define("BestCand_trkdcabssig", "Define_GetValAtArgMax(trkdcabssig, bvtxcl, PassAllExcept_trkdcabssig)")\
+            .Define("BestCand_trkdcabssigM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_trkdcabssig)")\
+            .Define("BestCand_trkdcabssigW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_trkdcabssig)")\
+            .Histo2D(("h_Trkdcabssig", "", 100, 0, 50, 104, 4.76, 5.80), "BestCand_trkdcabssig", "BestCand_trkdcabssigM", "BestCand_trkdcabssigW")
+
+        h_Kshortpt = aug_df\
+            .Filter("Filter_IsNonEmptyBit(PassAllExcept_kspt)")\
+            .Define("BestCand_kspt", "Define_GetValAtArgMax(kspt, bvtxcl, PassAllExcept_kspt)")\
+            .Define("BestCand_ksptM", "Define_GetValAtArgMax(bmass, bvtxcl, PassAllExcept_kspt)")\
+            .Define("BestCand_ksptW", "Define_GetValAtArgMax(weight, bvtxcl, PassAllExcept_kspt)")\
+            .Histo2D(("h_Kshortpt", "", 100, 0, 10, 104, 4.76, 5.80), "BestCand_kspt", "BestCand_ksptM", "BestCand_ksptW")
     
-    hists = [h_Trkpt, h_Bvtxcl, h_Blxysig, h_Bcosalphabs2d, h_Trkdcabssig, h_Kshortpt]
-    fout = ROOT.TFile(ofname, "RECREATE")
-    for h in hists:
-        h.Write()
-    fout.Write()
-    fout.Close()
+        hists = [h_Trkpt, h_Bvtxcl, h_Blxysig, h_Bcosalphabs2d, h_Trkdcabssig, h_Kshortpt]
+        fout = ROOT.TFile(ofname, "RECREATE")
+        for h in hists:
+            h.Write()
+        fout.Write()
+        fout.Close()
 
 def plot_histo():
     canvas = Plotter.canvas
@@ -80,6 +80,7 @@ executable  = {executable}
         if wrapper_kwargs is None:
             wrapper_kwargs = {}
         p = self.getWrappedProcess(process, jobId, **wrapper_kwargs)
+        p.cfg['jobId'] = jobId
         if self.cfg['work_dir'] is None:
             p.work_dir = os.path.join(self.task_dir, "job{jobId:04d}".format(jobId=jobId))
         elif isinstance(self.cfg['work_dir'], str):
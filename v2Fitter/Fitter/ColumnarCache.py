@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=1 fdn=3 ft=python et:
+
+# Description     : Columnar on-disk cache of RooDataSets, one .npy file per observable
+
+import os
+import json
+import shutil
+
+import ROOT
+from ROOT import RooDataSet
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+cimp_ColumnCopier = """
+#include <string>
+#include <vector>
+#include "RooArgSet.h"
+#include "RooRealVar.h"
+#include "RooDataSet.h"
+
+// Copy RooRealVar columns between a RooDataSet and contiguous double buffers.
+class ColumnarCacheCopier {
+public:
+    ColumnarCacheCopier(RooArgSet *argset) : fArgset(argset) {}
+    void AddInput(const char *name, const double *buffer) {
+        fVars.push_back(dynamic_cast<RooRealVar*>(fArgset->find(name)));
+        fInputs.push_back(buffer);
+    }
+    void AddOutput(const char *name, double *buffer) {
+        fNames.push_back(name);
+        fOutputs.push_back(buffer);
+    }
+    void ToDataSet(RooDataSet *data, Long64_t nEntries) {
+        for (Long64_t entry = 0; entry < nEntries; ++entry) {
+            for (size_t i = 0; i < fVars.size(); ++i) fVars[i]->setVal(fInputs[i][entry]);
+            data->add(*fArgset);
+        }
+    }
+    void FromDataSet(RooDataSet *data) {
+        for (Long64_t entry = 0; entry < data->numEntries(); ++entry) {
+            const RooArgSet *row = data->get(entry);
+            for (size_t i = 0; i < fNames.size(); ++i) fOutputs[i][entry] = row->getRealValue(fNames[i].c_str());
+        }
+    }
+private:
+    RooArgSet *fArgset;
+    std::vector<RooRealVar*> fVars;
+    std::vector<const double*> fInputs;
+    std::vector<std::string> fNames;
+    std::vector<double*> fOutputs;
+};
+"""
+
+def isAvailable():
+    return numpy is not None
+
+def _declare():
+    if not hasattr(ROOT, 'ColumnarCacheCopier'):
+        ROOT.gInterpreter.Declare(cimp_ColumnCopier)
+
+def argNames(argset):
+    names = []
+    args_it = argset.createIterator()
+    arg = args_it.Next()
+    while arg:
+        names.append(arg.GetName())
+        arg = args_it.Next()
+    return names
+
+def _manifestFile(cacheDir):
+    return os.path.join(cacheDir, "manifest.json")
+
+def readManifest(cacheDir):
+    """Return the manifest of the cache, None if not available."""
+    if not os.path.exists(_manifestFile(cacheDir)):
+        return None
+    with open(_manifestFile(cacheDir)) as f:
+        return json.load(f)
+
+def writeDataSets(cacheDir, datasets, argset, extraManifest=None):
+    """Write datasets in {dname: RooDataSet} to cacheDir.
+    Files are written to a temporary directory renamed at last, an existing cache written by another job is kept."""
+    _declare()
+    names = argNames(argset)
+    manifest = {'columns': names, 'datasets': {}}
+    if extraManifest:
+        manifest.update(extraManifest)
+    finalDir = cacheDir
+    cacheDir = "{0}.tmp{1}".format(finalDir, os.getpid())
+    if os.path.exists(cacheDir):
+        shutil.rmtree(cacheDir)
+    os.makedirs(cacheDir)
+    for dname, data in datasets.items():
+        nEntries = int(data.numEntries())
+        columns = dict([(name, numpy.empty(nEntries, dtype=numpy.float64)) for name in names])
+        copier = ROOT.ColumnarCacheCopier(argset)
+        for name in names:
+            copier.AddOutput(name, columns[name])
+        copier.FromDataSet(data)
+        ddir = os.path.join(cacheDir, dname)
+        os.makedirs(ddir)
+        for name in names:
+            numpy.save(os.path.join(ddir, "{0}.npy".format(name)), columns[name])
+        manifest['datasets'][dname] = {'nEntries': nEntries, 'title': data.GetTitle()}
+
+    with open(_manifestFile(cacheDir), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.exists(finalDir) and readManifest(finalDir) is None:
+        shutil.rmtree(finalDir)  # Incomplete
+    try:
+        os.rename(cacheDir, finalDir)
+    except OSError:
+        shutil.rmtree(cacheDir)  # Completed by a concurrent job
+
+def readColumns(cacheDir, dname, manifest=None):
+    """Memory-mapped columns of a cached dataset in {varName: numpy.ndarray}, None if not cached."""
+    if manifest is None:
+        manifest = readManifest(cacheDir)
+    if manifest is None or dname not in manifest['datasets']:
+        return None
+    return dict([(name, numpy.load(os.path.join(cacheDir, dname, "{0}.npy".format(name)), mmap_mode='r')) for name in manifest['columns']])
+
+def toDataSet(dname, columns, argset, title=""):
+    """Create a RooDataSet with observables in argset from the columns."""
+    _declare()
+    data = RooDataSet(dname, title, argset)
+    names = [name for name in argNames(argset) if name in columns]
+    if not names:
+        return data
+    # Read-only memory maps are fine since the buffers are never written.
+    buffers = dict([(name, numpy.ascontiguousarray(columns[name], dtype=numpy.float64)) for name in names])
+    copier = ROOT.ColumnarCacheCopier(argset)
+    for name in names:
+        copier.AddInput(name, buffers[name])
+    copier.ToDataSet(data, len(buffers[names[0]]))
+    return data
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=1 fdn=3 ft=python et:
+
+# Description     : Compile cut strings into C++ predicates shared by TTree loops, RDataFrame and NumPy
+
+import os
+import re
+import hashlib
+
+import ROOT
+
+from v2Fitter.FlowControl.SourceManager import FileManager
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+cimp_TreeCut = """
+#include <string>
+#include <vector>
+#include "TTree.h"
+#include "TBranch.h"
+#include "TLeaf.h"
+#include "TTreeFormula.h"
+#include "TInterpreter.h"
+
+// Evaluate a compiled predicate with the leaves of the entry loaded by TTree::LoadTree.
+// Plain leaves, i.e. a single value in a branch of the current tree, are read from the branch buffers,
+// aliases, friends and arrays are left to TTreeFormula.
+class CutCompilerTreeCut {
+public:
+    typedef bool (*Predicate)(const double*);
+    CutCompilerTreeCut(TTree *tree, const char *func, const char *vars) : fTree(tree) {
+        fPredicate = (Predicate)gInterpreter->Calc(Form("(Long_t)&v2FitterCuts::%s_v", func));
+        if (tree->GetTree() == 0) tree->LoadTree(0);
+        std::string names(vars);
+        size_t begin = 0;
+        while (begin < names.size()) {
+            size_t end = names.find(',', begin);
+            if (end == std::string::npos) end = names.size();
+            fNames.push_back(names.substr(begin, end - begin));
+            begin = end + 1;
+        }
+        fLeaves.assign(fNames.size(), 0);
+        fFormulas.assign(fNames.size(), 0);
+        fValues.resize(fNames.size());
+        UpdateFormulaLeaves();
+    }
+    ~CutCompilerTreeCut() {
+        for (size_t i = 0; i < fFormulas.size(); ++i) delete fFormulas[i];
+    }
+    bool IsValid() const { return fPredicate != 0; }
+    // Bind the leaves of the current tree, to be called at a new tree of a chain.
+    void UpdateFormulaLeaves() {
+        TTree *current = fTree->GetTree();
+        for (size_t i = 0; i < fNames.size(); ++i) {
+            fLeaves[i] = current ? PlainLeaf(current, fNames[i]) : 0;
+            if (fLeaves[i] != 0) continue;
+            if (fFormulas[i] == 0) {
+                fFormulas[i] = new TTreeFormula(fNames[i].c_str(), fNames[i].c_str(), fTree);
+            } else {
+                fFormulas[i]->UpdateFormulaLeaves();
+            }
+        }
+    }
+    bool Pass() {
+        Long64_t entry = fTree->GetTree()->GetReadEntry();
+        for (size_t i = 0; i < fNames.size(); ++i) {
+            if (fLeaves[i] != 0) {
+                TBranch *branch = fLeaves[i]->GetBranch();
+                if (branch->GetReadEntry() != entry) branch->GetEntry(entry);
+                fValues[i] = fLeaves[i]->GetValue(0);
+            } else {
+                fFormulas[i]->GetNdata();
+                fValues[i] = fFormulas[i]->EvalInstance(0);
+            }
+        }
+        return fPredicate(fValues.empty() ? 0 : &fValues[0]);
+    }
+private:
+    static TLeaf* PlainLeaf(TTree *tree, const std::string &name) {
+        if (tree->GetAlias(name.c_str()) != 0) return 0;
+        TBranch *branch = tree->GetBranch(name.c_str());
+        if (branch == 0 || branch->GetTree() != tree || branch->GetListOfLeaves()->GetEntries() != 1) return 0;
+        TLeaf *leaf = (TLeaf*)branch->GetListOfLeaves()->At(0);
+        if (leaf->GetLeafCount() != 0 || leaf->GetLen() != 1) return 0;
+        if (leaf->InheritsFrom("TLeafElement") || leaf->InheritsFrom("TLeafC")) return 0;
+        return leaf;
+    }
+    TTree *fTree;
+    Predicate fPredicate;
+    std::vector<std::string> fNames;
+    std::vector<TLeaf*> fLeaves;
+    std::vector<TTreeFormula*> fFormulas;
+    std::vector<double> fValues;
+};
+"""
+
+_sourceHeader = """// Generated by v2Fitter.Fitter.CutCompiler
+#include <cmath>
+#include "Rtypes.h"
+
+#ifndef V2FITTER_CUTS_COMMON
+#define V2FITTER_CUTS_COMMON
+namespace v2FitterCuts {
+// TTreeFormula flavour of math functions
+inline double abs(double x) { return std::fabs(x); }
+using std::fabs;
+using std::sqrt;
+using std::exp;
+using std::log;
+using std::pow;
+}
+#endif
+"""
+
+_sourceTemplate = """
+namespace v2FitterCuts {{
+// {comment}
+bool {name}({args}) {{ return ({expr}); }}
+bool {name}_v(const double *_x) {{ return {name}({vectorArgs}); }}
+void {name}_array(Long64_t _n, {arrayArgs}double *_out) {{
+    for (Long64_t _i = 0; _i < _n; ++_i) _out[_i] = {name}({elementArgs});
+}}
+}}
+"""
+
+_nonVariables = set(['true', 'false', 'and', 'or', 'not'])
+_loaded = set()  # Name of predicates available in this process, inherited by forked workers.
+
+def cutVariables(expr):
+    """Branch names used in expr, i.e. identifiers other than functions, namespaces and keywords."""
+    names = re.findall(r"(?<![\w.])([A-Za-z_]\w*)(?!\s*(?:\(|::|\w))", expr)
+    return sorted(set([name for name in names if name not in _nonVariables]))
+
+class CompiledCut(object):
+    """Compiled predicate of a cut string."""
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        self.name = "cut_{0}".format(hashlib.sha1(re.sub(r"\s+", "", self.expr).encode('utf-8')).hexdigest()[:12])
+        self.variables = cutVariables(self.expr)
+
+    def source(self):
+        return _sourceTemplate.format(
+            expr=self.expr,
+            comment=" ".join(self.expr.split()),
+            name=self.name,
+            args=", ".join(["double {0}".format(var) for var in self.variables]),
+            vectorArgs=", ".join(["_x[{0}]".format(idx) for idx in range(len(self.variables))]),
+            arrayArgs="".join(["const double *{0}, ".format(var) for var in self.variables]),
+            elementArgs=", ".join(["{0}[_i]".format(var) for var in self.variables]))
+
+    def rdfExpr(self):
+        """Filter expression for RDataFrame, the cut itself is not interpreted."""
+        return "v2FitterCuts::{0}({1})".format(self.name, ", ".join(self.variables))
+
+    def treeCut(self, tree):
+        """CutCompilerTreeCut of tree, call Pass() after TTree::LoadTree and UpdateFormulaLeaves() at a new tree of a chain."""
+        return ROOT.CutCompilerTreeCut(tree, self.name, ",".join(self.variables))
+
+    def evalColumns(self, columns):
+        """Boolean mask of the events in {varName: numpy.ndarray}."""
+        nEvents = len(columns[self.variables[0]]) if self.variables else len(next(iter(columns.values())))
+        buffers = [numpy.ascontiguousarray(columns[var], dtype=numpy.float64) for var in self.variables]
+        output = numpy.empty(nEvents, dtype=numpy.float64)
+        getattr(ROOT.v2FitterCuts, "{0}_array".format(self.name))(nEvents, *(buffers + [output]))
+        return output != 0
+
+def declare():
+    """Declare CutCompilerTreeCut."""
+    if not hasattr(ROOT, 'CutCompilerTreeCut'):
+        ROOT.gInterpreter.Declare(cimp_TreeCut)
+
+def compileCuts(exprs, buildPath, logger=None):
+    """Compiled predicates of exprs in {expr: CompiledCut}.
+
+Predicates not yet loaded are built into one ACLiC library in buildPath,
+named after the digest of the generated source and the ROOT version so that it is compiled only once."""
+    cuts = dict([(expr, CompiledCut(expr)) for expr in exprs])
+    missing = dict([(cut.name, cut) for cut in cuts.values() if cut.name not in _loaded])
+    if missing:
+        source = _sourceHeader + "".join([missing[name].source() for name in sorted(missing.keys())])
+        digest = hashlib.sha1((ROOT.gROOT.GetVersion() + source).encode('utf-8')).hexdigest()[:12]
+        libName = os.path.join(buildPath, "v2FitterCuts_{0}".format(digest))
+        if not os.path.exists(buildPath):
+            try:
+                os.makedirs(buildPath)
+            except OSError:
+                pass  # Created by a concurrent job
+        with FileManager.lock(libName):
+            if not os.path.exists(libName + ".so"):
+                with open(libName + ".cxx", 'w') as f:
+                    f.write(source)
+                if not ROOT.gSystem.CompileMacro(libName + ".cxx", "kO", libName, buildPath):
+                    raise RuntimeError("Failed to compile cuts in {0}.cxx".format(libName))
+                if logger is not None:
+                    logger.logINFO("{0} cuts are compiled into {1}.so".format(len(missing), libName))
+            elif ROOT.gSystem.Load(libName + ".so") < 0:
+                raise RuntimeError("Failed to load {0}.so".format(libName))
+        _loaded.update(missing.keys())
+    declare()
+    return cuts
@@ -7,13 +7,189 @@
 # Last Modified   : 20 Feb 2019 19:06 17:36
 
 from v2Fitter.FlowControl.Path import Path
+from v2Fitter.FlowControl.SourceManager import LazySource
+from v2Fitter.FlowControl.PathCache import digestObj, fileStamps, codeDigest
+from v2Fitter.FlowControl.ImplicitMT import suspendImplicitMT
+import v2Fitter.Fitter.ColumnarCache as ColumnarCache
+import v2Fitter.Fitter.FriendJoin as FriendJoin
+import v2Fitter.Fitter.CutCompiler as CutCompiler
 
 import os
+import re
+import itertools
+import functools
+import multiprocessing
 import ROOT
 from ROOT import TChain
 from ROOT import TIter
 from ROOT import RooDataSet
 
+cimp_SinglePassFiller = """
+#include <vector>
+#include "TTree.h"
+#include "TTreeFormula.h"
+#include "RooArgSet.h"
+#include "RooRealVar.h"
+#include "RooDataSet.h"
+
+// Fill several RooDataSets in one loop over a tree.
+// Each distinct cut term is evaluated at most once per event, shared terms are checked first.
+// Terms are either interpreted by TTreeFormula or compiled by CutCompiler.
+class DataReaderSinglePassFiller {
+public:
+    DataReaderSinglePassFiller(TTree *tree, RooArgSet *argset) : fTree(tree), fArgset(argset) {
+        fTree->LoadTree(0);
+        TIterator *it = argset->createIterator();
+        while (RooRealVar *var = dynamic_cast<RooRealVar*>(it->Next())) {
+            fVars.push_back(var);
+            fVarFormulas.push_back(new TTreeFormula(var->GetName(), var->GetName(), fTree));
+        }
+        delete it;
+    }
+    ~DataReaderSinglePassFiller() {
+        for (size_t i = 0; i < fTerms.size(); ++i) delete fTerms[i];
+        for (size_t i = 0; i < fVarFormulas.size(); ++i) delete fVarFormulas[i];
+    }
+    int AddTerm(const char *expr) {
+        fTerms.push_back(new TTreeFormula(Form("term%d", (int)fTerms.size()), expr, fTree));
+        fCompiledTerms.push_back(0);
+        return fTerms.size() - 1;
+    }
+    int AddCompiledTerm(CutCompilerTreeCut *cut) {
+        fTerms.push_back(0);
+        fCompiledTerms.push_back(cut);
+        return fTerms.size() - 1;
+    }
+    void AddSharedTerm(int iTerm) { fShared.push_back(iTerm); }
+    int AddRegion(RooDataSet *data) {
+        fData.push_back(data);
+        fRegionTerms.push_back(std::vector<int>());
+        return fData.size() - 1;
+    }
+    void AddRegionTerm(int iRegion, int iTerm) { fRegionTerms[iRegion].push_back(iTerm); }
+    Long64_t Fill() {
+        Long64_t nRead = 0;
+        int treeNumber = -1;
+        std::vector<char> evaluated(fTerms.size()), passed(fTerms.size());
+        for (Long64_t entry = 0; fTree->LoadTree(entry) >= 0; ++entry) {
+            if (fTree->GetTreeNumber() != treeNumber) {
+                treeNumber = fTree->GetTreeNumber();
+                for (size_t i = 0; i < fTerms.size(); ++i) {
+                    if (fTerms[i]) fTerms[i]->UpdateFormulaLeaves();
+                    else fCompiledTerms[i]->UpdateFormulaLeaves();
+                }
+                for (size_t i = 0; i < fVarFormulas.size(); ++i) fVarFormulas[i]->UpdateFormulaLeaves();
+            }
+            ++nRead;
+            std::fill(evaluated.begin(), evaluated.end(), 0);
+            bool isShared = true;
+            for (size_t i = 0; isShared && i < fShared.size(); ++i) {
+                isShared = Eval(fShared[i], evaluated, passed);
+            }
+            if (!isShared) continue;
+
+            int isInRange = -1;  // Observables are loaded for the first matching region
+            for (size_t iRegion = 0; iRegion < fData.size(); ++iRegion) {
+                bool isPassed = true;
+                for (size_t i = 0; isPassed && i < fRegionTerms[iRegion].size(); ++i) {
+                    isPassed = Eval(fRegionTerms[iRegion][i], evaluated, passed);
+                }
+                if (!isPassed) continue;
+                if (isInRange < 0) isInRange = LoadVars();
+                if (isInRange) fData[iRegion]->add(*fArgset);
+            }
+        }
+        return nRead;
+    }
+private:
+    bool Eval(int iTerm, std::vector<char> &evaluated, std::vector<char> &passed) {
+        if (!evaluated[iTerm]) {
+            evaluated[iTerm] = 1;
+            if (fTerms[iTerm]) {
+                passed[iTerm] = fTerms[iTerm]->GetNdata() > 0 && fTerms[iTerm]->EvalInstance(0) != 0;
+            } else {
+                passed[iTerm] = fCompiledTerms[iTerm]->Pass();
+            }
+        }
+        return passed[iTerm];
+    }
+    int LoadVars() {
+        int isInRange = 1;
+        for (size_t i = 0; i < fVars.size(); ++i) {
+            fVarFormulas[i]->GetNdata();
+            double val = fVarFormulas[i]->EvalInstance(0);
+            // Same as RooTreeDataStore, events with any observable out of range are dropped.
+            if (!fVars[i]->isValidReal(val)) isInRange = 0;
+            fVars[i]->setVal(val);
+        }
+        return isInRange;
+    }
+    TTree *fTree;
+    RooArgSet *fArgset;
+    std::vector<RooRealVar*> fVars;
+    std::vector<TTreeFormula*> fVarFormulas;
+    std::vector<TTreeFormula*> fTerms;
+    std::vector<CutCompilerTreeCut*> fCompiledTerms;
+    std::vector<int> fShared;
+    std::vector<RooDataSet*> fData;
+    std::vector<std::vector<int> > fRegionTerms;
+};
+"""
+
+def _isWrapped(expr):
+    """Check if expr is enclosed by a pair of matching parentheses."""
+    if not (expr.startswith("(") and expr.endswith(")")):
+        return False
+    depth = 0
+    for idx, c in enumerate(expr):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0 and idx != len(expr) - 1:
+                return False
+    return True
+
+def splitConjuncts(expr):
+    """Split a cut string into the terms joined by top-level &&, nested conjunctions are flattened.
+    Trivial terms like "1" are dropped."""
+    expr = expr.strip()
+    while _isWrapped(expr):
+        expr = expr[1:-1].strip()
+    terms = []
+    depth, begin, hasOr = 0, 0, False
+    for idx, c in enumerate(expr):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0 and expr.startswith("||", idx):
+            hasOr = True
+        elif depth == 0 and expr.startswith("&&", idx):
+            terms.append(expr[begin:idx])
+            begin = idx + 2
+    terms.append(expr[begin:])
+    if hasOr or len(terms) == 1:
+        return [] if expr in ["", "1", "1.", "true"] else [expr]
+    return list(itertools.chain.from_iterable([splitConjuncts(t) for t in terms]))
+
+_ingestReader = None  # Set before forking the ingestion workers
+
+def _ingestShard(shard):
+    """Target of the ingestion workers. Return the partial datasets from (file, first entry in chain, number of entries)."""
+    fname, firstEntry, nEntries = shard
+    reader = _ingestReader
+    reader.ch = TChain("tree")
+    reader.ch.Add(fname)
+    if reader.friend is not None:
+        if reader.isFriendAligned:
+            reader.ch.AddFriend(reader.friend.CopyTree("", "", nEntries, firstEntry))
+        else:
+            reader.ch.AddFriend(reader.friend)  # Index is inherited from the parent
+    reader.dataset = {}
+    reader._fillDataSets(reader._ingestCfg)
+    return reader.dataset
+
 class DataReader(Path):
     """Create RooDataSet from a TChain"""
     def __init__(self, cfg):
@@ -27,7 +203,11 @@ class DataReader(Path):
         super(DataReader, self).reset()
         self.ch = None
         self.friend = None
+        self.isFriendAligned = False
         self.dataset = {}
+        self.columns = {}  # Memory-mapped columns of datasets in the columnar cache
+        self.provenanceDigest = None
+        self.isPreloadValid = None
 
     def __str__(self):
         list_of_files = self.ch.GetListOfFiles()
@@ -45,12 +225,31 @@ class DataReader(Path):
             'ifile': [],
             'ifriend': [],
             'ifriendIndex': ["Run", "Event"],
+            'friendJoin': "index",  # "auto" to use entry-aligned friends, joined by sort-merge if needed
+            'friendCacheDir': None,  # Cache of the friend join, next to the first friend file by default
             'argset': [],
-            'dataset': [],
+            'dataset': [],  # (name, cut) from the chain, or (name, extra cut, parent dataset) derived from a parent
             'preloadFile': None,
+            'preloadFormat': "root",  # "npy" for columnar cache reloaded with mmap, next to preloadFile
+            'lazy': False,  # Create datasets at the first SourceManager.get
+            'singlePass': False,  # Fill all datasets in one loop over the chain
+            'nIngestWorkers': 1,  # Shard input files across worker processes, process.cfg['nIngestWorkers'] takes precedence
+            'cutBuildPath': None,  # Compile cut terms of the single pass into a predicate library cached here
         }
         return cfg
 
+    def inputs(self):
+        """Nothing is read from the source pool."""
+        return self.cfg.get('inputs', [])
+
+    def outputs(self):
+        return self.cfg.get('outputs', list(set(["{0}.*".format(self.name), "{0}.*".format(self.cfg['name'])])))
+
+    def isWorkerSafe(self):
+        """Inline by default, pickling datasets and chains back through a pipe costs more than reading them here.
+        Lazy sources are bound to this process."""
+        return self.cfg.get('runInWorker', False) and not self.cfg.get('lazy', False)
+
     def createDataSet(self, dname, dcut):
         """Create named dataset"""
         if dname in self.dataset.keys():
@@ -64,19 +263,240 @@ class DataReader(Path):
         self.dataset[dname] = data
         return data
 
+    def createDataSetsSinglePass(self, cfg):
+        """Create named datasets in one loop over the chain.
+        Cut strings are split into terms joined by &&, and each distinct term is evaluated once per event."""
+        cfg = [(dname, dcut) for dname, dcut in cfg if dname not in self.dataset.keys()]
+        if not cfg:
+            return self.dataset
+        self._declareSinglePassFiller()
+
+        termKeys = []  # Whitespaces are ignored to find identical terms
+        regionTerms = []
+        for dname, dcut in cfg:
+            regionTerms.append([])
+            for term in splitConjuncts(dcut):
+                key = re.sub(r"\s+", "", term)
+                if key not in termKeys:
+                    termKeys.append(key)
+                regionTerms[-1].append(termKeys.index(key))
+        sharedTerms = set.intersection(*[set(terms) for terms in regionTerms])
+
+        compiledCuts = self._compileTerms(termKeys)
+        filler = ROOT.DataReaderSinglePassFiller(self.ch, self.argset)
+        treeCuts = []  # Owned by python
+        for key in termKeys:
+            if compiledCuts is None:
+                filler.AddTerm(key)
+            else:
+                treeCuts.append(compiledCuts[key].treeCut(self.ch))
+                filler.AddCompiledTerm(treeCuts[-1])
+        for iTerm in sorted(sharedTerms):
+            filler.AddSharedTerm(iTerm)
+        datasets = []
+        for (dname, dcut), terms in zip(cfg, regionTerms):
+            data = RooDataSet(dname, "", self.argset)
+            iRegion = filler.AddRegion(data)
+            for iTerm in terms:
+                if iTerm not in sharedTerms:
+                    filler.AddRegionTerm(iRegion, iTerm)
+            datasets.append((dname, data))
+        nRead = filler.Fill()
+        self.logger.logINFO("{0} datasets are filled in one pass over {1} entries with {2} distinct terms, {3} shared.".format(len(cfg), nRead, len(termKeys), len(sharedTerms)))
+
+        for dname, data in datasets:
+            self.dataset[dname] = data
+        return self.dataset
+
+    def _declareSinglePassFiller(self):
+        if not hasattr(ROOT, 'DataReaderSinglePassFiller'):
+            CutCompiler.declare()
+            ROOT.gInterpreter.Declare(cimp_SinglePassFiller)
+
+    def _compileTerms(self, terms):
+        """Compiled predicates of cut terms in {term: CompiledCut}, None to interpret them by TTreeFormula."""
+        if not self.cfg.get('cutBuildPath', None):
+            return None
+        try:
+            return CutCompiler.compileCuts(terms, self.cfg['cutBuildPath'], self.logger)
+        except RuntimeError as e:
+            self.logger.logWARNING("{0}, cuts are interpreted by TTreeFormula.".format(e))
+            return None
+
+    def provenance(self):
+        """Digest of the input files, cuts, observables and code that the preload cache is built from."""
+        if self.provenanceDigest is None:
+            self.provenanceDigest = digestObj([
+                fileStamps(self.cfg['ifile']),
+                fileStamps(self.cfg['ifriend']),
+                self.cfg['ifriendIndex'],
+                self.cfg['dataset'],
+                self.argset,
+                codeDigest(DataReader, ColumnarCache, CutCompiler, FriendJoin),
+            ])
+        return self.provenanceDigest
+
+    def _preloadPath(self):
+        if self.cfg.get('preloadFormat', "root") == "npy":
+            # Content-addressed, caches of different provenance never overwrite each other.
+            return os.path.join(os.path.splitext(self.cfg['preloadFile'])[0] + ".columns", self.provenance()[:12])
+        return self.cfg['preloadFile']
+
+    def _hasPreload(self):
+        """Check if the preload cache exists and matches the provenance."""
+        if self.isPreloadValid is not None:
+            return self.isPreloadValid
+        if self.cfg.get('preloadFormat', "root") == "npy":
+            manifest = ColumnarCache.readManifest(self._preloadPath())
+            stored = manifest.get('provenance') if manifest is not None else None
+        elif os.path.exists(self._preloadPath()):
+            file_preload = ROOT.TFile(self._preloadPath())
+            tag = file_preload.Get("provenance")
+            stored = tag.GetTitle() if not tag == None else ""
+            file_preload.Close()
+        else:
+            stored = None
+        self.isPreloadValid = stored == self.provenance()
+        if stored is not None and not self.isPreloadValid:
+            self.logger.logINFO("Preload cache {0} is stale and will be rebuilt.".format(self._preloadPath()))
+        return self.isPreloadValid
+
+    def _readPreload(self, name):
+        """Fetch named dataset from the preload cache, None if not available."""
+        if self.cfg.get('preloadFormat', "root") == "npy":
+            columns = ColumnarCache.readColumns(self._preloadPath(), name)
+            if columns is None or not set(ColumnarCache.argNames(self.argset)) <= set(columns.keys()):
+                return None
+            self.columns[name] = columns
+            return ColumnarCache.toDataSet(name, columns, self.argset)
+
+        file_preload = ROOT.TFile(self._preloadPath())
+        data = file_preload.Get(name)
+        file_preload.Close()
+        if data == None:
+            return None
+        return data
+
+    def _writePreload(self):
+        """Write down the datasets to the preload cache."""
+        if self.cfg.get('preloadFormat', "root") == "npy":
+            ColumnarCache.writeDataSets(self._preloadPath(), self.dataset, self.argset, {'provenance': self.provenance()})
+            for dname in self.dataset.keys():
+                self.columns[dname] = ColumnarCache.readColumns(self._preloadPath(), dname)
+        else:
+            # Renamed at last, jobs sharing the cache never see a partial file.
+            tmpFile = "{0}.tmp{1}".format(self._preloadPath(), os.getpid())
+            file_preload = ROOT.TFile(tmpFile, 'RECREATE')
+            for dname, d in self.dataset.items():
+                d.Write()
+            ROOT.TNamed("provenance", self.provenance()).Write()
+            file_preload.Close()
+            os.rename(tmpFile, self._preloadPath())
+        self.isPreloadValid = True
+
+    def _fillDataSets(self, cfg):
+        """Create named datasets from self.ch"""
+        if self.cfg.get('singlePass', False):
+            self.createDataSetsSinglePass(cfg)
+        else:
+            for name, cut in cfg:
+                self.createDataSet(name, cut)
+
+    def _inputFiles(self):
+        """Files in the chain with wildcards expanded."""
+        list_of_files = self.ch.GetListOfFiles()
+        next_file = TIter(list_of_files)
+        return [next_file().GetTitle() for f in range(list_of_files.GetEntries())]
+
+    def createDataSetsParallel(self, cfg, nWorkers):
+        """Create named datasets with input files sharded across worker processes.
+        Partial datasets are merged following the order of files, same as a serial read."""
+        global _ingestReader
+        fnames = self._inputFiles()
+        self.ch.GetEntries()  # Load offsets of all trees
+        offsets = self.ch.GetTreeOffset()
+        shards = [(fname, offsets[idx], offsets[idx + 1] - offsets[idx]) for idx, fname in enumerate(fnames)]
+        if self.cfg.get('singlePass', False):
+            # Compiled once for all workers
+            self._declareSinglePassFiller()
+            self._compileTerms(list(set([re.sub(r"\s+", "", term) for dname, dcut in cfg for term in splitConjuncts(dcut)])))
+
+        _ingestReader = self
+        self._ingestCfg = cfg
+        pool = multiprocessing.Pool(min(nWorkers, len(fnames)))
+        try:
+            parts = pool.map(_ingestShard, shards, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _ingestReader = None
+
+        for dname, dcut in cfg:
+            data = parts[0][dname].emptyClone(dname)
+            for part in parts:
+                data.append(part[dname])
+            self.dataset[dname] = data
+        self.logger.logINFO("{0} datasets are created from {1} files with {2} workers.".format(len(cfg), len(fnames), min(nWorkers, len(fnames))))
+        return self.dataset
+
+    def createDerivedDataSet(self, dname, dcut, parent):
+        """Create named dataset by reducing a parent dataset in memory, the chain is not read."""
+        if dname in self.dataset.keys():
+            return self.dataset[dname]
+        if parent not in self.dataset.keys():
+            self.createDataSets([entry for entry in self.cfg['dataset'] if entry[0] == parent])
+        data = self.dataset[parent].reduce(ROOT.RooFit.Cut(dcut), ROOT.RooFit.Name(dname))
+        self.dataset[dname] = data
+        return data
+
     def createDataSets(self, cfg):
         """Create named dataset"""
-        for name, cut in cfg:
-            if self.cfg['preloadFile'] and os.path.exists(self.cfg['preloadFile']):
-                file_preload = ROOT.TFile(self.cfg['preloadFile'])
-                data = file_preload.Get(name)
-                if not data == None:
-                    self.dataset[name] = data
-                file_preload.Close()
-            self.createDataSet(name, cut)
+        for entry in cfg:
+            if self.cfg['preloadFile'] and self._hasPreload():
+                data = self._readPreload(entry[0])
+                if data is not None:
+                    self.dataset[entry[0]] = data
+        derived = [entry for entry in cfg if len(entry) > 2 and entry[0] not in self.dataset.keys()]
+        cfg = [(entry[0], entry[1]) for entry in cfg if len(entry) == 2 and entry[0] not in self.dataset.keys()]
+        if cfg:
+            self._createDataSetsFromChain(cfg)
+        for dname, dcut, parent in derived:
+            self.createDerivedDataSet(dname, dcut, parent)
+        return self.dataset
+
+    def _createDataSetsFromChain(self, cfg):
+        """Create named datasets reading the chain, serially or with ingestion workers."""
+        nWorkers = self.process.cfg.get('nIngestWorkers', self.cfg.get('nIngestWorkers', 1)) or 1
+        if nWorkers > 1 and multiprocessing.current_process().daemon:
+            self.logger.logDEBUG("Daemonic process cannot fork ingestion workers, {0} reads serially.", self.name)
+            nWorkers = 1
+        # Implicit MT breaks reading fat trees into RooDataSet, and thread pools do not survive forking.
+        with suspendImplicitMT(self.logger):
+            if nWorkers > 1 and len(self._inputFiles()) > 1:
+                self.createDataSetsParallel(cfg, nWorkers)
+            else:
+                self._fillDataSets(cfg)
         return self.dataset
 
+    def _createLazyDataSet(self, entry):
+        """Factory of a lazy source, preloadFile is read but not written."""
+        return self.createDataSets([entry])[entry[0]]
+
+    def _friendCacheFile(self):
+        """Cache of the friend join, keyed on the input files and the index."""
+        cacheDir = self.cfg.get('friendCacheDir', None)
+        if cacheDir is None:
+            list_of_files = self.friend.GetListOfFiles()
+            cacheDir = os.path.dirname(list_of_files.At(0).GetTitle()) if list_of_files.GetEntries() > 0 else "."
+            if not os.access(cacheDir, os.W_OK):
+                cacheDir = "."
+        key = digestObj([fileStamps(self.cfg['ifile']), fileStamps(self.cfg['ifriend']), self.cfg['ifriendIndex']])
+        return os.path.join(cacheDir, "friendJoin_{0}.root".format(key[:12]))
+
     def _runPath(self):
+        if self.cfg.get('preloadFormat', "root") == "npy" and not ColumnarCache.isAvailable():
+            self.logger.logWARNING("numpy is not available, {0} falls back to ROOT preloadFile.".format(self.name))
+            self.cfg['preloadFormat'] = "root"
         self.ch = TChain("tree")
         for f in self.cfg['ifile']:
             self.ch.Add(f)
@@ -84,18 +504,23 @@ class DataReader(Path):
             self.friend = TChain("tree")
             for f in self.cfg['ifriend']:
                 self.friend.Add(f)
-            self.friend.BuildIndex(*self.cfg['ifriendIndex'])
+            if self.cfg.get('friendJoin', "index") == "auto":
+                aligned = FriendJoin.alignFriend(self.ch, self.friend, self.cfg['ifriendIndex'], self._friendCacheFile(), self.logger)
+                if aligned is not None:
+                    self.friend = aligned
+                    self.isFriendAligned = True
+            if not self.isFriendAligned:
+                self.friend.BuildIndex(*self.cfg['ifriendIndex'])
             self.ch.AddFriend(self.friend)
-        self.createDataSets(self.cfg['dataset'])
+        if not self.cfg.get('lazy', False):
+            self.createDataSets(self.cfg['dataset'])
         pass
 
     def _addSource(self):
         """Add dataset and arguments to source pool"""
-        if self.cfg['preloadFile'] and not os.path.exists(self.cfg['preloadFile']):
-            file_preload = ROOT.TFile(self.cfg['preloadFile'], 'RECREATE')
-            for dname, d in self.dataset.items():
-                d.Write()
-            file_preload.Close()
+        # Lazy readers have created no dataset yet, an empty cache would be taken as valid.
+        if self.cfg['preloadFile'] and not self.cfg.get('lazy', False) and not self._hasPreload():
+            self._writePreload()
 
         if not 'source' in self.cfg.keys():
             self.cfg['source'] = {}
@@ -103,7 +528,19 @@ class DataReader(Path):
         self.cfg['source']['{0}.argset'.format(self.name)] = self.argset
         if len(self.cfg['ifriend']) > 0:
             self.cfg['source']['{0}.friend'.format(self.name)] = self.friend
+        if self.cfg.get('lazy', False):
+            for entry in self.cfg['dataset']:
+                self.cfg['source'][entry[0]] = LazySource(functools.partial(self._createLazyDataSet, entry))
         for dname, d in self.dataset.items():
             self.cfg['source'][dname] = d
             self.logger.logINFO("{0} events in {1}.".format(d.sumEntries(), dname))
+        for dname, columns in self.columns.items():
+            self.cfg['source']['{0}.columns'.format(dname)] = columns
         super(DataReader, self)._addSource()
+
+    def _dropSource(self, key):
+        super(DataReader, self)._dropSource(key)
+        self.dataset.pop(key, None)
+        self.columns.pop(key, None)
+        if key.endswith(".columns"):
+            self.columns.pop(key[:-len(".columns")], None)
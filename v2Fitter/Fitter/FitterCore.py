@@ -3,7 +3,11 @@
 # vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
 
 import re
+import math
 
+from ROOT import RooFit
+from ROOT import RooArgSet
+from ROOT import RooDataHist
 from ROOT import RooMinimizer
 from v2Fitter.FlowControl.Path import Path
 
@@ -22,22 +26,157 @@ Following functions to be overloaded to customize the full procedure...
         super(FitterCore, self).reset()
         self.pdf = None
         self.data = None
+        self.unbinnedData = None
         self._nll = None
         self.minimizer = None
 
+    @staticmethod
+    def _flattenKeys(keys):
+        """Source keys from cfg['data'] or cfg['pdf'], which could be nested lists."""
+        if isinstance(keys, str):
+            return [keys]
+        output = []
+        for key in keys:
+            output.extend(FitterCore._flattenKeys(key))
+        return output
+
+    def inputs(self):
+        """Data and pdf, plus cfg['inputs'], e.g. pdfs with parameters determined by upstream fitters.
+        Unknown unless cfg['inputs'] is declared since fitters share parameters and the DB."""
+        if self.cfg.get('inputs', None) is None:
+            return None
+        return self._flattenKeys(self.cfg['data']) + self._flattenKeys(self.cfg['pdf']) + self.cfg['inputs']
+
+    def outputs(self):
+        """Fit results and the pdf with floating parameters, plus cfg['outputs']."""
+        if self.cfg.get('inputs', None) is None:
+            return None
+        return ["{0}.*".format(self.name)] + self._flattenKeys(self.cfg['pdf']) + self.cfg.get('outputs', [])
+
+    def isCheckpointable(self):
+        """Fit results are restored by _importState, which supports single pdf only."""
+        return self.cfg.get('checkpoint', isinstance(self.cfg['pdf'], str))
+
+    def _exportState(self):
+        """Parameters after fitting."""
+        state = {}
+        if getattr(self, 'args', None) is None:
+            return state
+        def exportOne(arg):
+            try:
+                state[arg.GetName()] = (arg.getVal(), arg.getError(), arg.getErrorLo(), arg.getErrorHi(), arg.isConstant())
+            except AttributeError:
+                pass
+        FitterCore.ArgLooper(self.args, exportOne)
+        return state
+
+    def _importState(self, state):
+        """Copy the parameters fitted in a worker process, or restored from a cache, as self.args."""
+        if not state or not isinstance(self.cfg['pdf'], str):
+            return
+        args = self.process.sourcemanager.get(self.cfg['pdf']).getVariables()
+        self.args = RooArgSet()
+        for argName, (val, err, errLo, errHi, isConst) in state.items():
+            arg = args.find(argName)
+            if arg == None:
+                continue
+            arg.setVal(val)
+            arg.setError(err)
+            arg.setAsymError(errLo, errHi)
+            arg.setConstant(isConst)
+            self.args.add(arg)
+
+    def _modifiedSources(self):
+        """The pdf is re-tagged with the fitted parameters, which are restored by _importState as well."""
+        if not isinstance(self.cfg['pdf'], str) or self.cfg['pdf'] not in self.process.sourcemanager:
+            return {}
+        return {self.cfg['pdf']: self._exportState()}
+
+    def _dropSource(self, key):
+        """Drop the dataset and the NLL built on it as well, otherwise the spilled or released data stay in memory."""
+        super(FitterCore, self)._dropSource(key)
+        if key in self._flattenKeys(self.cfg['data']):
+            self._dropData()
+
+    def _dropData(self):
+        self.data = None
+        self.unbinnedData = None
+        self._nll = None
+
     def _bookPdfData(self):
+        """Book pdf and data, the data is pruned to cfg['observables'] if declared."""
         self.pdf = self.process.sourcemanager.get(self.cfg['pdf'])
+        observables = self.cfg.get('observables', None)
         if not hasattr(self.cfg['data'], "__iter__"):
-            self.data = self.process.sourcemanager.get(self.cfg['data'])
+            self.data = self.process.sourcemanager.get(self.cfg['data'], observables=observables)
         elif len(self.cfg['data']) <= 1:
-            self.data = self.process.sourcemanager.get(self.cfg['data'][0])
+            self.data = self.process.sourcemanager.get(self.cfg['data'][0], observables=observables)
         else:
             # Alternative way to merge list of input data/toy
             for data in self.cfg['data']:
                 if self.data is not None:
-                    self.data.append(self.process.sourcemanager.get(data))
+                    self.data.append(self.process.sourcemanager.get(data, observables=observables))
                 else:
-                    self.data = self.process.sourcemanager.get(data).Clone()
+                    self.data = self.process.sourcemanager.get(data, observables=observables).Clone()
+
+    def _createBinnedData(self, data):
+        """RooDataHist of data projected to the observables in cfg['binning']."""
+        obs = RooArgSet()
+        for name, nBins in self.cfg['binning'].items():
+            var = data.get().find(name)
+            if var == None:
+                self.logger.logERROR("No observable {0} in {1}".format(name, data.GetName()))
+                raise KeyError(name)
+            obs.add(var)
+        obs = obs.snapshot()
+        for name, nBins in self.cfg['binning'].items():
+            obs.find(name).setBins(nBins)
+        return RooDataHist("{0}_binned".format(data.GetName()), data.GetTitle(), obs, data)
+
+    def _bookBinnedData(self):
+        """Replace an unbinned dataset by a fine RooDataHist if cfg['binning'] is given,
+        the NLL then scales with the number of bins instead of the number of events."""
+        if not self.cfg.get('binning', None) or not self.data.InheritsFrom("RooDataSet"):
+            return
+        self.unbinnedData = self.data
+        self.data = self._createBinnedData(self.unbinnedData)
+        self.logger.logINFO("Fit binned likelihood with {0} bins from {1} events".format(self.data.numEntries(), self.unbinnedData.numEntries()))
+
+    def _checkBinnedData(self):
+        """Compare binned and unbinned fits to the first cfg['binnedCheck'] events,
+        fall back to the unbinned dataset if any floating parameter shifts more than cfg['binnedCheckTolerance'] of its error.
+        The binning bias does not shrink with the sample size, hence the error is scaled to the full dataset by sqrt(nSub/nFull)."""
+        nEvents = self.cfg.get('binnedCheck', 0)
+        if self.unbinnedData is None or not nEvents:
+            return
+        subData = self.unbinnedData.reduce(RooFit.EventRange(0, nEvents))
+        args = self.pdf.getParameters(subData)
+        initArgs = args.snapshot()
+        fitResults = []
+        for data in [subData, self._createBinnedData(subData)]:
+            args.assignValueOnly(initArgs)
+            nll = self.pdf.createNLL(data, *(self.cfg.get('createNLLOpt', [])))
+            minimizer = RooMinimizer(nll)
+            minimizer.setPrintLevel(-1)
+            minimizer.migrad()
+            minimizer.hesse()
+            fitResults.append(minimizer.save())
+        args.assignValueOnly(initArgs)
+        errScale = math.sqrt(float(subData.numEntries()) / self.unbinnedData.numEntries())
+
+        maxShift = 0.
+        unbinnedArgs, binnedArgs = fitResults[0].floatParsFinal(), fitResults[1].floatParsFinal()
+        for iArg in range(unbinnedArgs.getSize()):
+            arg = unbinnedArgs.at(iArg)
+            if arg.getError() > 0:
+                maxShift = max(maxShift, abs(binnedArgs.find(arg.GetName()).getVal() - arg.getVal()) / (arg.getError() * errScale))
+        if maxShift > self.cfg.get('binnedCheckTolerance', 0.2):
+            self.logger.logWARNING("Binned fit shifts parameters by {0:.2f} sigma of the full dataset on {1} events, fall back to unbinned fit.".format(maxShift, subData.numEntries()))
+            self.data = self.unbinnedData
+            self.unbinnedData = None
+            self._bookMinimizer()
+        else:
+            self.logger.logINFO("Binned fit shifts parameters by at most {0:.2f} sigma on {1} events.".format(maxShift, subData.numEntries()))
 
     def _bookMinimizer(self):
         """Bind a RooMinimizer object to bind to self.minimizer at Runtime"""
@@ -96,13 +235,19 @@ Following functions to be overloaded to customize the full procedure...
             'pdf': "f",
             'argPattern': [r'^.+$'],
             'createNLLOpt': [],
+            'observables': None,  # Names of observables used by pdf, None to keep all columns of data.
+            'binning': None,  # {observable: nBins} to fit a binned likelihood, None for unbinned fit.
+            'binnedCheck': 0,  # Number of events to validate the binned fit against the unbinned one, 0 to skip.
+            'binnedCheckTolerance': 0.2,  # Max shift of parameters in unit of the error with the full dataset in the validation.
         }
         return cfg
 
     def _runPath(self):
         """Stardard fitting procedure to be overlaoded."""
         self._bookPdfData()
+        self._bookBinnedData()
         self._bookMinimizer()
         self._preFitSteps()
+        self._checkBinnedData()
         self._runFitSteps()
         self._postFitSteps()
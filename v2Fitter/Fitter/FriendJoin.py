@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=1 fdn=3 ft=python et:
+
+# Description     : Entry-aligned friend trees without per-entry index lookups
+
+import os
+
+import ROOT
+from ROOT import TChain
+
+cimp_FriendJoin = """
+#include <vector>
+#include <utility>
+#include <algorithm>
+#include "TFile.h"
+#include "TTree.h"
+#include "TTreeFormula.h"
+
+// Sort-merge join of a friend tree on (major, minor) keys.
+class DataReaderFriendJoin {
+public:
+    typedef std::pair<double, double> Key;
+    DataReaderFriendJoin(TTree *tree, TTree *friendTree, const char *major, const char *minor) : fFriend(friendTree) {
+        ReadKeys(tree, major, minor, fKeys);
+        ReadKeys(friendTree, major, minor, fFriendKeys);
+    }
+    // Same keys entry by entry
+    bool IsAligned() const { return fKeys == fFriendKeys; }
+    // Map each entry to the first friend entry with the same key, return number of unmatched entries.
+    Long64_t Join() {
+        std::vector<Long64_t> order(fKeys.size()), friendOrder(fFriendKeys.size());
+        for (size_t i = 0; i < order.size(); ++i) order[i] = i;
+        for (size_t i = 0; i < friendOrder.size(); ++i) friendOrder[i] = i;
+        std::stable_sort(order.begin(), order.end(), KeyLess(fKeys));
+        std::stable_sort(friendOrder.begin(), friendOrder.end(), KeyLess(fFriendKeys));
+
+        fMapping.assign(fKeys.size(), -1);
+        Long64_t nUnmatched = 0;
+        size_t j = 0;
+        for (size_t i = 0; i < order.size(); ++i) {
+            const Key &key = fKeys[order[i]];
+            while (j < friendOrder.size() && fFriendKeys[friendOrder[j]] < key) ++j;
+            if (j < friendOrder.size() && fFriendKeys[friendOrder[j]] == key) {
+                fMapping[order[i]] = friendOrder[j];
+            } else {
+                ++nUnmatched;
+            }
+        }
+        return nUnmatched;
+    }
+    // Copy friend entries following the order of the main tree.
+    void WriteAligned(TFile *ofile, const char *name) {
+        ofile->cd();
+        TTree *out = fFriend->CloneTree(0);
+        out->SetName(name);
+        for (size_t i = 0; i < fMapping.size(); ++i) {
+            fFriend->GetEntry(fMapping[i]);
+            out->Fill();
+        }
+        out->Write();
+    }
+private:
+    struct KeyLess {
+        const std::vector<Key> &keys;
+        KeyLess(const std::vector<Key> &k) : keys(k) {}
+        bool operator()(Long64_t a, Long64_t b) const { return keys[a] < keys[b]; }
+    };
+    static void ReadKeys(TTree *tree, const char *major, const char *minor, std::vector<Key> &keys) {
+        tree->LoadTree(0);
+        TTreeFormula fMajor("major", major, tree), fMinor("minor", minor, tree);
+        int treeNumber = -1;
+        for (Long64_t entry = 0; tree->LoadTree(entry) >= 0; ++entry) {
+            if (tree->GetTreeNumber() != treeNumber) {
+                treeNumber = tree->GetTreeNumber();
+                fMajor.UpdateFormulaLeaves();
+                fMinor.UpdateFormulaLeaves();
+            }
+            fMajor.GetNdata();
+            fMinor.GetNdata();
+            keys.push_back(Key(fMajor.EvalInstance(0), fMinor.EvalInstance(0)));
+        }
+    }
+    TTree *fFriend;
+    std::vector<Key> fKeys;
+    std::vector<Key> fFriendKeys;
+    std::vector<Long64_t> fMapping;
+};
+"""
+
+def alignFriend(ch, friend, index, cacheFile, logger):
+    """Return a friend of ch aligned entry by entry, None if an index join is still needed.
+
+The result is cached in cacheFile, which holds either a marker if the friend is already aligned,
+or a copy of the friend following the order of ch from a sort-merge join."""
+    if os.path.exists(cacheFile):
+        fin = ROOT.TFile(cacheFile)
+        isAligned = not fin.Get("aligned") == None
+        hasTree = not fin.Get("tree") == None
+        fin.Close()
+        if isAligned:
+            return friend
+        if hasTree:
+            aligned = TChain("tree")
+            aligned.Add(cacheFile)
+            return aligned
+
+    if not hasattr(ROOT, 'DataReaderFriendJoin'):
+        ROOT.gInterpreter.Declare(cimp_FriendJoin)
+    join = ROOT.DataReaderFriendJoin(ch, friend, *index)
+    if join.IsAligned():
+        logger.logINFO("Friend is aligned with the main tree by entry.")
+        aligned = friend
+    else:
+        nUnmatched = join.Join()
+        if nUnmatched > 0:
+            logger.logWARNING("{0} entries have no match in the friend, fall back to index join.".format(nUnmatched))
+            return None
+        aligned = None
+
+    tmpFile = "{0}.tmp{1}".format(cacheFile, os.getpid())
+    ofile = ROOT.TFile(tmpFile, 'RECREATE')
+    if ofile.IsZombie():
+        logger.logWARNING("Cannot write {0}, the join is not cached.".format(tmpFile))
+        return aligned  # None for index join if not aligned
+    if aligned is None:
+        join.WriteAligned(ofile, "tree")
+    else:
+        ROOT.TNamed("aligned", "").Write()
+    ofile.Close()
+    os.rename(tmpFile, cacheFile)
+    logger.logINFO("Friend join is cached in {0}".format(cacheFile))
+
+    if aligned is None:
+        aligned = TChain("tree")
+        aligned.Add(cacheFile)
+    return aligned
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=1 fdn=3 ft=python et:
+
+# Description     : Streaming histogram filler for large generator-level samples
+
+import os
+
+import ROOT
+from ROOT import TChain
+
+from v2Fitter.FlowControl.PathCache import digestObj, fileStamps, codeDigest
+from v2Fitter.FlowControl.SourceManager import FileManager
+
+cimp_GenLevelFiller = """
+#include <vector>
+#include <algorithm>
+#include "TTree.h"
+#include "TTreeFormula.h"
+#include "TH1.h"
+#include "TH2.h"
+
+// Fill histograms in one pass of a tree, cuts and variables are shared and evaluated at most once per entry.
+// A category maps a variable to the index of the interval between sorted edges, looked up once per entry.
+class GenLevelReaderFiller {
+public:
+    GenLevelReaderFiller(TTree *tree) : fTree(tree), fTreeNumber(-1) { fTree->LoadTree(0); }
+    ~GenLevelReaderFiller() {
+        for (size_t i = 0; i < fFormulas.size(); ++i) delete fFormulas[i];
+    }
+    // Return the index of the formula, -1 if not valid.
+    int AddFormula(const char *expr) {
+        TTreeFormula *formula = new TTreeFormula(Form("genLevelFormula%d", (int)fFormulas.size()), expr, fTree);
+        if (formula->GetNdim() == 0) {
+            delete formula;
+            return -1;
+        }
+        fFormulas.push_back(formula);
+        fValues.push_back(0.);
+        fIsEvaluated.push_back(false);
+        return fFormulas.size() - 1;
+    }
+    // Set y < 0 for 1D histograms.
+    void AddHist(TH1 *hist, int x, int y, int weight) {
+        fHists.push_back(hist);
+        fXs.push_back(x);
+        fYs.push_back(y);
+        fWeights.push_back(weight);
+        fCuts.push_back(std::vector<int>());
+        fHistCategories.push_back(-1);
+        fHistIndices.push_back(std::vector<int>());
+    }
+    void AddHistCut(int cut) { fCuts.back().push_back(cut); }
+    int AddCategory(int formula) {
+        fCategoryFormulas.push_back(formula);
+        fCategoryEdges.push_back(std::vector<double>());
+        fCategoryIndices.push_back(-1);
+        fIsCategorized.push_back(false);
+        return fCategoryFormulas.size() - 1;
+    }
+    void AddCategoryEdge(double edge) { fCategoryEdges.back().push_back(edge); }
+    // Accept entries of the last histogram in any of the given intervals.
+    void AddHistCategoryIndex(int category, int index) {
+        fHistCategories.back() = category;
+        fHistIndices.back().push_back(index);
+    }
+    // Return number of entries processed.
+    Long64_t Fill() {
+        Long64_t entry = 0;
+        for (; fTree->LoadTree(entry) >= 0; ++entry) {
+            if (fTree->GetTreeNumber() != fTreeNumber) {
+                fTreeNumber = fTree->GetTreeNumber();
+                for (size_t i = 0; i < fFormulas.size(); ++i) fFormulas[i]->UpdateFormulaLeaves();
+            }
+            std::fill(fIsEvaluated.begin(), fIsEvaluated.end(), false);
+            std::fill(fIsCategorized.begin(), fIsCategorized.end(), false);
+            for (size_t h = 0; h < fHists.size(); ++h) {
+                if (fHistCategories[h] >= 0) {
+                    int index = Categorize(fHistCategories[h]);
+                    if (std::find(fHistIndices[h].begin(), fHistIndices[h].end(), index) == fHistIndices[h].end()) continue;
+                }
+                bool isPassed = true;
+                for (size_t c = 0; isPassed && c < fCuts[h].size(); ++c) isPassed = Eval(fCuts[h][c]) != 0;
+                if (!isPassed) continue;
+                if (fYs[h] < 0) {
+                    fHists[h]->Fill(Eval(fXs[h]), Eval(fWeights[h]));
+                } else {
+                    static_cast<TH2*>(fHists[h])->Fill(Eval(fXs[h]), Eval(fYs[h]), Eval(fWeights[h]));
+                }
+            }
+        }
+        return entry;
+    }
+private:
+    double Eval(int i) {
+        if (!fIsEvaluated[i]) {
+            fFormulas[i]->GetNdata();
+            fValues[i] = fFormulas[i]->EvalInstance(0);
+            fIsEvaluated[i] = true;
+        }
+        return fValues[i];
+    }
+    int Categorize(int c) {
+        if (!fIsCategorized[c]) {
+            const std::vector<double> &edges = fCategoryEdges[c];
+            int index = std::upper_bound(edges.begin(), edges.end(), Eval(fCategoryFormulas[c])) - edges.begin() - 1;
+            fCategoryIndices[c] = index < (int)edges.size() - 1 ? index : -1;
+            fIsCategorized[c] = true;
+        }
+        return fCategoryIndices[c];
+    }
+    TTree *fTree;
+    int fTreeNumber;
+    std::vector<TTreeFormula*> fFormulas;
+    std::vector<double> fValues;
+    std::vector<bool> fIsEvaluated;
+    std::vector<TH1*> fHists;
+    std::vector<int> fXs, fYs, fWeights;
+    std::vector<std::vector<int> > fCuts;
+    std::vector<int> fHistCategories;
+    std::vector<std::vector<int> > fHistIndices;
+    std::vector<int> fCategoryFormulas;
+    std::vector<std::vector<double> > fCategoryEdges;
+    std::vector<int> fCategoryIndices;
+    std::vector<bool> fIsCategorized;
+};
+"""
+
+def _axisSpec(axis):
+    edges = axis.GetXbins()
+    if edges.GetSize() > 0:
+        return [edges.At(i) for i in range(edges.GetSize())]
+    return [axis.GetNbins(), axis.GetXmin(), axis.GetXmax()]
+
+def histsDigest(ifiles, specs, treeName="tree"):
+    """Digest of the inputs and the histogram definitions."""
+    return digestObj([
+        treeName,
+        fileStamps(ifiles),
+        [(spec['hist'].GetName(), spec['hist'].ClassName(), _axisSpec(spec['hist'].GetXaxis()), _axisSpec(spec['hist'].GetYaxis()),
+          spec.get('cuts', []), spec['x'], spec.get('y', None), spec.get('weight', "1"), spec.get('category', None)) for spec in specs],
+        codeDigest(histsDigest),
+    ])
+
+def fillHists(ifiles, specs, treeName="tree", logger=None):
+    """Fill histograms of specs in a single pass over ifiles.
+
+Each spec is a dict with
+    'hist': An empty TH1 or TH2 to be filled,
+    'cuts': List of cuts to be passed, same cuts are evaluated once for all histograms,
+    'x', 'y': Variables to fill, set 'y' to None for TH1,
+    'weight': Weight of entries, "1" by default,
+    'category': Optional (variable, sorted edges, indices), entries with the variable in [edges[i], edges[i+1]) for any i in indices are accepted.
+        The interval is looked up once per entry for all histograms sharing the variable and edges."""
+    ch = TChain(treeName)
+    for f in ifiles:
+        ch.Add(f)
+    if not hasattr(ROOT, 'GenLevelReaderFiller'):
+        ROOT.gInterpreter.Declare(cimp_GenLevelFiller)
+    filler = ROOT.GenLevelReaderFiller(ch)
+
+    formulas = {}
+    def formulaIndex(expr):
+        if expr not in formulas:
+            formulas[expr] = filler.AddFormula(expr)
+            if formulas[expr] < 0:
+                raise ValueError("Invalid formula {0}".format(expr))
+        return formulas[expr]
+    categories = {}
+    def categoryIndex(expr, edges):
+        key = (expr, tuple(edges))
+        if key not in categories:
+            formula = formulaIndex(expr)
+            categories[key] = filler.AddCategory(formula)
+            for edge in edges:
+                filler.AddCategoryEdge(edge)
+        return categories[key]
+    for spec in specs:
+        spec['hist'].SetDirectory(0)
+        y = spec.get('y', None)
+        category = None if spec.get('category', None) is None else categoryIndex(*spec['category'][:2])
+        filler.AddHist(spec['hist'], formulaIndex(spec['x']), -1 if y is None else formulaIndex(y), formulaIndex(spec.get('weight', "1")))
+        for cut in spec.get('cuts', []):
+            filler.AddHistCut(formulaIndex(cut))
+        if category is not None:
+            for index in spec['category'][2]:
+                filler.AddHistCategoryIndex(category, index)
+
+    nEntries = filler.Fill()
+    if logger is not None:
+        logger.logINFO("Filled {0} histograms with {1} entries in a single pass.", len(specs), nEntries)
+    return nEntries
+
+def getHists(ifiles, specs, cacheDir, treeName="tree", logger=None):
+    """Histograms of specs in {name: hist}, filled by fillHists or read from a cache file keyed on histsDigest."""
+    cacheFile = os.path.join(cacheDir, "genLevelHists_{0}.root".format(histsDigest(ifiles, specs, treeName)[:12]))
+    if not os.path.exists(cacheDir):
+        try:
+            os.makedirs(cacheDir)
+        except OSError:
+            pass  # Created by a concurrent job
+    with FileManager.lock(cacheFile):
+        if not os.path.exists(cacheFile):
+            fillHists(ifiles, specs, treeName, logger)
+            tmpFile = "{0}.tmp{1}".format(cacheFile, os.getpid())
+            ofile = ROOT.TFile(tmpFile, 'RECREATE')
+            for spec in specs:
+                spec['hist'].Write()
+            ofile.Close()
+            os.rename(tmpFile, cacheFile)
+            if logger is not None:
+                logger.logINFO("Histograms are cached in {0}", cacheFile)
+
+    output = {}
+    fin = ROOT.TFile(cacheFile)
+    for spec in specs:
+        name = spec['hist'].GetName()
+        output[name] = fin.Get(name).Clone(name)
+        output[name].SetDirectory(0)
+    fin.Close()
+    return output
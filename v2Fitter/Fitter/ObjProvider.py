@@ -31,4 +31,4 @@ class ObjProvider(Path):
                     if self.cfg['source'].has_key(key):
                         break
             else:
-                self.logger.logDEBUG("Skipped booked object {0}.".format(key))
+                self.logger.logDEBUG("Skipped booked object {0}.", key)
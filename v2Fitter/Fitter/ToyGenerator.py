@@ -4,6 +4,7 @@
 
 import os
 from v2Fitter.FlowControl.Path import Path
+from v2Fitter.FlowControl.PathCache import digestObj, codeDigest
 import ROOT
 
 class ToyGenerator(Path):
@@ -19,6 +20,7 @@ class ToyGenerator(Path):
         self.pdf = None
         self.argset = None
         self.data = None
+        self.isPreloaded = False
 
     @classmethod
     def templateConfig(cls):
@@ -31,18 +33,58 @@ class ToyGenerator(Path):
             'generateOpt': [],
             'mixWith': "ToyGenerator.mixedToy",
             'saveAs': None,
-            'preloadFiles': None,  # Fetch RooDataSet from a list of root files
+            'preloadFiles': None,  # Fetch RooDataSet from a list of root files with matching provenance
         }
         return cfg
 
+    def inputs(self):
+        """The pdf and the dataset to mix with, plus cfg['inputs']. Unknown unless cfg['inputs'] is declared."""
+        if self.cfg.get('inputs', None) is None:
+            return None
+        return [self.cfg['pdf'], self.cfg['mixWith']] + self.cfg['inputs']
+
+    def provenance(self):
+        """Digest of the pdf, its parameters, the generation options and the code."""
+        params = []
+        params_it = self.pdf.getParameters(self.argset).createIterator()
+        param = params_it.Next()
+        while param:
+            params.append((param.GetName(), param.getVal() if hasattr(param, 'getVal') else param.getIndex()))
+            param = params_it.Next()
+        return digestObj([
+            self.pdf,
+            self.argset,
+            sorted(params),
+            self.cfg['expectedYields'],
+            self.cfg['scale'],
+            self.cfg.get('generateOpt', []),
+            codeDigest(ToyGenerator),
+        ])
+
+    def _isPreloadValid(self, fname, provenance):
+        if not os.path.exists(fname):
+            return False
+        fin = ROOT.TFile(fname)
+        try:
+            tag = fin.Get("provenance")
+            if tag == None or tag.GetTitle() != provenance:
+                self.logger.logINFO("Preloaded toy {0} is stale and will not be used.".format(fname))
+                return False
+        finally:
+            fin.Close()
+        return True
+
     def _runPath(self):
         """Generate toy without mixing"""
-        if not hasattr(self, 'pdf'):
+        if not hasattr(self, 'pdf') or self.pdf is None:
             self.pdf = self.process.sourcemanager.get(self.cfg['pdf'])
-        if not hasattr(self, 'argset'):
+        if not hasattr(self, 'argset') or self.argset is None:
             self.argset = self.cfg['argset']
-        if self.cfg['preloadFiles'] and any([os.path.exists(f) for f in self.cfg['preloadFiles']]):
-            for f in self.cfg['preloadFiles']:
+        provenance = self.provenance()
+        preloadFiles = [f for f in self.cfg['preloadFiles'] if self._isPreloadValid(f, provenance)] if self.cfg['preloadFiles'] else []
+        self.isPreloaded = len(preloadFiles) > 0
+        if self.isPreloaded:
+            for f in preloadFiles:
                 try:
                     fin = ROOT.TFile(f)
                     data = fin.Get("{0}Data".format(self.pdf.GetName()))
@@ -65,10 +107,14 @@ class ToyGenerator(Path):
 
     def _addSource(self):
         """Mixing generated toy and update source"""
-        if self.cfg['saveAs'] and (not self.cfg['preloadFiles'] or not any([os.path.exists(f) for f in self.cfg['preloadFiles']])):
-            ofile = ROOT.TFile(self.cfg['saveAs'], 'RECREATE')
+        if self.cfg['saveAs'] and not self.isPreloaded:
+            # Renamed at last, jobs sharing the file never see a partial one.
+            tmpFile = "{0}.tmp{1}".format(self.cfg['saveAs'], os.getpid())
+            ofile = ROOT.TFile(tmpFile, 'RECREATE')
             self.data.Write()
+            ROOT.TNamed("provenance", self.provenance()).Write()
             ofile.Close()
+            os.rename(tmpFile, self.cfg['saveAs'])
 
         if self.cfg['mixWith'] in self.process.sourcemanager:
             self.process.sourcemanager.get(self.cfg['mixWith']).append(self.data)
@@ -39,6 +39,15 @@ class WspaceReader(Path):
         }
         return cfg
 
+    def inputs(self):
+        """Unknown if no `obj` is specified since all objects in the workspace are booked."""
+        if self.cfg['obj']:
+            return ["wspace.*"] + list(self.cfg['obj'].keys())
+        return None
+
+    def outputs(self):
+        return self.inputs()
+
     def _runPath(self):
         # Hook to registerd file
         fileName = self.cfg.get('fileName', "")
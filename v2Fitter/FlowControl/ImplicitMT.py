@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
+
+# Description     : Scoped ROOT implicit multithreading
+
+from __future__ import print_function
+
+from contextlib import contextmanager
+
+import ROOT
+
+# ROOT.EnableImplicitMT enables parallel unzipping of TTree branches as well,
+# which breaks RooDataSet created from a fat tree. Keep it active only around RDataFrame computations.
+
+@contextmanager
+def implicitMT(nThreads=0, logger=None):
+    """Enable implicit multithreading with nThreads (0 for all cores) in the scope, None to stay serial.
+    An outer scope or a global setting is left untouched.
+    Both the construction and the event loop of an RDataFrame should happen in the scope."""
+    if nThreads is None or ROOT.ROOT.IsImplicitMTEnabled():
+        yield
+        return
+    ROOT.ROOT.EnableImplicitMT(nThreads)
+    if logger is not None:
+        logger.logDEBUG("Implicit MT is enabled with {0} threads.", ROOT.ROOT.GetImplicitMTPoolSize())
+    try:
+        yield
+    finally:
+        ROOT.ROOT.DisableImplicitMT()
+
+@contextmanager
+def suspendImplicitMT(logger=None):
+    """Disable implicit multithreading in the scope, e.g. for RooDataSet creation, and restore it afterwards."""
+    if not ROOT.ROOT.IsImplicitMTEnabled():
+        yield
+        return
+    nThreads = ROOT.ROOT.GetImplicitMTPoolSize()
+    ROOT.ROOT.DisableImplicitMT()
+    if logger is not None:
+        logger.logWARNING("Implicit MT is suspended while creating RooFit datasets.")
+    try:
+        yield
+    finally:
+        ROOT.ROOT.EnableImplicitMT(nThreads)
+
+if __name__ == '__main__':
+    # Check RooDataSet from a fat tree is the same before and after an RDataFrame computation in the scope.
+    import os
+    import tempfile
+    from array import array
+
+    nBranches = 200
+    fname = os.path.join(tempfile.mkdtemp(), "implicitMT.root")
+    fout = ROOT.TFile(fname, "RECREATE")
+    tree = ROOT.TTree("tree", "")
+    buffers = [array('d', [0.]) for idx in range(nBranches)]
+    for idx, buf in enumerate(buffers):
+        tree.Branch("x{0}".format(idx), buf, "x{0}/D".format(idx))
+    rnd = ROOT.TRandom3(1)
+    for entry in range(20000):
+        for buf in buffers:
+            buf[0] = rnd.Uniform(-1, 1)
+        tree.Fill()
+    tree.Write()
+    fout.Close()
+
+    x0 = ROOT.RooRealVar("x0", "", -1, 1)
+    x1 = ROOT.RooRealVar("x1", "", -1, 1)
+    def readDataSet(name):
+        ch = ROOT.TChain("tree")
+        ch.Add(fname)
+        data = ROOT.RooDataSet(name, "", ch, ROOT.RooArgSet(x0, x1), "x0 > 0")
+        return data.numEntries(), data.sumEntries(), data.mean(x0), data.mean(x1)
+
+    reference = readDataSet("reference")
+    with implicitMT(4):
+        assert ROOT.ROOT.IsImplicitMTEnabled()
+        ch = ROOT.TChain("tree")
+        ch.Add(fname)
+        nSelected = ROOT.RDataFrame(ch).Filter("x0 > 0").Count().GetValue()
+        with suspendImplicitMT():
+            assert not ROOT.ROOT.IsImplicitMTEnabled()
+            suspended = readDataSet("suspended")
+        assert ROOT.ROOT.IsImplicitMTEnabled()
+    assert not ROOT.ROOT.IsImplicitMTEnabled()
+    after = readDataSet("after")
+
+    assert nSelected == reference[0], (nSelected, reference)
+    assert suspended == reference, (suspended, reference)
+    assert after == reference, (after, reference)
+    print("RooDataSet creation is unchanged by the implicit MT scope: {0} entries.".format(reference[0]))
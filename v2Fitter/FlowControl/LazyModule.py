@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
+
+# Description     : Defer the import of heavy modules until first use
+
+import importlib
+
+class LazyModule(object):
+    """Proxy of a module, or an attribute of it, imported at the first attribute access.
+
+    plotCollection = LazyModule("SingleBuToKstarMuMuFitter.plotCollection")
+    Plotter = LazyModule("SingleBuToKstarMuMuFitter.Plotter", "Plotter")
+"""
+    def __init__(self, name, attr=None):
+        self.__dict__['_name'] = name
+        self.__dict__['_attr'] = attr
+        self.__dict__['_obj'] = None
+
+    def _load(self):
+        if self._obj is None:
+            obj = importlib.import_module(self._name)
+            if self._attr is not None:
+                obj = getattr(obj, self._attr)
+            self.__dict__['_obj'] = obj
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        if self._obj is None:
+            return "<LazyModule {0}{1} (not loaded)>".format(self._name, "." + self._attr if self._attr else "")
+        return repr(self._obj)
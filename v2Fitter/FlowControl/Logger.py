@@ -9,6 +9,14 @@
 from v2Fitter.FlowControl.Service import Service
 
 import os
+import time
+import json
+import atexit
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 from enum import IntEnum
 from functools import partial
 from datetime import datetime
@@ -31,8 +39,14 @@ class partialmethod(partial):
         return partial(self.func, instance, *(self.args or ()), **(self.keywords or {}))
 
 class Logger(Service):
-    """A message logger."""
-    def __init__(self, logfilename=None, verbosityLevel=VerbosityLevels.DEFAULT):
+    """A message logger.
+
+Messages could be formatted lazily, i.e. `logDEBUG("{0} events", nEvents)` is formatted only if it is kept.
+Besides the plain text, JSON-lines records (fmt="jsonl") carrying the path name, binKey and jobId are supported.
+With isAsync, records are written in batches by a background thread.
+The format and the mode could also be set with process.cfg['logFormat'] and process.cfg['logAsync'].
+"""
+    def __init__(self, logfilename=None, verbosityLevel=VerbosityLevels.DEFAULT, fmt="text", isAsync=False):
         Service.__init__(self)
         if logfilename is None:
             self._logmethod = self.logPrint
@@ -40,27 +54,55 @@ class Logger(Service):
             self._logmethod = self.logWrite
             self._logfilename = logfilename
         self.verbosityLevel = verbosityLevel
+        self.fmt = fmt
+        self.isAsync = False
+        self.currentPath = None
+        if isAsync:
+            self.startAsync()
 
     def __del__(self):
         self.logDEBUG("Close logger service.")
+        self.stopAsync()
         if hasattr(self, "_logfile"):
             self._logfile.close()
 
-    def _compileMsg(self, msg, lv):
+    def _beginSeq(self):
+        self.fmt = self.process.cfg.get('logFormat', self.fmt)
+        if self.process.cfg.get('logAsync', False):
+            self.startAsync()
+
+    def _endSeq(self):
+        self.flush()
+
+    def _context(self):
+        """Context of a record"""
+        cfg = self.process.cfg if self.process is not None else {}
+        return {
+            'path': self.currentPath,
+            'binKey': cfg.get('binKey', None),
+            'jobId': cfg.get('jobId', None),
+            'pid': os.getpid(),
+        }
+
+    def _compileMsg(self, msg, lv, timestamp=None, context=None):
         """Compose message"""
-        return "{time} {vlevel}\t: {msg}\n".format(time=datetime.utcnow().strftime("UTC %Y%m%d %H:%M:%S"), vlevel=lv.name, msg=msg)
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.fmt == "jsonl":
+            record = {
+                'time': datetime.utcfromtimestamp(timestamp).isoformat(),
+                'level': lv.name,
+                'msg': msg,
+            }
+            record.update(self._context() if context is None else context)
+            return json.dumps(record) + "\n"
+        return "{time} {vlevel}\t: {msg}\n".format(time=datetime.utcfromtimestamp(timestamp).strftime("UTC %Y%m%d %H:%M:%S"), vlevel=lv.name, msg=msg)
 
     def setAbsLogfileDir(self, dirname):
         """ In case you want to specify the directory """
         if os.path.isabs(dirname):
             self.dirname = dirname
 
-    def logPrint(self, msg, lv):
-        """Print to stdout"""
-        print(self._compileMsg(msg, lv))
-
-    def logWrite(self, msg, lv):
-        """Write down a log"""
+    def _openLogfile(self):
         if not hasattr(self, "_logfile"):
             if hasattr(self, 'filedir'):
                 if not os.path.isdir(self.filedir):
@@ -68,13 +110,83 @@ class Logger(Service):
                 self._logfile = open(os.path.join(self.filedir, self._logfilename), 'w+')
             else:
                 self._logfile = open(self._logfilename, 'w+')
-        self._logfile.write(self._compileMsg(msg, lv))
-        self._logfile.flush()
+        return self._logfile
+
+    def logPrint(self, msg, lv):
+        """Print to stdout"""
+        print(self._compileMsg(msg, lv))
+
+    def logWrite(self, msg, lv):
+        """Write down a log"""
+        logfile = self._openLogfile()
+        logfile.write(self._compileMsg(msg, lv))
+        logfile.flush()
 
-    def _logDefine(self, msg, lv):
-        """Define a function to keep a log at given level"""
+    def startAsync(self):
+        """Start the background writer."""
+        if self.isAsync:
+            return
+        self._queue = queue.Queue()
+        self._writerPid = os.getpid()
+        self._writer = threading.Thread(target=self._asyncWriter, name="LoggerWriter")
+        self._writer.daemon = True
+        self._writer.start()
+        self.isAsync = True
+        atexit.register(self.stopAsync)
+
+    def stopAsync(self):
+        """Flush and stop the background writer."""
+        if not self.isAsync or self._writerPid != os.getpid():
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self.isAsync = False
+
+    def flush(self):
+        """Wait until all queued records are written."""
+        if self.isAsync and self._writerPid == os.getpid():
+            self._queue.join()
+
+    def _asyncWriter(self, maxBatch=1000):
+        """Write queued records in batches until None is received."""
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < maxBatch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            isStopped = None in batch
+            records = [item for item in batch if item is not None]
+            try:
+                if records:
+                    lines = [self._compileMsg(*item) for item in records]
+                    if self._logmethod == self.logWrite:
+                        logfile = self._openLogfile()
+                        logfile.write("".join(lines))
+                        logfile.flush()
+                    else:
+                        print("\n".join(lines))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if isStopped:
+                break
+
+    def _logDefine(self, msg, *args, **kwargs):
+        """Define a function to keep a log at given level.
+        msg is formatted with args and kwargs, or called if it is callable, only if the level is kept."""
+        lv = kwargs.pop('lv')
         if self.verbosityLevel >= lv:
-            self._logmethod(msg, lv)
+            if callable(msg):
+                msg = msg()
+            elif args or kwargs:
+                msg = msg.format(*args, **kwargs)
+            if self.isAsync and self._writerPid == os.getpid():
+                self._queue.put((msg, lv, time.time(), self._context()))
+            else:
+                # Forked worker processes do not own the writer thread.
+                self._logmethod(msg, lv)
 
     logINFO = partialmethod(_logDefine, lv=VerbosityLevels.INFO)
     logWARNING = partialmethod(_logDefine, lv=VerbosityLevels.WARNING)
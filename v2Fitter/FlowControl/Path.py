@@ -8,7 +8,28 @@
 from __future__ import print_function
 
 import abc
+import functools
 
+from v2Fitter.FlowControl.ImplicitMT import implicitMT
+
+def _collectStrings(obj, strings, seen=None):
+    """Strings in nested containers, partials and Paths, e.g. source keys in a cfg."""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, str):
+        strings.add(obj)
+    elif isinstance(obj, dict):
+        for val in obj.values():
+            _collectStrings(val, strings, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for val in obj:
+            _collectStrings(val, strings, seen)
+    elif isinstance(obj, functools.partial):
+        _collectStrings([obj.args, obj.keywords or {}], strings, seen)
+    elif isinstance(obj, Path):
+        _collectStrings(dict([(k, v) for k, v in obj.cfg.items() if k != 'source']), strings, seen)
 
 class Path():
     """Steps to be run in a Process"""
@@ -16,7 +37,7 @@ class Path():
     def __init__(self, cfg, noRerun=False):
         self.cfg = cfg
         self.name = self.cfg['name'].replace('.', '_')
-        self.noRerun = noRerun
+        self.noRerun = self.cfg.get('noRerun', noRerun)
         Path.reset(self)
         pass
 
@@ -24,6 +45,7 @@ class Path():
         """In case using the same `Path` in several `Process`"""
         self.process = None
         self.logger = None
+        self.cacheKey = None
         self.cfg['source'] = {}
 
     def hookProcess(self, process):
@@ -44,6 +66,51 @@ class Path():
         """Runtime Customization"""
         pass
 
+    def inputs(self):
+        """Source keys (wildcards allowed) read by this path, None if unknown."""
+        return self.cfg.get('inputs', None)
+
+    def outputs(self):
+        """Source keys (wildcards allowed) published by this path, None if unknown."""
+        return self.cfg.get('outputs', None)
+
+    def bulkInputs(self):
+        """Datasets and trees (wildcards allowed) which may be read by this path, used to release sources if inputs() is unknown.
+        Strings in cfg, e.g. cfg['data'], plus cfg['bulkInputs'] for keys hard-coded in the code."""
+        keys = set(self.cfg.get('bulkInputs', []))
+        _collectStrings(dict([(k, v) for k, v in self.cfg.items() if k != 'source']), keys)
+        return sorted(keys)
+
+    def isWorkerSafe(self):
+        """True if all side effects are captured by cfg['source'] and _exportState,
+        i.e. the path could be run in a forked worker process."""
+        return self.cfg.get('runInWorker', False)
+
+    def isCheckpointable(self):
+        """True if the path could be restored from its published sources and _exportState."""
+        return self.cfg.get('checkpoint', self.isWorkerSafe())
+
+    def implicitMT(self):
+        """Scope of implicit multithreading with cfg['nThreads'] threads (0 for all cores), serial by default.
+        Use it only around RDataFrame computations, RooDataSet creation is broken by implicit MT."""
+        return implicitMT(self.cfg.get('nThreads', None), self.logger)
+
+    def externalDigest(self):
+        """Digest of inputs not passed through the sourcemanager, e.g. files read directly, None if nothing."""
+        return None
+
+    def _modifiedSources(self):
+        """Digests of the changes made to upstream sources in place, e.g. parameters of a fitted pdf."""
+        return {}
+
+    def _exportState(self):
+        """Picklable state to be synchronized back from a worker process."""
+        return None
+
+    def _importState(self, state):
+        """Restore the state exported by _exportState."""
+        pass
+
     @abc.abstractmethod
     def _runPath(self):
         """Main function to be called in a sequence."""
@@ -52,4 +119,11 @@ class Path():
     def _addSource(self):
         """Add shared objects to the source pool."""
         for key, val in self.cfg['source'].items():
-            self.process.sourcemanager.update(key, val, addHist=self.name)
+            digest = self.process.pathcache.sourceDigest(self, key) if self.cacheKey else None
+            self.process.sourcemanager.update(key, val, addHist=self.name, digest=digest)
+        for key, change in self._modifiedSources().items():
+            self.process.sourcemanager.amendDigest(key, [self.name, change])
+
+    def _dropSource(self, key):
+        """Drop the reference to a published source, which is released or spilled by the sourcemanager."""
+        self.cfg['source'].pop(key, None)
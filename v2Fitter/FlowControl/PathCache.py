@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
+
+# Description     : Content-addressed cache of Path outputs
+
+from __future__ import print_function
+
+import os
+import re
+import glob
+import uuid
+import inspect
+import hashlib
+import functools
+from fnmatch import fnmatchcase
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from v2Fitter.FlowControl.Service import Service
+from v2Fitter.FlowControl.Path import Path
+
+def _reprCode(code):
+    """Bytecode, constants and referred names of a code object, nested functions included."""
+    consts = [_reprCode(c) if hasattr(c, 'co_code') else _reprObj(c) for c in code.co_consts]
+    h = hashlib.sha1(code.co_code)
+    h.update("{0}|{1}".format(consts, code.co_names).encode('utf-8'))
+    return h.hexdigest()
+
+def _reprCells(cells):
+    """Contents of closure cells, empty cells are kept as placeholders."""
+    contents = []
+    for cell in cells or ():
+        try:
+            contents.append(cell.cell_contents)
+        except ValueError:
+            contents.append(None)
+    return contents
+
+def _reprObj(obj):
+    """Stable representation of configuration-like objects, memory addresses are avoided."""
+    if isinstance(obj, dict):
+        return "{" + ",".join(["{0}:{1}".format(_reprObj(k), _reprObj(v)) for k, v in sorted(obj.items(), key=lambda kv: repr(kv[0]))]) + "}"
+    elif isinstance(obj, (list, tuple, set)):
+        return "[" + ",".join([_reprObj(v) for v in obj]) + "]"
+    elif isinstance(obj, functools.partial):
+        return "partial({0},{1},{2})".format(_reprObj(obj.func), _reprObj(obj.args), _reprObj(obj.keywords or {}))
+    elif hasattr(obj, '__func__'):
+        # Bound method, including those hooked with types.MethodType
+        return _reprObj(obj.__func__)
+    elif hasattr(obj, '__code__'):
+        # Function, keep track of its code, default arguments and closure, e.g. those wrapped by decorators
+        return "{0}.{1}:{2}({3},{4})".format(obj.__module__, obj.__name__, _reprCode(obj.__code__), _reprObj(obj.__defaults__ or ()), _reprObj(_reprCells(obj.__closure__)))
+    elif hasattr(obj, 'InheritsFrom'):
+        if obj.InheritsFrom("RooCmdArg"):
+            return "{0}({1},{2},{3})".format(obj.GetName(), obj.getInt(0), obj.getDouble(0), obj.getString(0))
+        elif obj.InheritsFrom("RooAbsCollection"):
+            args = []
+            args_it = obj.createIterator()
+            arg = args_it.Next()
+            while arg:
+                args.append(_reprObj(arg))
+                arg = args_it.Next()
+            return "{0}[{1}]".format(obj.ClassName(), ",".join(sorted(args)))
+        elif obj.InheritsFrom("RooAbsRealLValue"):
+            return "{0}:{1}[{2},{3}]".format(obj.ClassName(), obj.GetName(), obj.getMin(), obj.getMax())
+        return "{0}:{1}".format(obj.ClassName(), obj.GetName())
+    return re.sub(r" at 0x[0-9a-fA-F]+", "", repr(obj))
+
+def digestObj(obj):
+    """SHA1 digest of an object with _reprObj."""
+    return hashlib.sha1(_reprObj(obj).encode('utf-8')).hexdigest()
+
+def contentDigest(obj):
+    """Digest of a source booked without one.
+    Histograms are digested by their contents, other ROOT objects are tagged uniquely since _reprObj keeps only their names."""
+    if hasattr(obj, 'InheritsFrom'):
+        if obj.InheritsFrom("TH1"):
+            return digestObj([obj.ClassName(), obj.GetName()] + [(obj.GetBinContent(i), obj.GetBinError(i)) for i in range(obj.GetNcells())])
+        return uuid.uuid4().hex
+    return digestObj(obj)
+
+def fileStamps(patterns):
+    """(path, size, mtime) of files matching the wildcards, remote files are kept as they are."""
+    stamps = []
+    for pattern in patterns:
+        fnames = sorted(glob.glob(pattern))
+        if not fnames:
+            stamps.append((pattern, None, None))
+        for fname in fnames:
+            stat = os.stat(fname)
+            stamps.append((os.path.abspath(fname), stat.st_size, int(stat.st_mtime)))
+    return stamps
+
+def codeDigest(*objs):
+    """SHA1 digest of the source files defining the classes or modules."""
+    h = hashlib.sha1()
+    for obj in objs:
+        with open(inspect.getsourcefile(obj), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+class PathCache(Service):
+    """Store the sources published by a Path, keyed on its configuration and upstream sources.
+
+The key of a path is built from
+    * the class, cfg (except the sources) and runtime-patched methods of the path,
+    * selected entries in process.cfg, 'binKey' by default,
+    * the digests of the consumed sources, i.e. those match Path.inputs() or all if unknown,
+    * Path.externalDigest(), e.g. the input fit DB.
+Sources modified in place are re-tagged by Path._modifiedSources(), e.g. the pdf after fitting.
+Sources published by the path are then tagged with digests derived from the key.
+"""
+    def __init__(self, cacheDir="pathCache", processCfgKeys=None):
+        Service.__init__(self)
+        self.cacheDir = cacheDir
+        self.processCfgKeys = processCfgKeys if processCfgKeys is not None else ['binKey']
+
+    def getKey(self, path):
+        """Content-addressed key of a path."""
+        pathCfg = dict([(k, v) for k, v in path.cfg.items() if k != 'source'])
+        pathMethods = dict([(k, v) for k, v in path.__dict__.items() if callable(v) and hasattr(v, '__func__')])
+        processCfg = dict([(k, self.process.cfg.get(k)) for k in self.processCfgKeys])
+
+        sourcemanager = self.process.sourcemanager
+        patterns = path.inputs()
+        consumed = [k for k in sourcemanager.keys() if patterns is None or any([fnmatchcase(k, pat) for pat in patterns])]
+        upstream = dict([(k, sourcemanager.digest(k)) for k in consumed])
+        return digestObj([type(path).__module__, type(path).__name__, pathCfg, pathMethods, processCfg, upstream, path.externalDigest()])
+
+    def sourceDigest(self, path, key):
+        """Digest of a source published by path."""
+        return hashlib.sha1("{0}:{1}".format(path.cacheKey, key).encode('utf-8')).hexdigest()
+
+    def _cacheFile(self, path):
+        return os.path.join(self.cacheDir, "{0}_{1}.pkl".format(path.name, path.cacheKey))
+
+    def restore(self, path):
+        """Book the cached sources of path. Return True if cache hit."""
+        cacheFile = self._cacheFile(path)
+        if not os.path.exists(cacheFile):
+            self.logger.logDEBUG("No cache for {0} with key {1}", path, path.cacheKey)
+            return False
+        try:
+            with open(cacheFile, 'rb') as f:
+                sources, state = pickle.load(f)
+        except Exception as e:
+            self.logger.logWARNING("Failed to load cache {0}: {1}".format(cacheFile, e))
+            return False
+        path.cfg['source'] = sources
+        path._importState(state)
+        Path._addSource(path)
+        self.logger.logINFO("{0} is restored from {1}".format(path, cacheFile))
+        return True
+
+    def store(self, path):
+        """Save the published sources of path."""
+        if not os.path.exists(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        cacheFile = self._cacheFile(path)
+        try:
+            with open(cacheFile + ".tmp", 'wb') as f:
+                pickle.dump((path.cfg['source'], path._exportState()), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(cacheFile + ".tmp", cacheFile)
+        except Exception as e:
+            self.logger.logWARNING("Failed to cache {0}: {1}".format(path, e))
+            if os.path.exists(cacheFile + ".tmp"):
+                os.remove(cacheFile + ".tmp")
+
+    def clear(self):
+        """Remove all cached outputs."""
+        if not os.path.isdir(self.cacheDir):
+            return
+        for fname in os.listdir(self.cacheDir):
+            if fname.endswith(".pkl"):
+                os.remove(os.path.join(self.cacheDir, fname))
+        self.logger.logDEBUG("Cleared {0}", self.cacheDir)
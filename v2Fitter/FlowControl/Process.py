@@ -8,6 +8,10 @@ import os
 from collections import OrderedDict
 from v2Fitter.FlowControl.Logger import Logger
 from v2Fitter.FlowControl.SourceManager import SourceManager, FileManager
+from v2Fitter.FlowControl.Scheduler import DAGScheduler
+from v2Fitter.FlowControl.PathCache import PathCache
+from v2Fitter.FlowControl.Tracer import Tracer
+from v2Fitter.FlowControl.RooMsgBridge import RooMsgBridge
 
 import ROOT
 
@@ -25,6 +29,10 @@ class Process:
         self.addService('logger', Logger("runtime.log"))
         self.addService('filemanager', FileManager())
         self.addService('sourcemanager', SourceManager())
+        self.addService('pathcache', PathCache())
+        self.addService('checkpoint', PathCache(cacheDir="checkpoint"))
+        self.addService('tracer', Tracer())
+        self.addService('roomsg', RooMsgBridge())
 
     def __str__(self):
         return self._sequence.__str__()
@@ -74,26 +82,98 @@ class Process:
         if not os.path.exists(self.work_dir):
             os.makedirs(self.work_dir)
         os.chdir(self.work_dir)
-        self.beginSeq_registerServices()
-        self.logger.logINFO("New process initialized at {0}".format(os.path.abspath(self.work_dir)))
-        ROOT.gRandom.SetSeed(0)
-        ROOT.RooRandom.setRandomGenerator(ROOT.gRandom)
-        self.logger.logINFO("Random seed = {0}".format(ROOT.gRandom.GetSeed()))
+        with self.tracer.span("beginSeq", "Process"):
+            self.beginSeq_registerServices()
+            self.logger.logINFO("New process initialized at {0}".format(os.path.abspath(self.work_dir)))
+            ROOT.gRandom.SetSeed(0)
+            ROOT.RooRandom.setRandomGenerator(ROOT.gRandom)
+            self.logger.logINFO("Random seed = {0}".format(ROOT.gRandom.GetSeed()))
+
+    def runPath(self, p):
+        """Run a single path."""
+        self.logger.logDEBUG("Entering Path: {0}", p.cfg['name'])
+        self.logger.currentPath = p.name
+        self.roomsg.enter(p)
+        try:
+            with self.tracer.span("{0}.customize".format(p.name)):
+                p.customize()
+            if self.restorePath(p):
+                return
+            with self.tracer.span("{0}._runPath".format(p.name)):
+                p._runPath()
+            with self.tracer.span("{0}._addSource".format(p.name)):
+                p._addSource()
+            self.storePath(p)
+        finally:
+            self.roomsg.exit(p)
+            self.logger.currentPath = None
+        # print(self.sourcemanager)
+        # print(self.filemanager)
+
+    def _pathStores(self, p):
+        """Stores of the outputs of a customized path."""
+        stores = []
+        if p.noRerun:
+            stores.append(self.pathcache)
+        if self.cfg.get('checkpoint', False) and p.isCheckpointable():
+            stores.append(self.checkpoint)
+        return stores
+
+    def restorePath(self, p):
+        """Compute the key of a customized path, and book its outputs from the path cache or the checkpoint if any.
+        Return True if restored."""
+        p.cacheKey = self.pathcache.getKey(p)
+        for store in self._pathStores(p):
+            with self.tracer.span("{0}.restore".format(p.name)):
+                isRestored = store.restore(p)
+            if isRestored:
+                return True
+        return False
+
+    def storePath(self, p):
+        """Save the outputs of a finished path to the path cache and the checkpoint if required."""
+        for store in self._pathStores(p):
+            store.store(p)
 
     def runSeq(self):
-        """Run all path."""
+        """Run all path.
+        Set cfg['scheduler'] to 'dag' to run independent paths concurrently with cfg['nWorkers'] processes.
+        Set cfg['checkpoint'] to save the outputs of each finished path to work_dir,
+        a failed sequence resumes from the saved outputs when it is run again. Checkpoints are removed on success."""
+        with self.tracer.span("runSeq", "Process"):
+            if self.cfg.get('scheduler', "sequential") == "dag":
+                DAGScheduler(self, self.cfg.get('nWorkers', None)).run(self._sequence, self.runPath)
+            else:
+                for idx, p in enumerate(self._sequence):
+                    self.runPath(p)
+                    self.releaseSources(self._sequence[idx+1:])
+        if self.cfg.get('checkpoint', False):
+            self.checkpoint.clear()
+
+    def releaseSources(self, remainingPaths):
+        """Drop the references to spilled sources held by paths, including datasets and NLLs of finished fitters.
+        Release sources no longer needed by remainingPaths unless cfg['releaseSources'] is False,
+        sources matching cfg['keepSources'] are kept. Nothing is released after the last path, so that outputs could be used after runSeq."""
+        self.sourcemanager.unpin()
+        dropped = self.sourcemanager.popSpilledKeys()
+        if remainingPaths and self.cfg.get('releaseSources', True):
+            dropped += self.sourcemanager.releaseUnused(remainingPaths, self.cfg.get('keepSources', []))
         for p in self._sequence:
-            self.logger.logDEBUG("Entering Path: {0}".format(p.cfg['name']))
-            p.customize()
-            p._runPath()
-            p._addSource()
-            # print(self.sourcemanager)
-            # print(self.filemanager)
+            for key in dropped:
+                p._dropSource(key)
 
     def endSeq(self):
-        """Terminate all services in a reversed order."""
+        """Terminate all services in a reversed order.
+        The trace is written before the logger is terminated, so that the summary is logged."""
+        isTraceWritten = False
         while self._services:
             key, s = self._services.popitem(True)
-            self.logger.logDEBUG("Entering endSeq: {0}".format(key))
-            s._endSeq()
+            if s is self.logger:
+                self.tracer.writeTrace()
+                isTraceWritten = True
+            self.logger.logDEBUG("Entering endSeq: {0}", key)
+            with self.tracer.span("{0}._endSeq".format(key), "Process"):
+                s._endSeq()
+        if not isTraceWritten:
+            self.tracer.writeTrace()
         os.chdir(self.cwd)
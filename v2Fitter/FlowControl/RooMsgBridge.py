@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
+
+# Description     : Forward RooMsgService output to the logger
+
+from __future__ import print_function
+
+from copy import deepcopy
+
+from v2Fitter.FlowControl.Service import Service
+
+import ROOT
+
+# RooFit::MsgTopic
+topics = ["Generation", "Minimization", "Plotting", "Fitting", "Integration", "LinkStateMgmt", "Eval", "Caching",
+          "Optimization", "ObjectHandling", "InputArguments", "Tracing", "Contents", "DataHandling", "NumIntegration"]
+
+cimp_RooMsgBridgeSink = """
+#include <map>
+#include <cctype>
+#include <string>
+#include <vector>
+#include <ostream>
+#include <streambuf>
+
+// Stream of RooMsgService, messages are de-duplicated and capped per topic as they are written.
+// Only forwarded messages and the counters are kept in memory.
+class RooMsgBridgeSink : public std::streambuf {
+public:
+    RooMsgBridgeSink(bool dedup, int maxPerTopic) : fStream(this), fDedup(dedup), fMaxPerTopic(maxPerTopic) {}
+    std::ostream& Stream() { return fStream; }
+    // Finish the pending message, to be called after the stream is deleted.
+    void Flush() {
+        if (!fLine.empty()) ProcessLine();
+        Commit();
+    }
+    size_t NMessages() const { return fLevels.size(); }
+    const std::string& Level(size_t i) const { return fLevels[i]; }
+    const std::string& Topic(size_t i) const { return fTopics[i]; }
+    const std::string& Message(size_t i) const { return fMessages[i]; }
+    // Forwarded messages which are repeated afterwards, with numbers ignored
+    long NRepeated(size_t i) const { return fRepeated[i]; }
+    // Topics with messages over the cap
+    size_t NSuppressedTopics() const { return fSuppressedTopics.size(); }
+    const std::string& SuppressedTopic(size_t i) const { return fSuppressedTopics[i]; }
+    long NSuppressed(size_t i) const { return fSuppressed.find(fSuppressedTopics[i])->second; }
+protected:
+    virtual int overflow(int c) {
+        if (c == traits_type::eof()) return traits_type::not_eof(c);
+        Put(traits_type::to_char_type(c));
+        return c;
+    }
+    virtual std::streamsize xsputn(const char *s, std::streamsize n) {
+        for (std::streamsize i = 0; i < n; i++) Put(s[i]);
+        return n;
+    }
+private:
+    void Put(char c) {
+        if (c == '\\n') {
+            ProcessLine();
+        } else {
+            fLine += c;
+        }
+    }
+    // A new message starts with "[#n] LEVEL:Topic -- ", other lines continue the pending one.
+    void ProcessLine() {
+        std::string line;
+        line.swap(fLine);
+        size_t iBracket = line.compare(0, 2, "[#") == 0 ? line.find("] ") : std::string::npos;
+        size_t iColon = iBracket != std::string::npos ? line.find(':', iBracket) : std::string::npos;
+        size_t iDash = iColon != std::string::npos ? line.find(" -- ", iColon) : std::string::npos;
+        if (iDash != std::string::npos) {
+            Commit();
+            fPending = true;
+            fLevel = line.substr(iBracket + 2, iColon - iBracket - 2);
+            fTopic = line.substr(iColon + 1, iDash - iColon - 1);
+            fMessage = line.substr(iDash + 4);
+        } else if (fPending) {
+            fMessage += "\\n" + line;
+        } else if (line.find_first_not_of(" \\t\\r") != std::string::npos) {
+            fPending = true;
+            fLevel = "INFO";
+            fTopic = "Unknown";
+            fMessage = line;
+        }
+    }
+    void Commit() {
+        if (!fPending) return;
+        fPending = false;
+        std::string key;
+        if (fDedup) {
+            key = fTopic + ":" + Template(fMessage);
+            std::map<std::string, size_t>::iterator it = fForwarded.find(key);
+            if (it != fForwarded.end()) {
+                fRepeated[it->second]++;
+                return;
+            }
+        }
+        long &nForwarded = fNForwarded[fTopic];
+        if (fMaxPerTopic >= 0 && nForwarded >= fMaxPerTopic) {
+            if (fSuppressed[fTopic]++ == 0) fSuppressedTopics.push_back(fTopic);
+            return;
+        }
+        nForwarded++;
+        if (fDedup) fForwarded[key] = fLevels.size();
+        fLevels.push_back(fLevel);
+        fTopics.push_back(fTopic);
+        fMessages.push_back(fMessage);
+        fRepeated.push_back(0);
+    }
+    // Numbers, e.g. -1.5e+03, are replaced by '#'.
+    static std::string Template(const std::string &msg) {
+        std::string out;
+        size_t i = 0;
+        while (i < msg.size()) {
+            size_t j = i;
+            if ((msg[j] == '+' || msg[j] == '-') && j + 1 < msg.size() && isdigit(msg[j+1])) j++;
+            if (!isdigit(msg[j])) {
+                out += msg[i++];
+                continue;
+            }
+            while (j < msg.size() && isdigit(msg[j])) j++;
+            if (j < msg.size() && msg[j] == '.') {
+                j++;
+                while (j < msg.size() && isdigit(msg[j])) j++;
+            }
+            if (j < msg.size() && (msg[j] == 'e' || msg[j] == 'E')) {
+                size_t k = j + 1;
+                if (k < msg.size() && (msg[k] == '+' || msg[k] == '-')) k++;
+                if (k < msg.size() && isdigit(msg[k])) {
+                    j = k;
+                    while (j < msg.size() && isdigit(msg[j])) j++;
+                }
+            }
+            out += '#';
+            i = j;
+        }
+        return out;
+    }
+
+    std::ostream fStream;
+    bool fDedup;
+    int fMaxPerTopic;
+    std::string fLine;
+    bool fPending = false;
+    std::string fLevel, fTopic, fMessage;
+    std::vector<std::string> fLevels, fTopics, fMessages;
+    std::vector<long> fRepeated;
+    std::map<std::string, size_t> fForwarded;
+    std::map<std::string, long> fNForwarded;
+    std::map<std::string, long> fSuppressed;
+    std::vector<std::string> fSuppressedTopics;
+};
+"""
+
+class RooMsgBridge(Service):
+    """Redirect RooMsgService streams to an in-memory sink while a Path runs, then forward the messages to the logger.
+
+Per-topic minimum levels, de-duplication of repeated messages (numbers are ignored when comparing)
+and a cap of forwarded messages per topic are configurable.
+Repeated and capped messages are dropped by the sink as they are written, only counters are kept.
+The bridge is enabled by process.cfg['rooMsg'], which updates templateConfig(),
+and could be further customized with path.cfg['rooMsg'] for each path.
+"""
+    def __init__(self):
+        Service.__init__(self)
+        self.cfg = None
+        self._streams = []
+        self._savedStatus = []
+        self._sink = None
+        self._pathCfg = None
+
+    @classmethod
+    def templateConfig(cls):
+        cfg = {
+            'defaultLevel': "WARNING",
+            'topicLevels': {
+                'Fitting': "INFO",
+                'Generation': "INFO",
+            },
+            'dedup': True,
+            'maxPerTopic': 50,  # None for no limit
+        }
+        return cfg
+
+    def _beginSeq(self):
+        if self.process.cfg.get('rooMsg', None) is not None:
+            self.cfg = RooMsgBridge.templateConfig()
+            self.cfg.update(self.process.cfg['rooMsg'])
+
+    def _endSeq(self):
+        self._sink = None
+
+    def enter(self, path):
+        """Silence existing streams and add streams to a new sink."""
+        if self.cfg is None:
+            return
+        self._pathCfg = deepcopy(self.cfg)
+        if path.cfg.get('rooMsg', None) is not None:
+            self._pathCfg.update(path.cfg['rooMsg'])
+
+        msgService = ROOT.RooMsgService.instance()
+        self._savedStatus = [msgService.getStreamStatus(idx) for idx in range(msgService.numStreams())]
+        for idx in range(msgService.numStreams()):
+            msgService.setStreamStatus(idx, False)
+        if not hasattr(ROOT, 'RooMsgBridgeSink'):
+            ROOT.gInterpreter.Declare(cimp_RooMsgBridgeSink)
+        maxPerTopic = self._pathCfg['maxPerTopic']
+        self._sink = ROOT.RooMsgBridgeSink(self._pathCfg['dedup'], -1 if maxPerTopic is None else maxPerTopic)
+        for topic in topics:
+            level = self._pathCfg['topicLevels'].get(topic, self._pathCfg['defaultLevel'])
+            self._streams.append(msgService.addStream(getattr(ROOT.RooFit, level), ROOT.RooFit.Topic(getattr(ROOT.RooFit, topic)), ROOT.RooFit.OutputStream(self._sink.Stream())))
+
+    def exit(self, path):
+        """Restore the streams and forward new messages."""
+        if self.cfg is None or not self._streams:
+            return
+        msgService = ROOT.RooMsgService.instance()
+        for idx in reversed(self._streams):
+            msgService.deleteStream(idx)
+        self._streams = []
+        for idx, status in enumerate(self._savedStatus):
+            msgService.setStreamStatus(idx, status)
+        self._savedStatus = []
+        self.forward(path)
+
+    def forward(self, path):
+        """Forward messages kept by the sink, then the numbers of repeated and suppressed messages."""
+        sink, self._sink = self._sink, None
+        sink.Flush()
+        for idx in range(sink.NMessages()):
+            self._log(sink.Level(idx), "RooFit:{0} -- {1}".format(sink.Topic(idx), sink.Message(idx)))
+        for idx in range(sink.NMessages()):
+            if sink.NRepeated(idx) > 0:
+                self._log(sink.Level(idx), "RooFit:{0} -- Repeated {1} more times: {2}".format(sink.Topic(idx), sink.NRepeated(idx), str(sink.Message(idx)).splitlines()[0]))
+        for idx in range(sink.NSuppressedTopics()):
+            self.logger.logINFO("RooFit:{0} -- {1} messages suppressed in {2}", sink.SuppressedTopic(idx), sink.NSuppressed(idx), path)
+
+    def _log(self, level, msg):
+        if level in ["ERROR", "FATAL"]:
+            self.logger.logERROR(msg)
+        elif level == "WARNING":
+            self.logger.logWARNING(msg)
+        elif level == "INFO":
+            self.logger.logINFO(msg)
+        else:
+            self.logger.logDEBUG(msg)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
+
+# Description     : Run Paths of a Process following their dependency graph
+
+from __future__ import print_function
+
+import sys
+import itertools
+import traceback
+import multiprocessing
+from fnmatch import fnmatchcase
+from collections import OrderedDict
+
+from v2Fitter.FlowControl.Path import Path
+
+def isOverlapped(keysA, keysB):
+    """Check if two lists of source keys (wildcards allowed) could refer to the same source.
+    None stands for unknown, which overlaps with anything but an empty list."""
+    if keysA is not None and len(keysA) == 0:
+        return False
+    if keysB is not None and len(keysB) == 0:
+        return False
+    if keysA is None or keysB is None:
+        return True
+    return any([fnmatchcase(a, b) or fnmatchcase(b, a) for a, b in itertools.product(keysA, keysB)])
+
+def _runInWorker(path, conn):
+    """Target of the worker process. Send (sources, state, trace events) or the traceback back to parent."""
+    tracer = path.process.tracer
+    tracer.events = []
+    path.process.logger.currentPath = path.name
+    path.process.roomsg.enter(path)
+    try:
+        with tracer.span("{0}._runPath".format(path.name)):
+            path._runPath()
+        with tracer.span("{0}._addSource".format(path.name)):
+            path._addSource()
+        path.process.roomsg.exit(path)
+        conn.send(('done', path.cfg['source'], path._exportState(), tracer.events))
+    except Exception:
+        path.process.roomsg.exit(path)
+        conn.send(('error', traceback.format_exc(), None, tracer.events))
+    finally:
+        # Close files opened in this worker, objects are already serialized.
+        path.process.filemanager._endSeq()
+        conn.close()
+
+class DAGScheduler(object):
+    """Run the sequence of a Process with independent Paths processed concurrently.
+
+An edge from path i to a later path j is added if any read-after-write, write-after-write,
+or write-after-read hazard is found with Path.inputs and Path.outputs.
+Paths with Path.isWorkerSafe() run in forked worker processes, others run inline.
+"""
+    def __init__(self, process, nWorkers=None):
+        self.process = process
+        self.logger = process.logger
+        self.nWorkers = nWorkers if nWorkers else multiprocessing.cpu_count()
+
+    def buildGraph(self, sequence):
+        """Return the indices of upstream paths for each path in sequence."""
+        deps = OrderedDict()
+        for j, pj in enumerate(sequence):
+            deps[j] = set()
+            for i, pi in enumerate(sequence[:j]):
+                if isOverlapped(pi.outputs(), pj.inputs()) \
+                        or isOverlapped(pi.outputs(), pj.outputs()) \
+                        or isOverlapped(pi.inputs(), pj.outputs()):
+                    deps[j].add(i)
+            self.logger.logDEBUG("{0} depends on {1}", pj, [str(sequence[i]) for i in sorted(deps[j])])
+        return deps
+
+    def _finishPath(self, path, sources, state):
+        """Book the sources from a worker to the parent process."""
+        path.cfg['source'] = sources
+        path._importState(state)
+        Path._addSource(path)
+        self.process.storePath(path)
+
+    def run(self, sequence, runPath):
+        """Run sequence. Inline paths are handled by `runPath(path)`."""
+        deps = self.buildGraph(sequence)
+        pending = list(range(len(sequence)))
+        finished = set()
+        running = {}  # idx: (worker, conn)
+        try:
+            while pending or running:
+                # Dispatch all ready paths, workers go first since inline paths block.
+                ready = [i for i in pending if deps[i] <= finished]
+                ready.sort(key=lambda i: not sequence[i].isWorkerSafe())
+                for idx in ready:
+                    path = sequence[idx]
+                    if path.isWorkerSafe():
+                        if len(running) >= self.nWorkers:
+                            continue
+                        self.logger.logDEBUG("Entering Path: {0} in a worker process", path.cfg['name'])
+                        with self.process.tracer.span("{0}.customize".format(path.name)):
+                            path.customize()
+                        if self.process.restorePath(path):
+                            finished.add(idx)
+                            pending.remove(idx)
+                            break  # Readiness changes
+                        sys.stdout.flush()
+                        conn_parent, conn_child = multiprocessing.Pipe(False)
+                        worker = multiprocessing.Process(target=_runInWorker, args=(path, conn_child))
+                        worker.start()
+                        conn_child.close()
+                        running[idx] = (worker, conn_parent)
+                        pending.remove(idx)
+                    else:
+                        runPath(path)
+                        finished.add(idx)
+                        pending.remove(idx)
+                        self.process.releaseSources([sequence[i] for i in pending + list(running.keys())])
+                        break  # Readiness changes
+
+                # Collect finished workers
+                for idx, (worker, conn) in list(running.items()):
+                    if not conn.poll(0.1):
+                        continue
+                    try:
+                        status, payload, state, events = conn.recv()
+                    except EOFError:
+                        status, payload, state, events = 'error', "Worker exits with code {0}".format(worker.exitcode), None, []
+                    self.process.tracer.events.extend(events)
+                    worker.join()
+                    del running[idx]
+                    if status != 'done':
+                        self.logger.logERROR("{0} failed in worker process.\n{1}".format(sequence[idx], payload))
+                        raise RuntimeError("{0} failed in worker process.".format(sequence[idx]))
+                    self._finishPath(sequence[idx], payload, state)
+                    finished.add(idx)
+                    self.process.releaseSources([sequence[i] for i in pending + list(running.keys())])
+        finally:
+            for worker, conn in running.values():
+                worker.terminate()
+                worker.join()
@@ -8,24 +8,138 @@
 
 from v2Fitter.FlowControl.Service import Service
 from v2Fitter.FlowControl.Logger import VerbosityLevels
+from v2Fitter.FlowControl.PathCache import digestObj, contentDigest
 
-from collections import OrderedDict
+import os
+import fcntl
+import itertools
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from collections import OrderedDict, deque
 
 import ROOT
 from ROOT import TObject
 from ROOT import SetOwnership
 from ROOT import TFile
 
+class LazySource(object):
+    """Factory of a source, which is called at the first SourceManager.get"""
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __call__(self):
+        return self.factory()
+
+def estimateSize(obj):
+    """Estimated memory usage in bytes, only RooAbsData is considered."""
+    if hasattr(obj, 'InheritsFrom') and obj.InheritsFrom("RooAbsData"):
+        return obj.numEntries() * (obj.get().getSize() + 1) * 8
+    return 0
+
 class SourceManager(Service):
-    """Source manager"""
-    def __init__(self):
+    """Source manager
+
+With a memory budget (in MB) given by process.cfg['memoryBudget'], least-recently-used datasets
+are spilled to a scratch file in the working directory, and reloaded at the next get.
+
+Consumers may ask for a subset of observables of a dataset with get(key, observables=[...]),
+the column-pruned views are shared by consumers asking for the same observables.
+A view is a copy, with a memory budget the parent dataset is spilled after the path if it is only read through views.
+"""
+    def __init__(self, historySize=100, memoryBudget=None):
         Service.__init__(self)
         self._sources = OrderedDict()
+        self.historySize = historySize
+        self.memoryBudget = memoryBudget
+        self._accessCounter = itertools.count()
+        self._spillFiles = {}  # pid: TFile
+        self._newlySpilled = []
+        self._pinned = set()  # Sources got by the running path
+
+    def _beginSeq(self):
+        self.memoryBudget = self.process.cfg.get('memoryBudget', self.memoryBudget)
 
     def _endSeq(self):
         # Dump items with LIFO order
         while len(self._sources) > 0:
             key, f = self._sources.popitem(last=True)
+        spillFile = self._spillFiles.pop(os.getpid(), None)
+        if spillFile is not None:
+            fname = spillFile.GetName()
+            spillFile.Close()
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    def _getSpillFile(self):
+        """Scratch file for spilled sources, one for each (forked) process.
+        Files inherited from the parent process are read only."""
+        pid = os.getpid()
+        if pid not in self._spillFiles:
+            self._spillFiles[pid] = TFile("sourceSpill_{0}.root".format(pid), "RECREATE")
+        return self._spillFiles[pid]
+
+    def _spill(self, key, keepViews=False):
+        """Write the source to the scratch file, views are dropped as well unless keepViews.
+        A spilled source with views only drops the views."""
+        record = self._sources[key]
+        if record['obj'] is not None:
+            currentDir = ROOT.gDirectory.GetDirectory("")
+            spillFile = self._getSpillFile()
+            spillName = key.replace('/', '_')
+            spillFile.cd()
+            record['obj'].Write(spillName, TObject.kOverwrite)
+            currentDir.cd()
+            self.logger.logDEBUG("Spill source '{0}' with {1:.1f} MB to {2}", key, estimateSize(record['obj']) / 1048576., spillFile.GetName())
+            record['obj'] = None
+            record['spillName'] = spillName
+            record['spillPid'] = os.getpid()
+        if not keepViews:
+            record['views'] = {}
+        record['size'] = sum([estimateSize(view) for view in record['views'].values()])
+        self._newlySpilled.append(key)
+
+    def unpin(self):
+        """Sources got by the finished path could be spilled from now on.
+        With a memory budget, datasets read through views only are spilled while the views are kept."""
+        self._pinned.clear()
+        if self.memoryBudget:
+            for key, record in self._sources.items():
+                if record['obj'] is not None and record['views'] and not record['isReadInFull']:
+                    self._spill(key, keepViews=True)
+        self._enforceBudget()
+
+    def popSpilledKeys(self):
+        """Keys spilled since last call, references elsewhere should be dropped to free the memory."""
+        keys, self._newlySpilled = self._newlySpilled, []
+        return keys
+
+    def _unspill(self, key):
+        record = self._sources[key]
+        if record['spillPid'] == os.getpid():
+            obj = self._spillFiles[record['spillPid']].Get(record['spillName'])
+        else:
+            # Do not share file descriptors with parent process
+            spillFile = TFile.Open(self._spillFiles[record['spillPid']].GetName())
+            obj = spillFile.Get(record['spillName'])
+            spillFile.Close()
+        SetOwnership(obj, True)
+        self.logger.logDEBUG("Reload spilled source '{0}'", key)
+        record['obj'] = obj
+        record['spillName'] = None
+        record['size'] = estimateSize(obj) + sum([estimateSize(view) for view in record['views'].values()])
+
+    def _enforceBudget(self, activeKey=None):
+        """Spill the least-recently-used datasets until the resident ones fit the budget.
+        Sources got by the running path are not spilled, since the path holds references to them and a reload makes another copy."""
+        if not self.memoryBudget:
+            return
+        resident = [(record['lastAccess'], key) for key, record in self._sources.items() if (record['obj'] is not None or record['views']) and record['size'] > 0 and key != activeKey and key not in self._pinned]
+        total = sum([record['size'] for record in self._sources.values() if record['obj'] is not None or record['views']])
+        for _, key in sorted(resident):
+            if total <= self.memoryBudget * 1048576:
+                break
+            total -= self._sources[key]['size']
+            self._spill(key)
 
     def __str__(self):
         if self.logger.verbosityLevel == VerbosityLevels.DEBUG:
@@ -38,31 +152,162 @@ class SourceManager(Service):
         return item in self._sources
 
 
-    def get(self, key, default=None, addHist=None):
+    @staticmethod
+    def _viewKey(record, observables):
+        return tuple(sorted(set([name for name in observables if name in record['columnNames']])))
+
+    def _view(self, key, observables):
+        """Column-pruned view of a dataset, created once for each set of observables."""
+        record = self._sources[key]
+        obj = record['obj']
+        if obj is None or not (hasattr(obj, 'InheritsFrom') and obj.InheritsFrom("RooAbsData")):
+            return obj
+        columns = obj.get()
+        if record['columnNames'] is None:
+            args_it = columns.createIterator()
+            arg = args_it.Next()
+            record['columnNames'] = []
+            while arg:
+                record['columnNames'].append(arg.GetName())
+                arg = args_it.Next()
+        viewKey = self._viewKey(record, observables)
+        if len(viewKey) == columns.getSize():
+            record['isReadInFull'] = True
+            return obj
+        if viewKey not in record['views']:
+            argset = ROOT.RooArgSet()
+            for name in viewKey:
+                argset.add(columns.find(name))
+            view = obj.reduce(ROOT.RooFit.SelectVars(argset), ROOT.RooFit.Name(obj.GetName()))
+            record['views'][viewKey] = view
+            record['size'] += estimateSize(view)
+            self.logger.logDEBUG("Create view of source '{0}' with {1}", key, viewKey)
+        return record['views'][viewKey]
+
+    def get(self, key, default=None, addHist=None, observables=None):
         if key not in self._sources.keys():
             self.logger.logWARNING("No source labeled with {0} is booked.".format(key))
             return default
+        record = self._sources[key]
 
         # Decorators
         if addHist is not None:
-            self._sources[key]['history'].append(addHist)
+            record['history'].append(addHist)
+        record['nGet'] += 1
+        self._pinned.add(key)
 
-        return self._sources[key]['obj']
+        record['lastAccess'] = next(self._accessCounter)
+        if observables is not None and record['views']:
+            # Views are kept when the parent is spilled
+            viewKey = self._viewKey(record, observables)
+            if viewKey in record['views']:
+                return record['views'][viewKey]
+        if record['obj'] is None:
+            if record['spillName'] is not None:
+                self._unspill(key)
+            elif record['factory'] is not None:
+                self.logger.logDEBUG("Materialize source '{0}'", key)
+                record['obj'] = record['factory']()
+                record['size'] = estimateSize(record['obj'])
+            elif record['isReleased']:
+                self.logger.logWARNING("Source '{0}' is already released.".format(key))
+            self._enforceBudget(key)
+        if observables is not None:
+            return self._view(key, observables)
+        record['isReadInFull'] = True
+        return record['obj']
 
-    def update(self, key, obj=None, addHist=None, overwriteExist=True):
-        if obj is None:
+    def update(self, key, obj=None, addHist=None, overwriteExist=True, digest=None):
+        """Book an object, or a LazySource to be materialized at the first get."""
+        factory = None
+        if isinstance(obj, LazySource):
+            factory, obj = obj, None
+        elif obj is None:
             self.logger.logWARNING("Update a 'None' with key '{0}'".format(key))
+        if digest is None:
+            digest = contentDigest(obj) if factory is None else digestObj(factory.factory)
         if key in self._sources.keys() and overwriteExist:
-            self.logger.logDEBUG("Overwrite source '{0}'".format(key))
-            self._sources[key]['obj'] = obj
+            self.logger.logDEBUG("Overwrite source '{0}'", key)
+            self._sources[key].update({
+                'obj': obj,
+                'factory': factory,
+                'digest': digest,
+                'isReleased': False,
+                'size': estimateSize(obj),
+                'lastAccess': next(self._accessCounter),
+                'spillName': None,
+                'views': {},
+                'columnNames': None,
+                'isReadInFull': False,
+            })
         else:
             self._sources[key] = {
                 'obj': obj,
-                'history':[],
+                'factory': factory,
+                'history': deque(maxlen=self.historySize),
+                'digest': digest,
+                'nGet': 0,
+                'isReleased': False,
+                'size': estimateSize(obj),
+                'lastAccess': next(self._accessCounter),
+                'spillName': None,
+                'views': {},
+                'columnNames': None,
+                'isReadInFull': False,
             }
 
         if addHist is not None:
             self._sources[key]['history'].append(addHist)
+        self._enforceBudget(key)
+
+    def release(self, key):
+        """Drop the reference to a source. Lazy sources could be materialized again."""
+        record = self._sources[key]
+        if record['obj'] is not None:
+            self.logger.logDEBUG("Release source '{0}'", key)
+        record['obj'] = None
+        record['views'] = {}
+        record['spillName'] = None
+        record['isReleased'] = True
+
+    def _isBulk(self, record):
+        """Datasets and trees, materialized or not."""
+        if record['factory'] is not None or record['spillName'] is not None:
+            return True
+        obj = record['obj']
+        return hasattr(obj, 'InheritsFrom') and (obj.InheritsFrom("RooAbsData") or obj.InheritsFrom("TTree"))
+
+    def releaseUnused(self, remainingPaths, keepPatterns=None):
+        """Release sources which no path in remainingPaths may read, including those never read.
+        A path with unknown inputs() may read anything but the datasets and trees not matching its bulkInputs().
+        Sources matching keepPatterns are kept. Return the list of released keys."""
+        keepPatterns = list(keepPatterns) if keepPatterns else []
+        bulkPatterns = []
+        hasUnknown = False
+        for p in remainingPaths:
+            patterns = p.inputs()
+            if patterns is None:
+                hasUnknown = True
+                bulkPatterns += p.bulkInputs()
+            else:
+                keepPatterns += patterns
+        released = []
+        for key, record in self._sources.items():
+            if record['isReleased'] or any([fnmatchcase(key, pat) for pat in keepPatterns]):
+                continue
+            if hasUnknown and (not self._isBulk(record) or any([fnmatchcase(key, pat) for pat in bulkPatterns])):
+                continue
+            self.release(key)
+            released.append(key)
+        return released
+
+    def amendDigest(self, key, change):
+        """Re-tag a source modified in place, the change is folded into its digest."""
+        self._sources[key]['digest'] = digestObj([self._sources[key]['digest'], change])
+
+    def digest(self, key):
+        """Digest of the source, derived from the key of the path it comes from."""
+        return self._sources[key]['digest']
 
     def keys(self):
         return self._sources.keys()
@@ -91,6 +336,17 @@ class FileManager(Service):
             #     raise NotImplementedError
         pass
 
+    @staticmethod
+    @contextmanager
+    def lock(fname):
+        """Exclusive access to a file shared by processes running in parallel."""
+        with open("{0}.lock".format(fname), 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
     def open(self, key, fname, mode):
         if not key in self._files.keys():
             f = TFile.Open(fname, mode)
@@ -109,3 +365,60 @@ class FileManager(Service):
     def keys(self):
         return self._files.keys()
 
+
+if __name__ == '__main__':
+    # Compare the peak RSS traced in runSeq with and without a memory budget.
+    # Each consumer holds its dataset like a fitter, and drops it once the dataset is spilled.
+    import tempfile
+    from v2Fitter.FlowControl.Path import Path
+    from v2Fitter.FlowControl.Process import Process
+
+    nDatasets, nEntries, nVars = 4, 200000, 10
+    argset = ROOT.RooArgSet()
+    for idx in range(nVars):
+        var = ROOT.RooRealVar("x{0}".format(idx), "", -1, 1)
+        SetOwnership(var, False)
+        argset.add(var)
+
+    def createDataSet(name):
+        data = ROOT.RooDataSet(name, "", argset)
+        rnd = ROOT.TRandom3(1)
+        for entry in range(nEntries):
+            for var in argset:
+                var.setVal(rnd.Uniform(-1, 1))
+            data.add(argset)
+        return data
+
+    class Producer(Path):
+        def _runPath(self):
+            for idx in range(nDatasets):
+                name = "data{0}".format(idx)
+                self.cfg['source'][name] = LazySource(lambda name=name: createDataSet(name))
+
+    class Consumer(Path):
+        def _runPath(self):
+            self.data = self.process.sourcemanager.get(self.cfg['data'])
+
+        def _dropSource(self, key):
+            Path._dropSource(self, key)
+            if key == self.cfg['data']:
+                self.data = None
+
+    def tracePeakRSS(memoryBudget):
+        p = Process("testSourceManager", tempfile.mkdtemp(), {'memoryBudget': memoryBudget, 'releaseSources': False})
+        p.setSequence([Producer({'name': "producer"})] + [Consumer({'name': "consumer{0}".format(idx), 'data': "data{0}".format(idx)}) for idx in range(nDatasets)])
+        p.beginSeq()
+        p.runSeq()
+        peakRSS = p.tracer.summary()["Process:runSeq"][3] / 1024.
+        p.endSeq()
+        return peakRSS
+
+    # Peak RSS never goes down, run each case in a fresh process.
+    for memoryBudget in [None, 1.5 * nEntries * (nVars + 1) * 8 / 1048576.]:
+        rfd, wfd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(wfd, "{0:.1f}".format(tracePeakRSS(memoryBudget)).encode())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        print("memoryBudget={0}: dPeakRSS of runSeq = {1} MB".format(memoryBudget, os.read(rfd, 64).decode()))
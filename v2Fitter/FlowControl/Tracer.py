@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set sw=4 ts=4 fdm=indent fdl=2 ft=python et:
+
+# Description     : Performance tracing of Process and Paths
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+from collections import OrderedDict
+
+from v2Fitter.FlowControl.Service import Service
+
+import ROOT
+
+def _countROOTObjects():
+    """Number of live ROOT objects.
+    Counted by gObjectTable if `Root.ObjectStat: 1` is set in rootrc, otherwise the objects in memory of gROOT."""
+    table = getattr(ROOT, 'gObjectTable', None)
+    if table:
+        return table.Instances()
+    return ROOT.gROOT.GetList().GetSize() + ROOT.gROOT.GetListOfFiles().GetSize() + ROOT.gROOT.GetListOfCanvases().GetSize()
+
+def _snapshot():
+    """Return (wall time in s, cpu time in s, peak RSS in kB, number of live ROOT objects)"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return time.time(), usage.ru_utime + usage.ru_stime, usage.ru_maxrss, _countROOTObjects()
+
+class Tracer(Service):
+    """Record wall time, cpu time, peak RSS delta and live ROOT objects delta of each stage.
+
+The trace is written in Chrome trace event format, which could be loaded with chrome://tracing or speedscope.
+A summary table is added to the log.
+"""
+    def __init__(self, traceFile="trace.json"):
+        Service.__init__(self)
+        self.traceFile = traceFile
+        self.events = []
+
+    @contextmanager
+    def span(self, name, cat="Path"):
+        """Trace the enclosed block as a complete event."""
+        begin = _snapshot()
+        try:
+            yield
+        finally:
+            end = _snapshot()
+            self.events.append({
+                'name': name,
+                'cat': cat,
+                'ph': "X",
+                'pid': os.getpid(),
+                'tid': 0,
+                'ts': begin[0] * 1e6,
+                'dur': (end[0] - begin[0]) * 1e6,
+                'args': {
+                    'cpu_s': end[1] - begin[1],
+                    'peakRSS_delta_kB': end[2] - begin[2],
+                    'nROOTObjects_delta': end[3] - begin[3],
+                },
+            })
+
+    def summary(self):
+        """Aggregate the events by name in chronological order of first appearance."""
+        table = OrderedDict()
+        for ev in sorted(self.events, key=lambda ev: ev['ts']):
+            row = table.setdefault("{0}:{1}".format(ev['cat'], ev['name']), [0, 0., 0., 0, 0])
+            row[0] += 1
+            row[1] += ev['dur'] * 1e-6
+            row[2] += ev['args']['cpu_s']
+            row[3] += ev['args']['peakRSS_delta_kB']
+            row[4] += ev['args']['nROOTObjects_delta']
+        return table
+
+    def writeTrace(self):
+        """Write down the trace file and log the summary."""
+        if self.traceFile is None or not self.events:
+            return
+        with open(self.traceFile, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': "ms"}, f)
+
+        lines = ["{0:<48s} {1:>6s} {2:>10s} {3:>10s} {4:>12s} {5:>10s}".format("Stage", "Calls", "Wall[s]", "CPU[s]", "dPeakRSS[MB]", "dROOTObj")]
+        for key, row in self.summary().items():
+            lines.append("{0:<48s} {1:>6d} {2:>10.2f} {3:>10.2f} {4:>12.1f} {5:>10d}".format(key, row[0], row[1], row[2], row[3] / 1024., row[4]))
+        self.logger.logINFO("Performance summary, trace is written to {0}\n{1}".format(os.path.abspath(self.traceFile), "\n".join(lines)))